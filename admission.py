@@ -0,0 +1,168 @@
+import base64
+import binascii
+import os
+
+import multipart
+
+# Limits checked before (and while) a form body is decoded, so oversized or
+# unwanted uploads are turned away without paying for the whole decode
+MAX_BODY_BYTES = int(os.environ.get('ADMISSION_MAX_BODY_BYTES', 6 * 1024 * 1024))
+MAX_FILE_BYTES = int(os.environ.get('ADMISSION_MAX_FILE_BYTES', 6 * 1024 * 1024))
+MAX_PARTS = int(os.environ.get('ADMISSION_MAX_PARTS', 64))
+MAX_HEADER_BYTES = 16 * 1024
+
+
+def _csv(name):
+    return {value.strip().lower() for value in os.environ.get(name, '').split(',') if value.strip()}
+
+
+# Comma-separated; empty allows anything. Types may end in /* (e.g. image/*)
+ALLOWED_EXTENSIONS = {extension.lstrip('.') for extension in _csv('ADMISSION_ALLOWED_EXTENSIONS')}
+ALLOWED_TYPES = _csv('ADMISSION_ALLOWED_TYPES')
+
+# Base64 characters decoded per step (a multiple of 4)
+BLOCK_SIZE = 256 * 1024
+
+# Where read_form keeps the decoded body on the event, so a second caller (the
+# idempotency fingerprint, then the handler) doesn't decode it again
+DECODED_BODY = '_admission_body'
+
+
+class Rejected(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# Decoded size of the event body, from its length alone
+def body_size(event):
+    body = event.get('body') or ''
+    if event.get('isBase64Encoded', False):
+        return len(body) * 3 // 4
+    # A str body is at least one byte per character once encoded
+    return len(body)
+
+
+def check_size(event, limit=None):
+    limit = MAX_BODY_BYTES if limit is None else limit
+    headers = event.get('headers') or {}
+    declared = headers.get('content-length') or headers.get('Content-Length')
+    if declared and declared.isdigit() and int(declared) > limit:
+        raise Rejected(413, f'Request body is larger than {limit} bytes')
+    if body_size(event) > limit:
+        raise Rejected(413, f'Request body is larger than {limit} bytes')
+
+
+def check_file(filename, content_type=None):
+    if ALLOWED_EXTENSIONS:
+        extension = os.path.splitext(filename or '')[1].lower().lstrip('.')
+        if extension not in ALLOWED_EXTENSIONS:
+            raise Rejected(415, f'Files of type .{extension or "?"} are not accepted')
+    if ALLOWED_TYPES:
+        mime = (content_type or 'application/octet-stream').split(';', 1)[0].strip().lower()
+        if mime not in ALLOWED_TYPES and mime.split('/', 1)[0] + '/*' not in ALLOWED_TYPES:
+            raise Rejected(415, f'Files of type {mime} are not accepted')
+
+
+# Decode a multipart form body, checking every part header as soon as it has been
+# decoded. A bad request is refused after the first offending part, not after the
+# whole body; a good one costs the same single decode as before.
+def read_form(event, content_type):
+    data = event.get(DECODED_BODY)
+    if data is None:
+        data = event[DECODED_BODY] = _decode_form(event, content_type)
+    return data
+
+
+def _decode_form(event, content_type):
+    try:
+        boundary = multipart.get_boundary(content_type)
+    except multipart.MultipartError as e:
+        raise Rejected(415, str(e))
+    check_size(event)
+
+    scanner = _PartScanner(boundary)
+    body = event.get('body') or ''
+    if not event.get('isBase64Encoded', False):
+        data = body.encode('utf-8')
+        if len(data) > MAX_BODY_BYTES:
+            raise Rejected(413, f'Request body is larger than {MAX_BODY_BYTES} bytes')
+        scanner.scan(data)
+        return data
+
+    data = bytearray()
+    try:
+        for start in range(0, len(body), BLOCK_SIZE):
+            data += binascii.a2b_base64(body[start:start + BLOCK_SIZE])
+            scanner.scan(data)
+    except binascii.Error:
+        # Line breaks inside the base64 text shift the blocks: decode it in one go instead
+        data = base64.b64decode(body)
+        scanner = _PartScanner(boundary)
+        scanner.scan(data)
+    return data
+
+
+# Incremental walk over part boundaries in a growing buffer
+class _PartScanner:
+    def __init__(self, boundary):
+        self.delimiter = b'\r\n--' + boundary
+        self.state = 'start'
+        self.parts = 0
+        self.header_pos = 0
+        self.data_start = 0
+        self.search_from = 0
+        self.is_file = False
+
+    def scan(self, buffer):
+        while True:
+            if self.state == 'start':
+                # The first delimiter may appear without its leading CRLF
+                if len(buffer) < len(self.delimiter):
+                    return
+                if buffer.startswith(self.delimiter[2:]):
+                    self.header_pos = len(self.delimiter) - 2
+                    self.state = 'headers'
+                else:
+                    self.state = 'data'
+
+            elif self.state == 'data':
+                end = buffer.find(self.delimiter, self.search_from)
+                if end == -1:
+                    self._check_file_size(len(buffer) - len(self.delimiter) - self.data_start)
+                    self.search_from = max(self.data_start, len(buffer) - len(self.delimiter) + 1)
+                    return
+                self._check_file_size(end - self.data_start)
+                self.header_pos = end + len(self.delimiter)
+                self.state = 'headers'
+
+            elif self.state == 'headers':
+                if len(buffer) < self.header_pos + 2:
+                    return
+                if buffer.startswith(b'--', self.header_pos):
+                    self.state = 'done'
+                    return
+                header_end = buffer.find(b'\r\n\r\n', self.header_pos)
+                if header_end == -1:
+                    if len(buffer) - self.header_pos > MAX_HEADER_BYTES:
+                        raise Rejected(413, 'Part headers are too large')
+                    return
+                self._check_part(bytes(buffer[self.header_pos:header_end]))
+                self.data_start = self.search_from = header_end + 4
+                self.state = 'data'
+
+            else:
+                return
+
+    def _check_part(self, raw_headers):
+        self.parts += 1
+        if self.parts > MAX_PARTS:
+            raise Rejected(413, f'At most {MAX_PARTS} form fields per request')
+        part = multipart.Part(multipart.parse_headers(raw_headers), None)
+        self.is_file = part.filename is not None
+        if self.is_file:
+            check_file(part.filename, part.headers.get('content-type'))
+
+    def _check_file_size(self, size):
+        if self.is_file and size > MAX_FILE_BYTES:
+            raise Rejected(413, f'Files larger than {MAX_FILE_BYTES} bytes must use the direct or chunked upload')
@@ -0,0 +1,191 @@
+import collections
+import os
+import threading
+import time
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import content_types
+import s3_upload
+
+MB = 1024 * 1024
+
+# Ranged GET size, and how many of them may be in flight (or waiting to be
+# written) at once: memory stays around CHUNK_SIZE * PREFETCH whatever the archive size
+CHUNK_SIZE = int(os.environ.get('ARCHIVE_CHUNK_SIZE', 2 * MB))
+PREFETCH = max(1, int(os.environ.get('ARCHIVE_PREFETCH', 4)))
+MAX_FILES = int(os.environ.get('ARCHIVE_MAX_FILES', 500))
+# Archives up to this size go back in the response body (base64 must fit in
+# Lambda's 6 MB response); bigger ones are written to S3 with a multipart upload
+INLINE_LIMIT = int(os.environ.get('ARCHIVE_INLINE_LIMIT', 4 * MB))
+
+
+# zipfile needs a write()-only stream to write data descriptors instead of
+# seeking back. Bytes are kept in memory until INLINE_LIMIT; past it they go
+# to S3 part by part, with at most ``concurrency`` parts uploading.
+class ArchiveSink:
+    def __init__(self, client, bucket, key, inline_limit=None, part_size=None, concurrency=None):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.inline_limit = INLINE_LIMIT if inline_limit is None else inline_limit
+        self.part_size = max(s3_upload.MIN_PART_SIZE, part_size or s3_upload.PART_SIZE)
+        self.concurrency = concurrency or s3_upload.CONCURRENCY
+        self.size = 0
+        self.upload_id = None
+        self._buffer = bytearray()
+        self._parts = []
+        self._pool = None
+        self._slots = threading.BoundedSemaphore(self.concurrency)
+
+    @property
+    def spilled(self):
+        return self.upload_id is not None
+
+    def write(self, data):
+        self._buffer += data
+        self.size += len(data)
+        if not self.spilled and len(self._buffer) > self.inline_limit:
+            self.upload_id = self.client.create_multipart_upload(
+                Bucket=self.bucket, Key=self.key, ContentType='application/zip'
+            )['UploadId']
+            self._pool = ThreadPoolExecutor(max_workers=self.concurrency)
+        while self.spilled and len(self._buffer) >= self.part_size:
+            self._send(bytes(self._buffer[:self.part_size]))
+            del self._buffer[:self.part_size]
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def _send(self, chunk):
+        # Blocks while ``concurrency`` parts are already uploading
+        self._slots.acquire()
+        number = len(self._parts) + 1
+        future = self._pool.submit(s3_upload.upload_part, self.client, self.bucket, self.key, self.upload_id, number, chunk)
+        future.add_done_callback(lambda _: self._slots.release())
+        self._parts.append(future)
+
+    # Returns the archive bytes, or None once they are in S3 under ``key``
+    def finish(self):
+        if not self.spilled:
+            return bytes(self._buffer)
+        try:
+            if self._buffer:
+                self._send(bytes(self._buffer))
+                self._buffer = bytearray()
+            parts = [{'PartNumber': number, 'ETag': future.result()} for number, future in enumerate(self._parts, 1)]
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self.upload_id, MultipartUpload={'Parts': parts}
+            )
+        except Exception:
+            self.abort()
+            raise
+        self._pool.shutdown()
+        return None
+
+    def abort(self):
+        if self.spilled:
+            self._pool.shutdown(cancel_futures=True)
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+
+
+# Yields (entry index, bytes) for every range of every object, in order, with
+# up to PREFETCH ranged GETs running ahead of the consumer
+def fetch_ranges(client, bucket, objects, chunk_size=None, prefetch=None):
+    chunk_size = chunk_size or CHUNK_SIZE
+    prefetch = prefetch or PREFETCH
+    ranges = (
+        (index, obj['key'], start, min(start + chunk_size, obj['size']) - 1)
+        for index, obj in enumerate(objects)
+        for start in range(0, obj['size'], chunk_size)
+    )
+
+    def get(key, first, last):
+        return client.get_object(Bucket=bucket, Key=key, Range=f'bytes={first}-{last}')['Body'].read()
+
+    pending = collections.deque()
+    with ThreadPoolExecutor(max_workers=prefetch) as pool:
+        for index, key, first, last in ranges:
+            pending.append((index, pool.submit(get, key, first, last)))
+            if len(pending) >= prefetch:
+                index, future = pending.popleft()
+                yield index, future.result()
+        while pending:
+            index, future = pending.popleft()
+            yield index, future.result()
+
+
+def describe(client, bucket, keys, prefetch=None):
+    def head(key):
+        response = client.head_object(Bucket=bucket, Key=key)
+        return {
+            'key': key,
+            'size': response['ContentLength'],
+            'encoding': response.get('ContentEncoding'),
+            'content_type': response.get('ContentType') or content_types.DEFAULT_TYPE
+        }
+
+    with ThreadPoolExecutor(max_workers=prefetch or PREFETCH) as pool:
+        return list(pool.map(head, keys))
+
+
+# Entry names come from user filenames, so only the base name is kept: an entry
+# like "../../x" must not extract outside the folder it is unpacked into
+def entry_name(name):
+    name = os.path.basename((name or '').replace('\\', '/'))
+    return name if name not in ('', '.', '..') else 'upload.bin'
+
+
+# Numbered copies are checked against every name already taken (case-insensitively,
+# for Windows and macOS), including names given earlier as "a (2).txt"
+def unique_names(names):
+    taken = set()
+    copies = collections.Counter()
+    result = []
+    for name in names:
+        name = entry_name(name)
+        candidate = name
+        while candidate.lower() in taken:
+            copies[name.lower()] += 1
+            stem, ext = os.path.splitext(name)
+            candidate = f'{stem} ({copies[name.lower()] + 1}){ext}'
+        taken.add(candidate.lower())
+        result.append(candidate)
+    return result
+
+
+# Zip ``entries`` ((s3 key, name in the archive) pairs) straight from S3.
+# Returns (zip bytes, None) for small archives or (None, archive_key) once the
+# archive has been written to S3.
+def build(client, bucket, entries, archive_key, inline_limit=None, chunk_size=None, prefetch=None):
+    objects = describe(client, bucket, [key for key, _ in entries], prefetch)
+    names = unique_names([name for _, name in entries])
+    sink = ArchiveSink(client, bucket, archive_key, inline_limit)
+    stamp = time.localtime()[:6]
+
+    try:
+        with zipfile.ZipFile(sink, 'w', allowZip64=True) as archive:
+            chunks = fetch_ranges(client, bucket, objects, chunk_size, prefetch)
+            chunk = next(chunks, None)
+            for index, (obj, name) in enumerate(zip(objects, names)):
+                gzipped = obj['encoding'] == 'gzip'
+                info = zipfile.ZipInfo(name, date_time=stamp)
+                # Already-compressed media is stored as is; text is deflated
+                if content_types.is_compressible(obj['content_type']):
+                    info.compress_type = zipfile.ZIP_DEFLATED
+                # Stored-gzip objects grow on the way out, so their size is unknown up front
+                large = gzipped or obj['size'] >= 1 << 31
+                with archive.open(info, 'w', force_zip64=large) as entry:
+                    inflate = zlib.decompressobj(wbits=31) if gzipped else None
+                    while chunk is not None and chunk[0] == index:
+                        entry.write(inflate.decompress(chunk[1]) if inflate else chunk[1])
+                        chunk = next(chunks, None)
+                    if inflate:
+                        entry.write(inflate.flush())
+    except BaseException:
+        sink.abort()
+        raise
+    data = sink.finish()
+    return (data, None) if data is not None else (None, archive_key)
@@ -0,0 +1,209 @@
+import os
+import threading
+import time
+from decimal import Decimal
+
+# Connection pool, keep-alive, timeouts and retries for every client, e.g.
+#   BOTO_POOL_SIZE=64 BOTO_RETRY_MODE=adaptive BOTO_MAX_ATTEMPTS=5
+POOL_SIZE = int(os.environ.get('BOTO_POOL_SIZE', 50))
+TCP_KEEPALIVE = os.environ.get('BOTO_TCP_KEEPALIVE', 'true').lower() in ('1', 'true', 'yes')
+CONNECT_TIMEOUT = float(os.environ.get('BOTO_CONNECT_TIMEOUT', 2))
+READ_TIMEOUT = float(os.environ.get('BOTO_READ_TIMEOUT', 15))
+RETRY_MODE = os.environ.get('BOTO_RETRY_MODE', 'adaptive')
+MAX_ATTEMPTS = int(os.environ.get('BOTO_MAX_ATTEMPTS', 5))
+
+# aws | local. With local, s3() and dynamodb() return stand-ins backed by files
+# and SQLite under STORAGE_LOCAL_ROOT (local_storage.py), for offline dev runs
+# and benchmarks of the whole upload path
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'aws').lower()
+
+# boto3/botocore are only imported the first time a client is needed, so
+# requests that just return HTML never pay for loading them
+_clients = {}
+_lock = threading.Lock()
+
+
+def config_options(**overrides):
+    options = {
+        'max_pool_connections': POOL_SIZE,
+        'tcp_keepalive': TCP_KEEPALIVE,
+        'connect_timeout': CONNECT_TIMEOUT,
+        'read_timeout': READ_TIMEOUT,
+        'retries': {'mode': RETRY_MODE, 'total_max_attempts': MAX_ATTEMPTS},
+    }
+    options.update(overrides)
+    return options
+
+
+def make_config(**overrides):
+    from botocore.config import Config
+    return Config(**config_options(**overrides))
+
+
+def _client(service):
+    client = _clients.get(service)
+    if client is None:
+        with _lock:
+            client = _clients.get(service)
+            if client is None:
+                if STORAGE_BACKEND == 'local' and service in ('s3', 'dynamodb'):
+                    import local_storage
+                    client = local_storage.client(service)
+                else:
+                    import boto3
+                    client = boto3.client(service, config=make_config())
+                _clients[service] = client
+    return client
+
+
+def s3():
+    return _client('s3')
+
+
+def dynamodb():
+    return _client('dynamodb')
+
+
+def sqs():
+    return _client('sqs')
+
+
+# Error code of a botocore ClientError ('' for anything else), without importing botocore
+def error_code(error):
+    return str(getattr(error, 'response', {}).get('Error', {}).get('Code', ''))
+
+
+# A missing S3 object. Without s3:ListBucket, S3 answers 403 instead of 404 so
+# as not to reveal whether the key exists, and that means missing here too
+def is_missing(error):
+    return error_code(error) in ('404', 'NoSuchKey', 'NotFound', '403', 'AccessDenied')
+
+
+# Plain Python values <-> DynamoDB attribute values, for the low-level client
+def serialize(value):
+    if value is None:
+        return {'NULL': True}
+    if isinstance(value, bool):
+        return {'BOOL': value}
+    if isinstance(value, (int, float, Decimal)):
+        return {'N': str(value)}
+    if isinstance(value, str):
+        return {'S': value}
+    if isinstance(value, (bytes, bytearray)):
+        return {'B': bytes(value)}
+    if isinstance(value, dict):
+        return {'M': {k: serialize(v) for k, v in value.items()}}
+    if isinstance(value, (set, frozenset)):
+        if all(isinstance(v, str) for v in value):
+            return {'SS': sorted(value)}
+        return {'NS': sorted(str(v) for v in value)}
+    if isinstance(value, (list, tuple)):
+        return {'L': [serialize(v) for v in value]}
+    raise TypeError(f'Unsupported DynamoDB type: {type(value).__name__}')
+
+
+def _number(text):
+    number = Decimal(text)
+    return int(number) if number == number.to_integral_value() else number
+
+
+def deserialize(attribute):
+    (kind, value), = attribute.items()
+    if kind == 'S':
+        return value
+    if kind == 'N':
+        return _number(value)
+    if kind == 'M':
+        return {k: deserialize(v) for k, v in value.items()}
+    if kind == 'L':
+        return [deserialize(v) for v in value]
+    if kind == 'BOOL':
+        return value
+    if kind == 'NULL':
+        return None
+    if kind == 'SS':
+        return set(value)
+    if kind == 'NS':
+        return {_number(v) for v in value}
+    return value
+
+
+def to_item(item):
+    return {key: serialize(value) for key, value in item.items()}
+
+
+def from_item(item):
+    return {key: deserialize(value) for key, value in item.items()}
+
+
+# The slice of the boto3 Table resource the handlers use, on top of the much
+# lighter low-level client. Items go in and come out as plain dicts.
+class Table:
+    def __init__(self, name):
+        self.name = name
+
+    def put_item(self, Item, **kwargs):
+        _values(kwargs)
+        return dynamodb().put_item(TableName=self.name, Item=to_item(Item), **kwargs)
+
+    def get_item(self, Key, **kwargs):
+        response = dynamodb().get_item(TableName=self.name, Key=to_item(Key), **kwargs)
+        if 'Item' in response:
+            response['Item'] = from_item(response['Item'])
+        return response
+
+    def update_item(self, Key, **kwargs):
+        _values(kwargs)
+        response = dynamodb().update_item(TableName=self.name, Key=to_item(Key), **kwargs)
+        if 'Attributes' in response:
+            response['Attributes'] = from_item(response['Attributes'])
+        return response
+
+    def delete_item(self, Key, **kwargs):
+        _values(kwargs)
+        return dynamodb().delete_item(TableName=self.name, Key=to_item(Key), **kwargs)
+
+
+    def query(self, **kwargs):
+        _values(kwargs)
+        if 'ExclusiveStartKey' in kwargs:
+            kwargs['ExclusiveStartKey'] = to_item(kwargs['ExclusiveStartKey'])
+        response = dynamodb().query(TableName=self.name, **kwargs)
+        response['Items'] = [from_item(item) for item in response.get('Items', [])]
+        if 'LastEvaluatedKey' in response:
+            response['LastEvaluatedKey'] = from_item(response['LastEvaluatedKey'])
+        return response
+
+    # BatchGetItem in chunks of 100, retrying unprocessed keys. Missing items are left out.
+    def batch_get(self, keys, attempts=5, **kwargs):
+        items = []
+        for start in range(0, len(keys), 100):
+            request = {self.name: dict(kwargs, Keys=[to_item(key) for key in keys[start:start + 100]])}
+            for attempt in range(attempts):
+                response = dynamodb().batch_get_item(RequestItems=request)
+                items.extend(from_item(item) for item in response.get('Responses', {}).get(self.name, []))
+                request = response.get('UnprocessedKeys') or {}
+                if not request:
+                    break
+                time.sleep(min(1.0, 0.05 * 2 ** attempt))
+        return items
+
+    # BatchWriteItem in chunks of 25, resending whatever DynamoDB leaves unprocessed.
+    # Returns the items that still could not be written.
+    def batch_put(self, items, attempts=5):
+        failed = []
+        for start in range(0, len(items), 25):
+            requests = [{'PutRequest': {'Item': to_item(item)}} for item in items[start:start + 25]]
+            for attempt in range(attempts):
+                response = dynamodb().batch_write_item(RequestItems={self.name: requests})
+                requests = response.get('UnprocessedItems', {}).get(self.name, [])
+                if not requests:
+                    break
+                time.sleep(min(1.0, 0.05 * 2 ** attempt))
+            failed.extend(from_item(request['PutRequest']['Item']) for request in requests)
+        return failed
+
+
+def _values(kwargs):
+    if 'ExpressionAttributeValues' in kwargs:
+        kwargs['ExpressionAttributeValues'] = to_item(kwargs['ExpressionAttributeValues'])
@@ -0,0 +1,53 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import content_types
+import s3_upload
+
+MAX_FILES = int(os.environ.get('BATCH_MAX_FILES', 50))
+CONCURRENCY = max(1, int(os.environ.get('BATCH_CONCURRENCY', 8)))
+
+
+# Upload many files at once. ``uploads`` is a list of (s3 key, data, item) tuples;
+# objects go to S3 in parallel, then the items of the ones that made it are
+# written with BatchWriteItem. Returns one status dict per file, in order.
+def upload_batch(s3_client, table, bucket, uploads):
+    results = [{'id': item['id'], 'key': key, 'status': 'uploaded'} for key, _, item in uploads]
+    if not uploads:
+        return results
+
+    with ThreadPoolExecutor(max_workers=min(CONCURRENCY, len(uploads))) as pool:
+        futures = [pool.submit(_store, s3_client, bucket, key, data) for key, data, _ in uploads]
+
+    stored = {}
+    for result, future, (key, _, item) in zip(results, futures, uploads):
+        error = future.exception()
+        if error is not None:
+            result.update(status='failed', error=str(error))
+        else:
+            result['content_type'] = future.result()
+            stored[item['id']] = (result, item)
+
+    # Metadata only for objects that are really in the bucket
+    try:
+        unwritten = {item['id'] for item in table.batch_put([item for _, item in stored.values()])}
+        error = 'Metadata write was not processed'
+    except Exception as e:
+        unwritten = set(stored)
+        error = str(e)
+
+    orphaned = []
+    for file_id in unwritten:
+        result, _ = stored[file_id]
+        result.update(status='failed', error=error)
+        orphaned.append({'Key': result['key']})
+    if orphaned:
+        s3_client.delete_objects(Bucket=bucket, Delete={'Objects': orphaned, 'Quiet': True})
+
+    return results
+
+
+def _store(s3_client, bucket, key, data):
+    body, extra = content_types.prepare_body(data, content_types.sniff(data, key))
+    s3_upload.upload_buffer(s3_client, bucket, key, body, **extra)
+    return extra['ContentType']
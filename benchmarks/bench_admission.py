@@ -0,0 +1,70 @@
+# How quickly admission control turns requests away, against decoding them in full
+#   python benchmarks/bench_admission.py [--mb 4] [--repeat 20]
+import argparse
+import base64
+import os
+import time
+
+from common import REPO_ROOT  # noqa: F401  (puts the repo on sys.path)
+
+import admission
+
+BOUNDARY = 'AdmissionBench'
+CONTENT_TYPE = f'multipart/form-data; boundary={BOUNDARY}'
+
+
+def form(filename, size, mime='application/octet-stream'):
+    return (
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="description"\r\n\r\nbench\r\n'
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        f'Content-Type: {mime}\r\n\r\n'
+    ).encode() + os.urandom(size) + f'\r\n--{BOUNDARY}--\r\n'.encode()
+
+
+def event(body):
+    return {'headers': {'content-type': CONTENT_TYPE}, 'body': base64.b64encode(body).decode(), 'isBase64Encoded': True}
+
+
+def best_ms(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        try:
+            fn()
+        except admission.Rejected:
+            pass
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mb', type=float, default=4)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    size = int(args.mb * 1024 * 1024)
+
+    admission.ALLOWED_EXTENSIONS = {'jpg', 'png'}
+    admission.MAX_BODY_BYTES = 2 * size
+    accepted = event(form('photo.jpg', size, 'image/jpeg'))
+    cases = [
+        ('accepted (full decode + scan)', accepted),
+        ('full decode, no checks', None),
+        ('415: .exe in first part', event(form('setup.exe', size))),
+        ('413: file over the limit', accepted),
+        ('413: body over the limit', accepted),
+    ]
+
+    print(f'{args.mb:g} MB file, base64 body of {len(accepted["body"]) / 1024 / 1024:.1f} MB')
+    for label, case in cases:
+        admission.MAX_FILE_BYTES = size // 2 if label.startswith('413: file') else 2 * size
+        admission.MAX_BODY_BYTES = size // 2 if label.startswith('413: body') else 2 * size
+        if case is None:
+            elapsed = best_ms(lambda: base64.b64decode(accepted['body']), args.repeat)
+        else:
+            elapsed = best_ms(lambda: admission.read_form(case, CONTENT_TYPE), args.repeat)
+        print(f'{label:>32} {elapsed:9.3f} ms')
+
+
+if __name__ == '__main__':
+    main()
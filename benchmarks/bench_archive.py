@@ -0,0 +1,75 @@
+# Peak memory and time of streaming a ZIP from ranged GETs, against reading each
+# object whole and zipping it in memory.  Every GET waits --latency ms.
+#   python benchmarks/bench_archive.py [--files 8] [--mb 16] [--latency 20]
+import argparse
+import io
+import os
+import time
+import tracemalloc
+import zipfile
+
+import stubs
+
+import archive
+
+
+class RangedS3(stubs.StubS3):
+    def __init__(self, objects, latency):
+        super().__init__(latency)
+        self.objects.update(objects)
+
+    def head_object(self, Key=None, **kwargs):
+        return {'ContentLength': len(self.objects[Key]), 'ContentType': 'image/jpeg'}
+
+    def get_object(self, Key=None, Range=None, **kwargs):
+        time.sleep(self.latency)
+        data = self.objects[Key]
+        if Range:
+            first, last = map(int, Range[len('bytes='):].split('-'))
+            data = data[first:last + 1]
+        return {'Body': io.BytesIO(data)}
+
+
+def whole_objects(client, keys):
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, 'w') as zip_file:
+        for key in keys:
+            zip_file.writestr(key, client.get_object(Key=key)['Body'].read())
+    return out.getvalue()
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, default=8)
+    parser.add_argument('--mb', type=float, default=16)
+    parser.add_argument('--latency', type=float, default=20)
+    args = parser.parse_args()
+
+    blob = os.urandom(int(args.mb * 1024 * 1024))
+    keys = [f'uploads/{number:04d}.jpg' for number in range(args.files)]
+    client = RangedS3({key: blob for key in keys}, args.latency / 1000)
+    total = len(blob) * args.files / 1024 / 1024
+    print(f'{args.files} files x {args.mb:g} MB = {total:.0f} MB, {args.latency:g} ms per GET')
+
+    cases = [
+        ('whole objects, zip in memory', lambda: whole_objects(client, keys)),
+        ('ranged stream, 1 in flight', lambda: archive.build(client, 'bench', [(key, key) for key in keys], 'a.zip', prefetch=1)),
+        (f'ranged stream, {archive.PREFETCH} in flight', lambda: archive.build(client, 'bench', [(key, key) for key in keys], 'a.zip')),
+    ]
+    for label, fn in cases:
+        elapsed, peak = measure(fn)
+        print(f'{label:>32} {elapsed * 1000:9.1f} ms  peak {peak / 1024 / 1024:7.1f} MB')
+
+
+if __name__ == '__main__':
+    main()
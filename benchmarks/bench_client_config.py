@@ -0,0 +1,124 @@
+# p50/p99 of S3 calls under concurrency against a local stub endpoint:
+# botocore defaults vs the aws_clients configuration
+#   python benchmarks/bench_client_config.py [--threads 32] [--requests 2000] [--latency-ms 20] [--error-rate 0.02]
+import argparse
+import multiprocessing
+import os
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from common import REPO_ROOT  # noqa: F401  (puts the repo on sys.path)
+
+import aws_clients
+
+
+class StubS3Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    latency = 0.005
+    error_rate = 0.0
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        time.sleep(self.latency)
+        # Occasional throttling, so the retry mode matters
+        if random.random() < self.error_rate:
+            body = b'<Error><Code>SlowDown</Code><Message>Reduce your request rate.</Message></Error>'
+            self.send_response(503)
+        else:
+            body = b''
+            self.send_response(200)
+            self.send_header('ETag', '"stub"')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_PUT = do_HEAD = do_GET = _reply
+
+
+# The stub runs in its own process so it doesn't compete with the client for the GIL
+def serve(port_queue, latency, error_rate):
+    StubS3Handler.latency = latency
+    StubS3Handler.error_rate = error_rate
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubS3Handler)
+    server.daemon_threads = True
+    server.request_queue_size = 256
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run(client, threads, requests, payload):
+    latencies = []
+    lock = threading.Lock()
+
+    def call(i):
+        start = time.perf_counter()
+        try:
+            client.put_object(Bucket='bench', Key=f'k{i}', Body=payload)
+        except Exception:
+            pass
+        with lock:
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(call, range(requests)))
+    elapsed = time.perf_counter() - start
+    return requests / elapsed, statistics.median(latencies), percentile(latencies, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--latency-ms', type=float, default=20)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of 503 SlowDown replies')
+    args = parser.parse_args()
+
+    port_queue = multiprocessing.Queue()
+    server = multiprocessing.Process(
+        target=serve, args=(port_queue, args.latency_ms / 1000, args.error_rate), daemon=True
+    )
+    server.start()
+    endpoint = f'http://127.0.0.1:{port_queue.get()}'
+
+    import boto3
+    from botocore.config import Config
+    session = boto3.session.Session(aws_access_key_id='bench', aws_secret_access_key='bench', region_name='ap-south-1')
+    configs = [
+        ('botocore defaults', Config(s3={'addressing_style': 'path'})),
+        ('aws_clients config', aws_clients.make_config(s3={'addressing_style': 'path'})),
+        # The stub's 503s are random rather than load-driven, which is the worst case for
+        # adaptive mode's client-side rate limiter; standard mode is shown for comparison
+        ('... standard retries', aws_clients.make_config(
+            s3={'addressing_style': 'path'},
+            retries={'mode': 'standard', 'total_max_attempts': aws_clients.MAX_ATTEMPTS}
+        )),
+    ]
+
+    payload = os.urandom(4096)
+    print(f"{'config':>22} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for name, config in configs:
+        client = session.client('s3', endpoint_url=endpoint, config=config)
+        run(client, args.threads, min(200, args.requests), payload)
+        rate, p50, p99 = run(client, args.threads, args.requests, payload)
+        print(f'{name:>22} {rate:8.0f} {p50 * 1000:8.2f} {p99 * 1000:8.2f}')
+
+    server.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+# Cold-start benchmark: handler import time and first-invoke latency, each run in a fresh interpreter
+#   python benchmarks/bench_cold_start.py [--runs 15] [--save baseline.json] [--baseline baseline.json]
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from common import REPO_ROOT
+
+# Runs inside a fresh interpreter and prints one JSON line of timings (ms)
+CHILD = r'''
+import importlib.util, json, os, sys, time
+os.environ.setdefault('AWS_DEFAULT_REGION', 'ap-south-1')
+sys.path.insert(0, {root!r})
+filename, mode = {filename!r}, {mode!r}
+
+start = time.perf_counter()
+if mode == 'eager-boto3':
+    # What module import cost before clients were lazy
+    import boto3
+    boto3.client('s3')
+    boto3.resource('dynamodb')
+spec = importlib.util.spec_from_file_location('handler', os.path.join({root!r}, filename))
+handler = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(handler)
+imported = time.perf_counter()
+
+event = {{'requestContext': {{'http': {{'method': 'GET'}}}}, 'headers': {{'accept-encoding': 'gzip'}}}}
+handler.lambda_handler(event, None)
+invoked = time.perf_counter()
+
+print(json.dumps({{
+    'import_ms': (imported - start) * 1000,
+    'first_get_ms': (invoked - imported) * 1000,
+    'botocore_loaded': 'botocore' in sys.modules,
+}}))
+'''
+
+CASES = [
+    ('lambda.py', 'lazy'),
+    ('lambdafunction.py', 'lazy'),
+    ('lambda.py', 'eager-boto3'),
+]
+
+
+def run_case(filename, mode, runs):
+    code = CHILD.format(root=os.path.abspath(REPO_ROOT), filename=filename, mode=mode)
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+        samples.append(json.loads(output.stdout.strip().splitlines()[-1]))
+    return {
+        'import_ms': statistics.median(s['import_ms'] for s in samples),
+        'first_get_ms': statistics.median(s['first_get_ms'] for s in samples),
+        'botocore_loaded': samples[0]['botocore_loaded'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=15)
+    parser.add_argument('--save', help='write results to this JSON file')
+    parser.add_argument('--baseline', help='compare against a saved JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown (0.2 = 20%%)')
+    args = parser.parse_args()
+
+    results = {}
+    print(f"{'handler':>18} {'mode':>12} {'import ms':>10} {'1st GET ms':>11} {'botocore':>9}")
+    for filename, mode in CASES:
+        result = run_case(filename, mode, args.runs)
+        results[f'{filename}:{mode}'] = result
+        print(f"{filename:>18} {mode:>12} {result['import_ms']:10.1f} {result['first_get_ms']:11.2f} "
+              f"{'loaded' if result['botocore_loaded'] else 'no':>9}")
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressed = False
+        for name, result in results.items():
+            if name not in baseline:
+                continue
+            for metric in ('import_ms', 'first_get_ms'):
+                before, after = baseline[name][metric], result[metric]
+                change = (after - before) / before if before else 0.0
+                flag = 'REGRESSION' if change > args.tolerance else ''
+                regressed = regressed or bool(flag)
+                print(f'{name:>30} {metric:>13} {before:9.2f} -> {after:9.2f} ({change:+.0%}) {flag}')
+        sys.exit(1 if regressed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+# SHA-256 overhead vs S3 PUT savings for content-addressed uploads
+#   python benchmarks/bench_dedup.py [--put-latency-ms 30] [--mbps 80] [--claim-ms 8]
+import argparse
+import os
+import time
+
+from common import REPO_ROOT  # noqa: F401  (puts the repo on sys.path)
+
+import dedup
+
+MB = 1024 * 1024
+SIZES = [('4 KB', 4096), ('256 KB', 256 * 1024), ('1 MB', MB), ('6 MB', 6 * MB), ('64 MB', 64 * MB)]
+DUPLICATE_RATIOS = (0.0, 0.1, 0.3, 0.5)
+
+
+def hash_seconds(data):
+    rounds = max(3, min(2000, (256 * MB) // len(data)))
+    start = time.perf_counter()
+    for _ in range(rounds):
+        dedup.content_hash(data)
+    return (time.perf_counter() - start) / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--put-latency-ms', type=float, default=30, help='S3 PUT round trip')
+    parser.add_argument('--mbps', type=float, default=80, help='upload bandwidth, MB/s')
+    parser.add_argument('--claim-ms', type=float, default=8, help='conditional PutItem on the hash record')
+    args = parser.parse_args()
+
+    print(f"{'size':>7} {'hash ms':>8} {'hash MB/s':>10} {'PUT ms':>8}  "
+          + '  '.join(f'{f"dup {int(r * 100)}%":>9}' for r in DUPLICATE_RATIOS))
+    for label, size in SIZES:
+        data = os.urandom(size)
+        hashed = hash_seconds(data)
+        put = args.put_latency_ms / 1000 + size / (args.mbps * MB)
+
+        # Expected time per upload with dedup, relative to always doing the PUT
+        row = ''
+        for ratio in DUPLICATE_RATIOS:
+            with_dedup = hashed + args.claim_ms / 1000 + (1 - ratio) * put
+            row += f'  {(with_dedup - put) * 1000:+8.1f}ms'
+        print(f'{label:>7} {hashed * 1000:8.2f} {size / hashed / MB:10.0f} {put * 1000:8.1f}{row}')
+    print('(last columns: change in per-upload time vs a plain PUT; negative is faster)')
+
+
+if __name__ == '__main__':
+    main()
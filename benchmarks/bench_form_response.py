@@ -0,0 +1,59 @@
+# Per-request latency and bytes on the wire for the GET upload form:
+# rendering show_upload_form() every time vs the pre-compressed cached response
+#   python benchmarks/bench_form_response.py
+import gzip
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import precompressed
+from common import load_handler
+
+ROUNDS = 5000
+
+
+def per_request(fn):
+    fn()
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        response = fn()
+    return (time.perf_counter() - start) / ROUNDS * 1e6, response
+
+
+def main():
+    handler = load_handler('lambda.py')
+
+    # What every GET used to do: render the page and send it uncompressed
+    def render_each_time():
+        return {'statusCode': 200, 'headers': {'Content-Type': 'text/html'}, 'body': handler.show_upload_form()}
+
+    cached = handler.UPLOAD_FORM
+    cases = [
+        ('render per request', render_each_time),
+        ('cached identity', lambda: cached.respond({})),
+        ('cached gzip', lambda: cached.respond({'accept-encoding': 'gzip, deflate'})),
+    ]
+    if precompressed.brotli is not None:
+        cases.append(('cached br', lambda: cached.respond({'accept-encoding': 'gzip, deflate, br'})))
+    etag = cached.respond({'accept-encoding': 'gzip'})['headers']['ETag']
+    cases.append(('cached 304', lambda: cached.respond({'accept-encoding': 'gzip', 'if-none-match': etag})))
+
+    print(f"{'case':>20} {'us/request':>11} {'bytes on wire':>14}")
+    for name, fn in cases:
+        latency, response = per_request(fn)
+        body = response.get('body', '')
+        if response.get('isBase64Encoded'):
+            wire = len(body) * 3 // 4
+        else:
+            wire = len(body.encode('utf-8'))
+        print(f'{name:>20} {latency:11.2f} {wire:14d}')
+
+    # gzip done per request instead, for comparison
+    latency, _ = per_request(lambda: gzip.compress(handler.show_upload_form().encode(), 6))
+    print(f"{'gzip per request':>20} {latency:11.2f}")
+
+
+if __name__ == '__main__':
+    main()
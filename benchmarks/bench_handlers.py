@@ -0,0 +1,251 @@
+# Load test for both handlers with synthetic API Gateway v2 events and in-process S3/DynamoDB stubs,
+# or (--storage local) the files + SQLite backend of local_storage.py, which really stores everything.
+# Each (handler, scenario) runs in a fresh interpreter so peak RSS belongs to that case alone.
+#   python benchmarks/bench_handlers.py [--requests 500] [--scenarios get_form small_post ...]
+#                                       [--storage stub|local] [--s3-latency-ms 0] [--dynamodb-latency-ms 0]
+#                                       [--save results.json] [--baseline results.json] [--tolerance 0.2]
+import argparse
+import base64
+import json
+import os
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+from common import REPO_ROOT, load_handler
+
+HANDLERS = ['lambda.py', 'lambdafunction.py']
+KB = 1024
+MB = 1024 * KB
+BOUNDARY = '----BenchBoundary7MA4YWxkTrZu0gW'
+
+# name -> (method, list of file sizes, base64 body)
+SCENARIOS = {
+    'get_form': ('GET', [], False),
+    'small_post': ('POST', [4 * KB], True),
+    'small_post_raw': ('POST', [4 * KB], False),
+    'large_post': ('POST', [4 * MB], True),
+    'multi_file': ('POST', [64 * KB] * 8, True),
+}
+
+
+def multipart_body(sizes, rng):
+    chunks = []
+    for name, value in (('description', 'Offering from the benchmark'), ('name', 'bench'), ('caption', 'load test')):
+        chunks.append(f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for number, size in enumerate(sizes):
+        # Text-safe bytes, so the raw (non-base64) variant survives a str body
+        data = bytes(rng.choice(b'abcdefghijklmnopqrstuvwxyz0123456789 \n') for _ in range(min(size, 4096)))
+        data = (data * (size // len(data) + 1))[:size]
+        chunks.append(
+            f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="offering-{number}.txt"\r\n'
+            f'Content-Type: text/plain\r\n\r\n'.encode() + data + b'\r\n'
+        )
+    chunks.append(f'--{BOUNDARY}--\r\n'.encode())
+    return b''.join(chunks)
+
+
+# The shape API Gateway HTTP APIs and function URLs send (payload format 2.0)
+def make_event(scenario, rng):
+    method, sizes, encoded = SCENARIOS[scenario]
+    now = time.time()
+    headers = {
+        'accept': 'text/html,application/xhtml+xml',
+        'accept-encoding': 'gzip, deflate, br',
+        'host': 'abc123.lambda-url.ap-south-1.on.aws',
+        'user-agent': 'Mozilla/5.0 (bench)',
+        'x-forwarded-for': '203.0.113.7',
+        'x-forwarded-proto': 'https',
+    }
+    event = {
+        'version': '2.0',
+        'routeKey': '$default',
+        'rawPath': '/',
+        'rawQueryString': '',
+        'headers': headers,
+        'requestContext': {
+            'accountId': 'anonymous',
+            'apiId': 'abc123',
+            'domainName': headers['host'],
+            'domainPrefix': 'abc123',
+            'http': {
+                'method': method,
+                'path': '/',
+                'protocol': 'HTTP/1.1',
+                'sourceIp': '203.0.113.7',
+                'userAgent': headers['user-agent'],
+            },
+            'requestId': str(uuid.UUID(int=rng.getrandbits(128))),
+            'routeKey': '$default',
+            'stage': '$default',
+            'time': time.strftime('%d/%b/%Y:%H:%M:%S +0000', time.gmtime(now)),
+            'timeEpoch': int(now * 1000),
+        },
+        'isBase64Encoded': False,
+    }
+    if method == 'POST':
+        body = multipart_body(sizes, rng)
+        headers['content-type'] = f'multipart/form-data; boundary={BOUNDARY}'
+        headers['content-length'] = str(len(body))
+        if encoded:
+            event['body'] = base64.b64encode(body).decode('ascii')
+            event['isBase64Encoded'] = True
+        else:
+            event['body'] = body.decode('utf-8')
+    return event
+
+
+class Context:
+    function_name = 'bench'
+    memory_limit_in_mb = 1024
+
+    def __init__(self):
+        self.aws_request_id = str(uuid.uuid4())
+
+    def get_remaining_time_in_millis(self):
+        return 30000
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (MB if sys.platform == 'darwin' else KB)
+
+
+def run_child(filename, scenario, requests, s3_latency, dynamodb_latency, storage='stub'):
+    import aws_clients
+    import local_storage
+    import metrics
+    import rate_limit
+    import stubs
+
+    # Every event comes from one source IP; the limiter has its own benchmark (bench_rate_limit.py)
+    metrics.ENABLED = False
+    rate_limit.ENABLED = False
+    root = None
+    if storage == 'local':
+        root = tempfile.mkdtemp(prefix='bench-storage-')
+        aws_clients.STORAGE_BACKEND = 'local'
+        local_storage.ROOT = root
+        s3 = dynamodb = None
+    else:
+        s3, dynamodb = stubs.install(s3_latency, dynamodb_latency)
+    handler = load_handler(filename)
+    event = make_event(scenario, random.Random(42))
+    baseline_rss = peak_rss_mb()
+
+    statuses = {}
+    latencies = []
+    for number in range(requests + max(3, requests // 10)):
+        start = time.perf_counter()
+        response = handler.lambda_handler(event, Context())
+        elapsed = time.perf_counter() - start
+        if number >= max(3, requests // 10):
+            latencies.append(elapsed)
+            statuses[response['statusCode']] = statuses.get(response['statusCode'], 0) + 1
+
+    if root:
+        shutil.rmtree(root, ignore_errors=True)
+
+    latencies.sort()
+    total = sum(latencies)
+    return {
+        'requests': len(latencies),
+        'throughput_rps': len(latencies) / total,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'mean_ms': statistics.fmean(latencies) * 1000,
+        'peak_rss_mb': peak_rss_mb(),
+        'rss_growth_mb': peak_rss_mb() - baseline_rss,
+        'statuses': {str(code): count for code, count in sorted(statuses.items())},
+        's3_requests': s3.requests if s3 else None,
+        'dynamodb_requests': dynamodb.requests if dynamodb else None,
+    }
+
+
+def percentile(ordered, pct):
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def run_case(filename, scenario, args):
+    command = [
+        sys.executable, os.path.abspath(__file__), '--child', filename, scenario,
+        '--requests', str(args.requests),
+        '--s3-latency-ms', str(args.s3_latency_ms),
+        '--dynamodb-latency-ms', str(args.dynamodb_latency_ms),
+        '--storage', args.storage,
+    ]
+    output = subprocess.run(command, capture_output=True, text=True, check=True, cwd=REPO_ROOT)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def compare(results, baseline, tolerance):
+    regressed = False
+    print()
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for metric, higher_is_better in (('throughput_rps', True), ('p95_ms', False), ('peak_rss_mb', False)):
+            before, after = baseline[name][metric], result[metric]
+            change = (after - before) / before if before else 0.0
+            worse = -change if higher_is_better else change
+            flag = 'REGRESSION' if worse > tolerance else ''
+            regressed = regressed or bool(flag)
+            print(f'{name:>34} {metric:>15} {before:10.2f} -> {after:10.2f} ({change:+.0%}) {flag}')
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--handlers', nargs='+', default=HANDLERS)
+    parser.add_argument('--scenarios', nargs='+', default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument('--storage', choices=['stub', 'local'], default='stub',
+                        help='in-memory stubs, or files + SQLite (local_storage.py)')
+    parser.add_argument('--s3-latency-ms', type=float, default=0, help='added to every stub S3 call')
+    parser.add_argument('--dynamodb-latency-ms', type=float, default=0, help='added to every stub DynamoDB call')
+    parser.add_argument('--save', help='write results to this JSON file')
+    parser.add_argument('--baseline', help='compare against a saved JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown (0.2 = 20%%)')
+    parser.add_argument('--child', nargs=2, metavar=('HANDLER', 'SCENARIO'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        result = run_child(
+            *args.child, args.requests, args.s3_latency_ms / 1000, args.dynamodb_latency_ms / 1000, args.storage
+        )
+        print(json.dumps(result))
+        return
+
+    results = {}
+    print(f"{'handler':>18} {'scenario':>15} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'peak MB':>8} {'+MB':>6}  statuses")
+    for filename in args.handlers:
+        for scenario in args.scenarios:
+            result = run_case(filename, scenario, args)
+            results[f'{filename}:{scenario}'] = result
+            statuses = ' '.join(f'{code}x{count}' for code, count in result['statuses'].items())
+            print(f"{filename:>18} {scenario:>15} {result['throughput_rps']:9.1f} {result['p50_ms']:8.3f} "
+                  f"{result['p95_ms']:8.3f} {result['p99_ms']:8.3f} {result['peak_rss_mb']:8.1f} "
+                  f"{result['rss_growth_mb']:6.1f}  {statuses}")
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        sys.exit(1 if compare(results, baseline, args.tolerance) else 0)
+
+
+if __name__ == '__main__':
+    main()
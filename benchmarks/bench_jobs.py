@@ -0,0 +1,76 @@
+# What queuing follow-up work saves the upload response: image variants inline vs an enqueue,
+# and how fast a local worker drains the queue.  Needs Pillow.
+#   python benchmarks/bench_jobs.py [--megapixels 12] [--jobs 8] [--concurrency 1 4]
+import argparse
+import io
+import os
+import tempfile
+import time
+
+import stubs
+
+import aws_clients
+import image_pipeline
+import jobs
+
+BUCKET = 'bench-bucket'
+
+
+def make_image(megapixels):
+    from PIL import Image
+
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    image = Image.effect_noise((width, width * 3 // 4), 60).convert('RGB')
+    out = io.BytesIO()
+    image.save(out, 'JPEG', quality=90)
+    return out.getvalue()
+
+
+class ObjectStore(stubs.StubS3):
+    def __init__(self, objects):
+        super().__init__()
+        self.objects = objects
+
+    def get_object(self, Key=None, **kwargs):
+        return {'Body': io.BytesIO(self.objects[Key])}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--megapixels', type=float, default=12)
+    parser.add_argument('--jobs', type=int, default=8)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4])
+    args = parser.parse_args()
+
+    photo = make_image(args.megapixels)
+    keys = [f'uploads/{number:08d}-photo.jpg' for number in range(args.jobs)]
+    aws_clients._clients['s3'] = ObjectStore({key: photo for key in keys})
+    aws_clients._clients['dynamodb'] = stubs.StubDynamoDB()
+    print(f'{args.megapixels:g} MP JPEG, {len(photo) / 1024 / 1024:.1f} MB, {len(image_pipeline.VARIANTS)} variants')
+
+    start = time.perf_counter()
+    image_pipeline.run_job('inline', {'bucket': BUCKET, 'key': keys[0]})
+    print(f"{'variants inline in the request':>36} {(time.perf_counter() - start) * 1000:9.1f} ms")
+
+    with tempfile.TemporaryDirectory() as scratch:
+        queues = [
+            ('memory', jobs.MemoryQueue(), jobs.MemoryStore()),
+            ('sqlite', jobs.SqliteQueue(os.path.join(scratch, 'q.db')), jobs.SqliteStore(os.path.join(scratch, 'q.db'))),
+        ]
+        for name, queue, store in queues:
+            start = time.perf_counter()
+            jobs.enqueue([('image.variants', keys[0], {'bucket': BUCKET, 'key': keys[0]})], queue=queue)
+            print(f"{f'enqueue ({name})':>36} {(time.perf_counter() - start) * 1000:9.3f} ms")
+
+        for concurrency in args.concurrency:
+            queue, store = jobs.MemoryQueue(), jobs.MemoryStore()
+            jobs.enqueue([('image.variants', key, {'bucket': BUCKET, 'key': key}) for key in keys], queue=queue)
+            start = time.perf_counter()
+            counts = jobs.drain(queue, store, concurrency=concurrency)
+            elapsed = time.perf_counter() - start
+            print(f"{f'drain {args.jobs} jobs, concurrency {concurrency}':>36} {elapsed:9.2f} s "
+                  f"({args.jobs / elapsed:.2f} jobs/s, {dict(counts)})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+# Cost of the per-request EMF line: a request with the upload path's phases, metrics on vs off
+#   python benchmarks/bench_metrics.py [--requests 20000] [--request-ms 60]
+import argparse
+import io
+import sys
+import time
+
+from common import REPO_ROOT  # noqa: F401  (puts the repo on sys.path)
+
+import metrics
+
+# What an upload through lambda.py records
+PHASES = ['decode', 'multipart', 'hash', 'dynamodb_claim', 'prepare', 's3_put', 'dynamodb_write', 'presign', 'render']
+EVENT = {'rawPath': '/', 'requestContext': {'http': {'method': 'POST'}}}
+
+
+class Context:
+    function_name = 'bench'
+    aws_request_id = '6f1c2a4e-0000-4000-8000-000000000000'
+
+
+def one_request():
+    with metrics.request(EVENT, Context()):
+        for name in PHASES:
+            with metrics.phase(name):
+                pass
+        metrics.add_bytes('body', 1400000)
+        metrics.add_bytes('file', 1048576)
+        metrics.status({'statusCode': 200})
+
+
+def per_request_us(requests):
+    start = time.perf_counter()
+    for _ in range(requests):
+        one_request()
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--request-ms', type=float, default=60, help='typical upload request, for the ratio')
+    args = parser.parse_args()
+
+    stdout = sys.stdout
+    results = {}
+    for enabled in (False, True):
+        metrics.ENABLED = enabled
+        sys.stdout = io.StringIO()
+        try:
+            per_request_us(1000)
+            results[enabled] = min(per_request_us(args.requests) for _ in range(3))
+        finally:
+            sys.stdout = stdout
+
+    added = results[True] - results[False]
+    print(f'metrics off: {results[False]:7.2f} us/request')
+    print(f'metrics on:  {results[True]:7.2f} us/request ({len(PHASES)} phases, one EMF line)')
+    print(f'added:       {added:7.2f} us = {added / (args.request_ms * 1000):.3%} of a {args.request_ms:g} ms request')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+# Memory/throughput benchmark: legacy split() parsing vs multipart.iter_parts
+#   python benchmarks/bench_multipart.py
+import base64
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import multipart
+
+BOUNDARY = '----TempleBoundary7MA4YWxkTrZu0gW'
+CONTENT_TYPE = f'multipart/form-data; boundary={BOUNDARY}'
+SIZES = [('1 KB', 1024), ('1 MB', 1024 * 1024), ('6 MB', 6 * 1024 * 1024)]
+
+
+def build_body(size):
+    payload = os.urandom(size)
+    return (
+        f'--{BOUNDARY}\r\n'
+        'Content-Disposition: form-data; name="description"\r\n\r\n'
+        'Morning offering\r\n'
+        f'--{BOUNDARY}\r\n'
+        'Content-Disposition: form-data; name="file"; filename="offering.bin"\r\n'
+        'Content-Type: application/octet-stream\r\n\r\n'
+    ).encode() + payload + f'\r\n--{BOUNDARY}--\r\n'.encode()
+
+
+# The parsing loop lambda.py used before the streaming parser
+def parse_legacy(encoded):
+    body = base64.b64decode(encoded)
+    boundary = CONTENT_TYPE.split('boundary=')[1].encode('utf-8')
+    file_data = None
+    for part in body.split(b'--' + boundary):
+        if b'Content-Disposition: form-data;' in part:
+            header_end = part.find(b'\r\n\r\n')
+            if header_end == -1:
+                continue
+            headers = part[:header_end].decode('utf-8')
+            content = part[header_end + 4:].rstrip(b'\r\n')
+            if 'name="file"' in headers:
+                file_data = content
+    return len(file_data)
+
+
+def parse_streaming(encoded):
+    body = base64.b64decode(encoded)
+    file_data = None
+    for part in multipart.iter_parts(body, CONTENT_TYPE):
+        if part.name == 'file':
+            file_data = part.data
+    return file_data.nbytes
+
+
+def measure(fn, encoded, size, rounds):
+    tracemalloc.start()
+    fn(encoded)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn(encoded)
+    elapsed = (time.perf_counter() - start) / rounds
+    return peak, elapsed, size / elapsed / (1024 * 1024)
+
+
+def main():
+    print(f"{'payload':>8} {'parser':>10} {'peak MB':>9} {'peak/size':>10} {'ms/op':>9} {'MB/s':>9}")
+    for label, size in SIZES:
+        encoded = base64.b64encode(build_body(size))
+        rounds = max(3, min(2000, (64 * 1024 * 1024) // size))
+        for name, fn in (('legacy', parse_legacy), ('streaming', parse_streaming)):
+            peak, elapsed, rate = measure(fn, encoded, size, rounds)
+            print(f'{label:>8} {name:>10} {peak / 1048576:9.2f} {peak / size:10.2f} '
+                  f'{elapsed * 1000:9.3f} {rate:9.1f}')
+
+
+if __name__ == '__main__':
+    main()
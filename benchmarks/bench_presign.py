@@ -0,0 +1,81 @@
+# Signing calls and time saved by the presigned URL cache on a repeated-view workload
+#   python benchmarks/bench_presign.py [--items 2000] [--views 5000] [--views-per-second 1]
+import argparse
+import os
+import random
+import time
+
+from common import REPO_ROOT  # noqa: F401  (puts the repo on sys.path)
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'ap-south-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'AKIDEXAMPLE')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'secret')
+
+import aws_clients
+import url_cache
+
+BUCKET = 'bench-bucket'
+EXPIRES_IN = 3600
+PAGE_SIZE = 20
+
+
+# Gallery views: page n is viewed with weight 1/n (most people look at the newest uploads),
+# spread over simulated time so cached links age and get re-signed
+def workload(items, views, seed=7):
+    rng = random.Random(seed)
+    pages = max(1, items // PAGE_SIZE)
+    weights = [1 / (n + 1) for n in range(pages)]
+    for page in rng.choices(range(pages), weights, k=views):
+        yield [(f'uploads/sha256/{i:064x}', f'photo-{i}.jpg') for i in range(page * PAGE_SIZE, (page + 1) * PAGE_SIZE)]
+
+
+def run(client, pages, views_per_second, cache=None):
+    now = [0.0]
+    if cache is not None:
+        cache.clock = lambda: now[0]
+    signed = 0
+    start = time.perf_counter()
+    for page in pages:
+        for key, filename in page:
+            params = {'Bucket': BUCKET, 'Key': key, 'ResponseContentDisposition': f'attachment; filename="{filename}"'}
+
+            def sign():
+                return client.generate_presigned_url('get_object', Params=params, ExpiresIn=EXPIRES_IN)
+
+            if cache is None:
+                sign()
+                signed += 1
+            else:
+                cache.get((key, filename), EXPIRES_IN, sign)
+        now[0] += 1 / views_per_second
+    elapsed = time.perf_counter() - start
+    return elapsed, signed if cache is None else cache.misses
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=2000)
+    parser.add_argument('--views', type=int, default=5000, help='gallery page views')
+    parser.add_argument('--views-per-second', type=float, default=1)
+    parser.add_argument('--cache-size', type=int, default=url_cache.MAX_SIZE)
+    args = parser.parse_args()
+
+    client = aws_clients.s3()
+    pages = list(workload(args.items, args.views))
+    links = args.views * PAGE_SIZE
+    span = args.views / args.views_per_second
+
+    print(f'{args.views} views of {PAGE_SIZE} links over {args.items} uploads, {span / 3600:.1f} h simulated')
+    print(f"{'':>22} {'sign calls':>11} {'total s':>9} {'us/link':>9}")
+    plain, plain_calls = run(client, pages, args.views_per_second)
+    print(f"{'no cache':>22} {plain_calls:11d} {plain:9.2f} {plain / links * 1e6:9.1f}")
+    for min_remaining in (300, 600, 1800):
+        cache = url_cache.PresignedUrlCache(max_size=args.cache_size, min_remaining=min_remaining)
+        cached, calls = run(client, pages, args.views_per_second, cache)
+        label = f'cache, reuse >={min_remaining}s'
+        print(f'{label:>22} {calls:11d} {cached:9.2f} {cached / links * 1e6:9.1f}'
+              f'   {1 - calls / plain_calls:6.1%} calls saved, {plain / cached:4.1f}x faster')
+
+
+if __name__ == '__main__':
+    main()
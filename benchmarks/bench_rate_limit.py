@@ -0,0 +1,111 @@
+# What the rate limiter adds to a request: RateLimiter.check() on its own, the
+# UpdateItem calls it makes per request, and lambda.py's small upload with the
+# limiter off, on and over the limit (a 429 before the decode).
+#   python benchmarks/bench_rate_limit.py [--checks 100000] [--clients 1 1000] [--requests 2000]
+#                                         [--dynamodb-latency-ms 5]
+import argparse
+import base64
+import random
+import threading
+import time
+
+import stubs
+from bench_handlers import Context, make_event, percentile
+from common import load_handler
+
+import rate_limit
+
+
+# Counter table for the limiter: UpdateItem ADD with a simulated round trip
+class CounterTable:
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+        self.counts = {}
+        self._lock = threading.Lock()
+
+    def update_item(self, Key=None, ExpressionAttributeValues=None, **kwargs):
+        time.sleep(self.latency)
+        with self._lock:
+            self.calls += 1
+            total = self.counts[Key['id']] = self.counts.get(Key['id'], 0) + ExpressionAttributeValues[':count']
+        return {'Attributes': {'count': total}}
+
+
+def timed(fn, count):
+    latencies = []
+    for number in range(count):
+        start = time.perf_counter()
+        fn(number)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return latencies
+
+
+def report(label, latencies, extra=''):
+    print(f'{label:>34} {percentile(latencies, 50) * 1e6:9.2f} {percentile(latencies, 99) * 1e6:9.2f} '
+          f'{max(latencies) * 1e6:9.1f}  {extra}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--checks', type=int, default=100000)
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 1000])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--dynamodb-latency-ms', type=float, default=5)
+    args = parser.parse_args()
+    latency = args.dynamodb_latency_ms / 1000
+
+    print(f'UpdateItem round trip {args.dynamodb_latency_ms:g} ms, sync every {rate_limit.SYNC_EVERY} requests '
+          f'or {rate_limit.SYNC_INTERVAL:g} s')
+    print(f"{'':>34} {'p50 us':>9} {'p99 us':>9} {'max us':>9}")
+    for clients in args.clients:
+        table = CounterTable(latency)
+        # Generous limits: every check is allowed, so each one also counts towards a sync
+        limiter = rate_limit.RateLimiter(table, rate=1e9, burst=1e9, window_limit=10 ** 12)
+        keys = [f'ip#198.51.100.{number}' for number in range(clients)]
+        latencies = timed(lambda number: limiter.check(keys[number % clients]), args.checks)
+        limiter.flush()
+        report(f'check(), {clients} clients', latencies,
+               f'{table.calls} UpdateItem for {args.checks} checks, {limiter.sync_errors} failed')
+
+    stubs.install()
+    handler = load_handler('lambda.py')
+    handler.rate_limiter = rate_limit.RateLimiter(CounterTable(latency))
+    rng = random.Random(42)
+    event = make_event('small_post', rng)
+
+    def post(ip):
+        event['requestContext']['http']['sourceIp'] = ip
+        return handler.lambda_handler(event, Context())
+
+    # Warm up code paths and caches before timing anything
+    for number in range(50):
+        post(f'192.0.2.{number}')
+
+    # Off and on alternate request by request, so drift in the machine hits both alike
+    clients = [f'203.0.113.{number}' for number in range(2, 250)]
+    off, on = [], []
+    for number in range(args.requests):
+        for enabled, latencies in ((False, off), (True, on)):
+            rate_limit.ENABLED = enabled
+            start = time.perf_counter()
+            post(clients[number % len(clients)])
+            latencies.append(time.perf_counter() - start)
+    off.sort()
+    on.sort()
+    rate_limit.ENABLED = True
+    # Spend one client's whole bucket
+    while not handler.rate_limiter.check('ip#198.18.0.1'):
+        pass
+    limited = timed(lambda number: post('198.18.0.1'), args.requests)
+    assert post('198.18.0.1')['statusCode'] == 429
+
+    print(f'\nlambda.py small_post ({len(base64.b64decode(event["body"])) / 1024:.1f} KB form), {args.requests} requests')
+    report('limiter off', off)
+    report('limiter on', on, f'{(percentile(on, 50) - percentile(off, 50)) * 1e6:+.2f} us at p50')
+    report('over the limit (429)', limited)
+
+
+if __name__ == '__main__':
+    main()
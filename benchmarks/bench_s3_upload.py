@@ -0,0 +1,80 @@
+# Single PUT vs parallel multipart upload against a local S3 stub
+#   python benchmarks/bench_s3_upload.py [--latency-ms 20] [--mbps 80]
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import s3_upload
+
+MB = 1024 * 1024
+
+
+# Simulates one S3 connection per request: fixed round-trip plus per-connection bandwidth
+class StubS3:
+    def __init__(self, latency, bandwidth):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def _transfer(self, body):
+        size = len(body.read()) if body is not None else 0
+        with self._lock:
+            self.requests += 1
+        time.sleep(self.latency + size / self.bandwidth)
+
+    def put_object(self, Body=None, **kwargs):
+        self._transfer(Body)
+        return {'ETag': '"single"'}
+
+    def create_multipart_upload(self, **kwargs):
+        self._transfer(None)
+        return {'UploadId': 'stub-upload'}
+
+    def upload_part(self, Body=None, PartNumber=None, **kwargs):
+        self._transfer(Body)
+        return {'ETag': f'"part-{PartNumber}"'}
+
+    def complete_multipart_upload(self, **kwargs):
+        self._transfer(None)
+        return {}
+
+    def abort_multipart_upload(self, **kwargs):
+        return {}
+
+
+def run(client, data, threshold, part_size, concurrency):
+    start = time.perf_counter()
+    s3_upload.upload_buffer(client, 'bench', 'key', data, threshold=threshold,
+                            part_size=part_size, concurrency=concurrency)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--latency-ms', type=float, default=20)
+    parser.add_argument('--mbps', type=float, default=80, help='per-connection MB/s')
+    parser.add_argument('--part-mb', type=int, default=8)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[2, 4, 8])
+    args = parser.parse_args()
+
+    client = StubS3(args.latency_ms / 1000, args.mbps * MB)
+    part_size = args.part_mb * MB
+
+    header = f"{'size':>8} {'single PUT':>11}" + ''.join(f" {f'mp x{c}':>9}" for c in args.concurrency)
+    print(header)
+    for size_mb in (8, 32, 64, 128, 256):
+        data = bytearray(size_mb * MB)
+        single = run(client, data, float('inf'), part_size, 1)
+        row = f'{size_mb:>6}MB {single:10.3f}s'
+        for concurrency in args.concurrency:
+            row += f' {run(client, data, 0, part_size, concurrency):8.3f}s'
+        print(row)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+# Build, load and query times of the search index for a synthetic gallery, and
+# the cost of adding one upload to the tail.  Words follow a Zipf distribution.
+#   python benchmarks/bench_search.py [--docs 100000 1000000] [--vocabulary 50000] [--queries 200]
+import argparse
+import itertools
+import random
+import statistics
+import time
+
+from common import REPO_ROOT  # noqa: F401  (puts the repo on sys.path)
+
+import search
+
+SEED = 7
+
+
+def make_words(count, rng):
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    words = set()
+    while len(words) < count:
+        words.add(''.join(rng.choice(letters) for _ in range(rng.randint(3, 10))))
+    return sorted(words)
+
+
+def make_docs(count, words, rng):
+    cumulative = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(words))))
+    for number in range(count):
+        text = rng.choices(words, cum_weights=cumulative, k=rng.randint(6, 14))
+        yield f'{number:08d}-{number * 2654435761 % 2 ** 32:08x}', {
+            'description': ' '.join(text),
+            'filename': f'{text[0]}_{number}.jpg'
+        }
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.95)], samples[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--docs', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--vocabulary', type=int, default=50000)
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(SEED)
+    words = make_words(args.vocabulary, rng)
+    common, rare = words[:200], words[-20000:]
+    query_sets = {
+        '1-letter prefix': lambda: rng.choice('abcdefghijklmnopqrstuvwxyz'),
+        '3-letter prefix': lambda: rng.choice(common)[:3],
+        'common word': lambda: rng.choice(common),
+        'rare word': lambda: rng.choice(rare),
+        'two words, prefix': lambda: f'{rng.choice(common)} {rng.choice(words[:5000])[:4]}',
+    }
+
+    for count in args.docs:
+        builder = search.Builder()
+        start = time.perf_counter()
+        for doc_id, fields in make_docs(count, words, rng):
+            builder.add(doc_id, fields)
+        tokenized = time.perf_counter() - start
+        start = time.perf_counter()
+        segment = builder.build(1)
+        built = time.perf_counter() - start
+        del builder
+        start = time.perf_counter()
+        data = segment.to_bytes()
+        encoded = time.perf_counter() - start
+        start = time.perf_counter()
+        segment = search.Segment.from_bytes(data)
+        loaded = time.perf_counter() - start
+        print(f'{count:,} docs, {len(segment.vocab):,} words, {len(segment.post_docs):,} postings')
+        print(f'  generate + add {tokenized:6.1f} s   build {built:6.1f} s   encode {encoded:5.1f} s   '
+              f'load {loaded:5.2f} s   segment {len(data) / 1024 / 1024:6.1f} MB')
+
+        for label, make_query in query_sets.items():
+            samples = []
+            for _ in range(args.queries):
+                text = make_query()
+                start = time.perf_counter()
+                search.rank([segment], text, 20)
+                samples.append((time.perf_counter() - start) * 1000)
+            p50, p95, worst = percentiles(samples)
+            print(f'  {label:>20}  p50 {p50:7.2f} ms  p95 {p95:7.2f} ms  max {worst:7.2f} ms')
+
+    # Adding one upload rewrites the tail; its size is capped by SEARCH_TAIL_MAX_DOCS
+    tail = search.Builder()
+    for doc_id, fields in make_docs(search.TAIL_MAX_DOCS, words, rng):
+        tail.add(doc_id, fields)
+    tail = tail.build(1)
+    samples = []
+    for doc_id, fields in make_docs(50, words, rng):
+        start = time.perf_counter()
+        builder = search.Builder()
+        builder.extend(search.Segment.from_bytes(tail.to_bytes()))
+        builder.add(doc_id, fields)
+        builder.build(2).to_bytes()
+        samples.append((time.perf_counter() - start) * 1000)
+    print(f'add one upload to a full tail ({search.TAIL_MAX_DOCS} docs): p50 {statistics.median(samples):.1f} ms '
+          f'(plus one S3 GET and one conditional PUT)')
+
+
+if __name__ == '__main__':
+    main()
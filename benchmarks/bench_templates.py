@@ -0,0 +1,75 @@
+# Success-page rendering: precompiled templates.Template vs the per-request f-string it replaced.
+# The second column adds the json.dumps the Lambda runtime (and the idempotency
+# record) runs on the response: a non-ASCII page is escaped there character by character.
+# Cases take turns, best of REPEATS, so drift on a busy machine hits all of them alike.
+#   python benchmarks/bench_templates.py
+import json
+import re
+import time
+from html import escape
+
+from common import load_handler
+
+ROUNDS = 2000
+REPEATS = 30
+VALUES = {
+    'filename': 'temple <offering> & "prasad".jpg',
+    'file_id': '0b8f7d0e-5a8e-4c4b-9a53-1f5f5c9e2d11',
+    'presigned_url': 'https://majisimpleb.s3.amazonaws.com/uploads/x.jpg?X-Amz-Algorithm=AWS4-HMAC-SHA256&X-Amz-Expires=3600',
+}
+
+
+# Rebuild the old f-string function from the template source
+def compile_fstring(source, names, escaped):
+    body = source.replace('{', '{{').replace('}', '}}')
+    if escaped:
+        body = re.sub(r'\{\{\{\{\s*(\w+)\s*\}\}\}\}', r'{escape(\1, quote=True)}', body)
+    else:
+        body = re.sub(r'\{\{\{\{\s*(\w+)\s*\}\}\}\}', r'{\1}', body)
+    namespace = {'escape': escape}
+    exec(f'def render({", ".join(names)}):\n    return f"""{body}"""', namespace)
+    return namespace['render']
+
+
+def unescape_refs(text):
+    return re.sub(r'&#(\d+);', lambda m: chr(int(m.group(1))), text)
+
+
+def timed(cases):
+    best = [float('inf')] * len(cases)
+    for _ in range(REPEATS):
+        for index, fn in enumerate(cases):
+            start = time.perf_counter()
+            for _ in range(ROUNDS):
+                fn()
+            best[index] = min(best[index], time.perf_counter() - start)
+    return [elapsed / ROUNDS * 1e6 for elapsed in best]
+
+
+def main():
+    handler = load_handler('lambda.py')
+    template = handler.SUCCESS_PAGE
+    source = ''.join(
+        piece if index % 2 == 0 else '{{ ' + piece + ' }}'
+        for index, piece in enumerate(template._pieces)
+    )
+    # Back to the original characters, as the old f-string had them
+    source = unescape_refs(source)
+    names = sorted(template.names)
+
+    cases = [
+        ('f-string (unescaped)', compile_fstring(source, names, escaped=False)),
+        ('f-string + escape', compile_fstring(source, names, escaped=True)),
+        ('templates.Template', template.render),
+    ]
+    rendered = timed([lambda render=render: render(**VALUES) for _, render in cases])
+    responded = timed([
+        lambda render=render: json.dumps({'statusCode': 200, 'body': render(**VALUES)}) for _, render in cases
+    ])
+    print(f"{'renderer':>22} {'us/render':>10} {'+ json us':>10}")
+    for (name, _), render_us, response_us in zip(cases, rendered, responded):
+        print(f'{name:>22} {render_us:10.2f} {response_us:10.2f}')
+
+
+if __name__ == '__main__':
+    main()
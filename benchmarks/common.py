@@ -0,0 +1,19 @@
+# Shared helpers for the benchmark scripts
+import importlib.util
+import os
+import sys
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+
+# lambda.py can't be imported by name ("lambda" is a keyword), so load handlers by path
+def load_handler(filename, module_name=None):
+    # boto3 clients are built at import time and need a region, but no credentials
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'ap-south-1')
+    module_name = module_name or 'handler_' + os.path.splitext(filename)[0]
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(REPO_ROOT, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,125 @@
+# In-process stand-ins for the S3 and DynamoDB low-level clients, so both
+# handlers run end to end (aws_clients.Table serialisation included) without AWS
+import itertools
+import time
+
+from common import REPO_ROOT  # noqa: F401  (puts the repo on sys.path)
+
+import aws_clients
+
+
+class ClientError(Exception):
+    def __init__(self, code):
+        super().__init__(code)
+        self.response = {'Error': {'Code': code}}
+
+
+class StubS3:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.requests = 0
+        self.bytes = 0
+        self.objects = {}
+        self._uploads = itertools.count(1)
+
+    def _call(self, body=None):
+        self.requests += 1
+        if body is not None:
+            self.bytes += len(body.read() if hasattr(body, 'read') else body)
+        if self.latency:
+            time.sleep(self.latency)
+
+    def put_object(self, Key=None, Body=None, **kwargs):
+        self._call(Body)
+        self.objects[Key] = True
+        return {'ETag': '"stub"'}
+
+    def create_multipart_upload(self, **kwargs):
+        self._call()
+        return {'UploadId': f'stub-{next(self._uploads)}'}
+
+    def upload_part(self, Body=None, PartNumber=None, **kwargs):
+        self._call(Body)
+        return {'ETag': f'"part-{PartNumber}"'}
+
+    def complete_multipart_upload(self, Key=None, **kwargs):
+        self._call()
+        self.objects[Key] = True
+        return {}
+
+    def abort_multipart_upload(self, **kwargs):
+        self._call()
+        return {}
+
+    def head_object(self, Key=None, **kwargs):
+        self._call()
+        if Key not in self.objects:
+            raise ClientError('404')
+        return {}
+
+    def delete_objects(self, Delete=None, **kwargs):
+        self._call()
+        for entry in Delete['Objects']:
+            self.objects.pop(entry['Key'], None)
+        return {}
+
+    def generate_presigned_url(self, operation, Params=None, ExpiresIn=3600):
+        # Real signing is local CPU work (see bench_presign.py); this keeps the stub cheap and predictable
+        return f"https://{Params['Bucket']}.s3.amazonaws.com/{Params['Key']}?X-Amz-Expires={ExpiresIn}&X-Amz-Signature=stub"
+
+
+# Condition expressions are not evaluated: every conditional write succeeds, so
+# each upload takes the full path (no content-hash duplicates)
+class StubDynamoDB:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.requests = 0
+        self.items = {}
+
+    def _call(self):
+        self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    @staticmethod
+    def _key(table, key):
+        return table, key['id']['S']
+
+    def put_item(self, TableName=None, Item=None, **kwargs):
+        self._call()
+        self.items[self._key(TableName, Item)] = Item
+        return {}
+
+    def get_item(self, TableName=None, Key=None, **kwargs):
+        self._call()
+        item = self.items.get(self._key(TableName, Key))
+        return {'Item': item} if item is not None else {}
+
+    def update_item(self, TableName=None, Key=None, **kwargs):
+        self._call()
+        return {}
+
+    def delete_item(self, TableName=None, Key=None, **kwargs):
+        self._call()
+        self.items.pop(self._key(TableName, Key), None)
+        return {}
+
+    def query(self, TableName=None, Limit=20, **kwargs):
+        self._call()
+        items = [item for (table, _), item in self.items.items() if table == TableName]
+        return {'Items': items[:Limit]}
+
+    def batch_write_item(self, RequestItems=None, **kwargs):
+        self._call()
+        for table, requests in RequestItems.items():
+            for request in requests:
+                item = request['PutRequest']['Item']
+                self.items[self._key(table, item)] = item
+        return {'UnprocessedItems': {}}
+
+
+# Make aws_clients.s3() / dynamodb() return the stubs for the rest of the process
+def install(s3_latency=0.0, dynamodb_latency=0.0):
+    s3, dynamodb = StubS3(s3_latency), StubDynamoDB(dynamodb_latency)
+    aws_clients._clients.update({'s3': s3, 'dynamodb': dynamodb})
+    return s3, dynamodb
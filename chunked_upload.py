@@ -0,0 +1,161 @@
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import aws_clients
+import s3_upload
+
+MB = 1024 * 1024
+
+# Chunks travel through the Lambda payload, which is capped at 6 MB after base64
+CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', 4 * MB))
+# Complete re-packs every chunk inside one request, and API Gateway stops waiting
+# after 30 s, so a session is capped at what can be assembled in that time (1 GB)
+MAX_CHUNKS = int(os.environ.get('UPLOAD_MAX_CHUNKS', 256))
+
+
+class ChunkedUploadError(ValueError):
+    pass
+
+
+def chunk_key(file_id, number):
+    return f'chunks/{file_id}/{number:05d}'
+
+
+# Start a session: the item is written with status "uploading" and an empty chunk map
+def init_upload(table, file_id, filename, file_key, size, description='', content_type=None):
+    if size <= 0:
+        raise ChunkedUploadError('size must be positive')
+    total_chunks = math.ceil(size / CHUNK_SIZE)
+    if total_chunks > MAX_CHUNKS:
+        raise ChunkedUploadError('File is too large')
+
+    table.put_item(
+        Item={
+            'id': file_id,
+            'filename': filename,
+            'description': description or '',
+            's3_key': file_key,
+            'status': 'uploading',
+            'size': size,
+            'chunk_size': CHUNK_SIZE,
+            'total_chunks': total_chunks,
+            'content_type': content_type or 'application/octet-stream',
+            'chunks': {}
+        },
+        ConditionExpression='attribute_not_exists(id)'
+    )
+    return {'file_id': file_id, 'chunk_size': CHUNK_SIZE, 'total_chunks': total_chunks}
+
+
+def get_session(table, file_id):
+    item = table.get_item(Key={'id': file_id}, ConsistentRead=True).get('Item')
+    if not item or item.get('status') != 'uploading':
+        raise ChunkedUploadError('Unknown or finished upload')
+    return item
+
+
+def missing_chunks(item):
+    received = item.get('chunks', {})
+    return [n for n in range(1, int(item['total_chunks']) + 1) if str(n) not in received]
+
+
+def put_chunk(s3_client, table, bucket, file_id, number, data):
+    item = get_session(table, file_id)
+    total_chunks = int(item['total_chunks'])
+    if not 1 <= number <= total_chunks:
+        raise ChunkedUploadError(f'Chunk number must be between 1 and {total_chunks}')
+
+    expected = int(item['chunk_size'])
+    if number == total_chunks:
+        expected = int(item['size']) - expected * (total_chunks - 1)
+    if len(data) != expected:
+        raise ChunkedUploadError(f'Chunk {number} must be {expected} bytes')
+
+    s3_client.put_object(Bucket=bucket, Key=chunk_key(file_id, number), Body=data)
+
+    # Record the chunk only after S3 has it, so a retry after a failure is always safe
+    table.update_item(
+        Key={'id': file_id},
+        UpdateExpression='SET chunks.#n = :size',
+        ConditionExpression='#status = :uploading',
+        ExpressionAttributeNames={'#n': str(number), '#status': 'status'},
+        ExpressionAttributeValues={':size': len(data), ':uploading': 'uploading'}
+    )
+
+
+# A repeated complete (a retry after a timeout, or a second click) answers with the
+# finished item instead of assembling the file again
+def complete_upload(s3_client, table, bucket, file_id):
+    item = table.get_item(Key={'id': file_id}, ConsistentRead=True).get('Item')
+    if item and item.get('status') == 'complete':
+        return item
+    item = get_session(table, file_id)
+    missing = missing_chunks(item)
+    if missing:
+        raise ChunkedUploadError(f'Missing chunks: {missing}')
+
+    total_chunks = int(item['total_chunks'])
+    try:
+        _assemble(s3_client, bucket, item, file_id, total_chunks)
+        table.update_item(
+            Key={'id': file_id},
+            UpdateExpression='SET #status = :complete REMOVE chunks',
+            ConditionExpression='#status = :uploading',
+            ExpressionAttributeNames={'#status': 'status'},
+            ExpressionAttributeValues={':complete': 'complete', ':uploading': 'uploading'}
+        )
+    except Exception as e:
+        # Another complete got there first (and may have deleted the chunks under us)
+        current = table.get_item(Key={'id': file_id}, ConsistentRead=True).get('Item')
+        if current and current.get('status') == 'complete':
+            return current
+        if aws_clients.error_code(e) == 'ConditionalCheckFailedException':
+            raise ChunkedUploadError('Unknown or finished upload')
+        raise
+
+    _delete_chunks(s3_client, bucket, file_id, total_chunks)
+    return item
+
+
+# Chunks are smaller than S3's 5 MB part minimum, so each part is the next few chunks
+# joined. Parts are read and sent in parallel; only CONCURRENCY of them are in memory.
+def _assemble(s3_client, bucket, item, file_id, total_chunks):
+    key = item['s3_key']
+    per_part = math.ceil(s3_upload.PART_SIZE / int(item['chunk_size']))
+    groups = [
+        range(first, min(first + per_part, total_chunks + 1))
+        for first in range(1, total_chunks + 1, per_part)
+    ]
+
+    def send(part_number, numbers):
+        data = b''.join(
+            s3_client.get_object(Bucket=bucket, Key=chunk_key(file_id, number))['Body'].read()
+            for number in numbers
+        )
+        return s3_upload.upload_part(s3_client, bucket, key, upload_id, part_number, data)
+
+    upload_id = s3_client.create_multipart_upload(
+        Bucket=bucket, Key=key, ContentType=item['content_type']
+    )['UploadId']
+    try:
+        with ThreadPoolExecutor(max_workers=min(s3_upload.CONCURRENCY, len(groups))) as pool:
+            etags = list(pool.map(send, range(1, len(groups) + 1), groups))
+
+        s3_client.complete_multipart_upload(
+            Bucket=bucket,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={
+                'Parts': [{'PartNumber': number, 'ETag': etag} for number, etag in enumerate(etags, start=1)]
+            }
+        )
+    except Exception:
+        s3_client.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        raise
+
+
+def _delete_chunks(s3_client, bucket, file_id, total_chunks):
+    keys = [{'Key': chunk_key(file_id, n)} for n in range(1, total_chunks + 1)]
+    for start in range(0, len(keys), 1000):
+        s3_client.delete_objects(Bucket=bucket, Delete={'Objects': keys[start:start + 1000], 'Quiet': True})
@@ -0,0 +1,168 @@
+import gzip
+import mimetypes
+import os
+
+# Only this many leading bytes are inspected (a slice of the memoryview, not a copy of the file)
+SNIFF_BYTES = 512
+
+# Store compressible uploads gzip-encoded (S3 serves them with Content-Encoding: gzip)
+COMPRESS_AT_REST = os.environ.get('COMPRESS_AT_REST', 'false').lower() in ('1', 'true', 'yes')
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+COMPRESS_MIN_SAVING = 0.1
+
+DEFAULT_TYPE = 'application/octet-stream'
+
+# (offset, magic bytes, type)
+SIGNATURES = [
+    (0, b'\xff\xd8\xff', 'image/jpeg'),
+    (0, b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (0, b'GIF87a', 'image/gif'),
+    (0, b'GIF89a', 'image/gif'),
+    (0, b'BM', 'image/bmp'),
+    (0, b'II*\x00', 'image/tiff'),
+    (0, b'MM\x00*', 'image/tiff'),
+    (0, b'\x00\x00\x01\x00', 'image/x-icon'),
+    (0, b'%PDF-', 'application/pdf'),
+    (0, b'\x1f\x8b', 'application/gzip'),
+    (0, b'PK\x03\x04', 'application/zip'),
+    (0, b'7z\xbc\xaf\x27\x1c', 'application/x-7z-compressed'),
+    (0, b'Rar!\x1a\x07', 'application/vnd.rar'),
+    (0, b'ID3', 'audio/mpeg'),
+    (0, b'\xff\xfb', 'audio/mpeg'),
+    (0, b'OggS', 'audio/ogg'),
+    (0, b'fLaC', 'audio/flac'),
+    (0, b'\x1aE\xdf\xa3', 'video/webm'),
+]
+
+
+def _bmp_header(head):
+    # BITMAPFILEHEADER is 14 bytes; the DIB header after it starts with its own size
+    return len(head) >= 18 and int.from_bytes(head[14:18], 'little') in (12, 40, 52, 56, 64, 108, 124)
+
+
+def _id3_header(head):
+    # Major version 2-4, then a size in four 7-bit bytes
+    return len(head) >= 10 and head[3] in (2, 3, 4) and head[4] != 0xff and all(byte < 0x80 for byte in head[6:10])
+
+
+def _mpeg_frame(head):
+    # MPEG-1 Layer III frame header: a real bitrate and sample rate index
+    return len(head) >= 4 and head[2] >> 4 not in (0, 15) and (head[2] >> 2) & 3 != 3
+
+
+# Magic bytes too short to trust alone (text can start with "BM" or "ID3"),
+# confirmed by the header fields that follow them
+CONFIRM = {b'BM': _bmp_header, b'ID3': _id3_header, b'\xff\xfb': _mpeg_frame}
+
+# RIFF containers: bytes 8-12 name the format
+RIFF_TYPES = {b'WEBP': 'image/webp', b'WAVE': 'audio/wav', b'AVI ': 'video/x-msvideo'}
+
+# ISO base media (ftyp box at offset 4): brand -> type
+FTYP_BRANDS = {
+    b'heic': 'image/heic', b'heix': 'image/heic', b'mif1': 'image/heif', b'avif': 'image/avif',
+    b'qt  ': 'video/quicktime', b'M4A ': 'audio/mp4',
+}
+
+# Containers whose real type only the extension tells apart (docx, xlsx, epub are zips)
+EXTENSION_REFINES = {'application/zip', 'application/gzip'}
+
+# Types a browser would render as a page or run as script from the bucket's
+# origin. Nothing is ever stored with one of these, sniffed or declared.
+ACTIVE_TYPES = {'text/html', 'text/xsl', 'text/vnd.wap.wml', 'application/x-shockwave-flash'}
+
+# Client-declared types accepted as they are (see declared_type): what sniff
+# detects from magic bytes, and plain data formats
+DECLARABLE = (
+    {mime for _, _, mime in SIGNATURES} | set(RIFF_TYPES.values()) | set(FTYP_BRANDS.values())
+    | {'video/mp4', 'text/plain', 'text/csv', 'application/json', 'application/x-ndjson'}
+)
+
+COMPRESSIBLE = {
+    'application/json', 'application/xml', 'application/javascript', 'application/x-ndjson',
+    'image/svg+xml', 'image/bmp', 'image/tiff', 'application/rtf',
+}
+
+
+def sniff(data, filename=None):
+    head = bytes(memoryview(data).cast('B')[:SNIFF_BYTES])
+    by_extension, encoding = mimetypes.guess_type(filename or '')
+    if encoding is not None:
+        # log.txt.gz names the type inside the compression, not the bytes stored
+        by_extension = None
+
+    detected = None
+    for offset, magic, mime in SIGNATURES:
+        if head.startswith(magic, offset) and CONFIRM.get(magic, bool)(head):
+            detected = mime
+            break
+    if detected is None and head[:4] == b'RIFF':
+        detected = RIFF_TYPES.get(head[8:12])
+    if detected is None and head[4:8] == b'ftyp':
+        detected = FTYP_BRANDS.get(head[8:12], 'video/mp4')
+
+    if detected:
+        if detected in EXTENSION_REFINES and by_extension and not is_active(by_extension):
+            return by_extension
+        return detected
+
+    if _looks_like_text(head):
+        # Never label uploads as HTML, XML or script: the bucket would then serve active content
+        if by_extension and (by_extension.startswith('text/') or by_extension in COMPRESSIBLE) \
+                and not is_active(by_extension):
+            return by_extension + '; charset=utf-8' if by_extension.startswith('text/') else by_extension
+        return 'text/plain; charset=utf-8'
+
+    return DEFAULT_TYPE
+
+
+def is_active(content_type):
+    mime = content_type.split(';', 1)[0].strip().lower()
+    return mime in ACTIVE_TYPES or mime.endswith(('/xml', '+xml')) or 'javascript' in mime or 'ecmascript' in mime
+
+
+# The type to store for a client-declared ``content_type`` (direct and chunked
+# uploads, where Lambda never sees the bytes). Known types, or the one the
+# file's own extension maps to, are kept; anything else, and anything active,
+# becomes DEFAULT_TYPE.
+def declared_type(content_type, filename=None):
+    mime = (content_type or '').split(';', 1)[0].strip().lower()
+    if not mime or is_active(mime):
+        return DEFAULT_TYPE
+    by_extension, encoding = mimetypes.guess_type(filename or '')
+    if encoding is not None:
+        # The bytes are compressed whatever type the browser reports for the file inside
+        return mime if mime == 'application/gzip' else DEFAULT_TYPE
+    if mime in DECLARABLE or mime == by_extension:
+        return mime
+    return DEFAULT_TYPE
+
+
+def _looks_like_text(head):
+    if not head or b'\x00' in head:
+        return False
+    try:
+        head.decode('utf-8')
+    except UnicodeDecodeError as e:
+        # A multi-byte character cut off by the sample boundary is still text
+        if e.start < len(head) - 3:
+            return False
+    return True
+
+
+def is_compressible(content_type):
+    mime = content_type.split(';', 1)[0].strip()
+    return mime.startswith('text/') or mime in COMPRESSIBLE
+
+
+# Returns (body, extra put_object arguments) for storing ``data``
+def prepare_body(data, content_type):
+    extra = {'ContentType': content_type}
+    size = memoryview(data).nbytes
+    if not (COMPRESS_AT_REST and size >= COMPRESS_MIN_SIZE and is_compressible(content_type)):
+        return data, extra
+
+    compressed = gzip.compress(data, compresslevel=6, mtime=0)
+    if len(compressed) > size * (1 - COMPRESS_MIN_SAVING):
+        return data, extra
+    extra['ContentEncoding'] = 'gzip'
+    return compressed, extra
@@ -0,0 +1,61 @@
+import hashlib
+
+import aws_clients
+
+# One record per distinct content, kept in the uploads table next to the posts
+HASH_PREFIX = 'sha256#'
+
+
+def content_hash(data):
+    # hashlib reads the memoryview in place (and releases the GIL while hashing)
+    return hashlib.sha256(memoryview(data).cast('B')).hexdigest()
+
+
+def content_key(digest):
+    return f'uploads/sha256/{digest[:2]}/{digest}'
+
+
+def is_content_key(key):
+    return key.startswith('uploads/sha256/')
+
+
+# Returns True when the caller must upload the object, False when identical
+# bytes are already stored under content_key(digest).
+def claim(table, digest, size):
+    try:
+        table.put_item(
+            Item={
+                'id': HASH_PREFIX + digest,
+                's3_key': content_key(digest),
+                'size': size,
+                'status': 'uploading'
+            },
+            ConditionExpression='attribute_not_exists(id)'
+        )
+        return True
+    except Exception as e:
+        if aws_clients.error_code(e) != 'ConditionalCheckFailedException':
+            raise
+
+    record = table.get_item(Key={'id': HASH_PREFIX + digest}, ConsistentRead=True).get('Item') or {}
+    # Another upload of the same bytes is in flight (or died): writing the same
+    # content to the same key again is harmless
+    return record.get('status') != 'stored'
+
+
+def mark_stored(table, digest):
+    table.update_item(
+        Key={'id': HASH_PREFIX + digest},
+        UpdateExpression='SET #status = :stored, s3_key = :key',
+        ExpressionAttributeNames={'#status': 'status'},
+        ExpressionAttributeValues={':stored': 'stored', ':key': content_key(digest)}
+    )
+
+
+def release(table, digest):
+    table.delete_item(
+        Key={'id': HASH_PREFIX + digest},
+        ConditionExpression='#status <> :stored',
+        ExpressionAttributeNames={'#status': 'status'},
+        ExpressionAttributeValues={':stored': 'stored'}
+    )
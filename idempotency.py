@@ -0,0 +1,185 @@
+import hashlib
+import json
+import os
+import time
+import zlib
+
+import admission
+import aws_clients
+import metrics
+import multipart
+import precompressed
+import rate_limit
+
+# Idempotency-Key support for POSTs. The first request with a key takes a
+# record in the uploads table with a conditional write and, once it has a
+# response, stores it there. A retry with the same key gets that response back
+# from the one conditional write, without running the handler (no S3 upload,
+# no new item). One still running gets 409.
+ENABLED = os.environ.get('IDEMPOTENCY_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+HEADER = 'idempotency-key'
+# How long a finished response is replayed (enable TTL on expires_at). Stored
+# pages carry download links signed for an hour, so they aren't kept longer.
+TTL = int(os.environ.get('IDEMPOTENCY_TTL', 3600))
+# A record still marked running after this long belongs to a request that died
+# (used when the Lambda context can't say how long the request may run)
+RUNNING_TIMEOUT = int(os.environ.get('IDEMPOTENCY_RUNNING_TIMEOUT', 900))
+MAX_KEY_LENGTH = 255
+# Compressed responses above this aren't stored (DynamoDB items stop at 400 KB);
+# the record is dropped instead and a retry runs again
+MAX_RESPONSE_BYTES = int(os.environ.get('IDEMPOTENCY_MAX_RESPONSE_BYTES', 300 * 1024))
+
+KEY_PREFIX = 'idem#'
+
+
+def _response(status, message, headers=None):
+    return {
+        'statusCode': status,
+        'headers': dict({'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}, **(headers or {})),
+        'body': json.dumps({'error': message}, separators=(',', ':'))
+    }
+
+
+# Keys are scoped to the client and the route, so one caller can't replay another's response
+def record_id(event, key):
+    http = event.get('requestContext', {}).get('http', {})
+    scope = f"{rate_limit.client_key(event)}\n{http.get('method', 'POST')} {event.get('rawPath', '/')}\n{key}"
+    return KEY_PREFIX + hashlib.sha256(scope.encode('utf-8')).hexdigest()
+
+
+# The same key sent with a different body is a client bug, not a retry. Form
+# posts are compared by their decoded parts, not their bytes: HTTP clients pick
+# a new random boundary each time they encode the same form. Raises
+# admission.Rejected or multipart.MultipartError for a form that doesn't parse.
+def fingerprint(event):
+    content_type = precompressed.get_header(event.get('headers'), 'content-type') or ''
+    media_type = content_type.split(';', 1)[0].strip().lower()
+    digest = hashlib.sha256(media_type.encode('utf-8') + b'\n')
+    if media_type == 'multipart/form-data':
+        for part in multipart.iter_parts(admission.read_form(event, content_type), content_type):
+            digest.update(f'{part.name}\0{part.filename}\0{part.size}\n'.encode('utf-8'))
+            digest.update(part.data)
+        return digest.hexdigest()
+
+    body = event.get('body') or ''
+    digest.update(body.encode('utf-8') if isinstance(body, str) else body)
+    return digest.hexdigest()
+
+
+def _running_until(context, now):
+    remaining = getattr(context, 'get_remaining_time_in_millis', None)
+    return now + (int(remaining() / 1000) + 5 if remaining else RUNNING_TIMEOUT)
+
+
+def encode_response(response):
+    return zlib.compress(json.dumps(response, separators=(',', ':')).encode('utf-8'))
+
+
+def decode_response(data):
+    return json.loads(zlib.decompress(bytes(data)))
+
+
+# Takes the record for ``item_id``. Returns None when this request now owns it,
+# otherwise the record another request holds (current or finished).
+def claim(table, item_id, request_fingerprint, expires_at):
+    now = int(time.time())
+    try:
+        table.put_item(
+            Item={'id': item_id, 'status': 'running', 'fingerprint': request_fingerprint, 'expires_at': expires_at},
+            ConditionExpression='attribute_not_exists(id) OR expires_at < :now',
+            ExpressionAttributeValues={':now': now},
+            ReturnValuesOnConditionCheckFailure='ALL_OLD'
+        )
+        return None
+    except Exception as e:
+        if aws_clients.error_code(e) != 'ConditionalCheckFailedException':
+            raise
+        item = e.response.get('Item')
+    if item is not None:
+        return aws_clients.from_item(item)
+    # Deleted between the write and now: read it the slow way, or try again
+    item = table.get_item(Key={'id': item_id}, ConsistentRead=True).get('Item')
+    return item if item is not None else claim(table, item_id, request_fingerprint, expires_at)
+
+
+def complete(table, item_id, data):
+    table.update_item(
+        Key={'id': item_id},
+        UpdateExpression='SET #status = :done, #response = :response, expires_at = :expires',
+        ExpressionAttributeNames={'#status': 'status', '#response': 'response'},
+        ExpressionAttributeValues={':done': 'done', ':response': data, ':expires': int(time.time()) + TTL}
+    )
+
+
+def release(table, item_id):
+    table.delete_item(
+        Key={'id': item_id},
+        ConditionExpression='#status = :running',
+        ExpressionAttributeNames={'#status': 'status'},
+        ExpressionAttributeValues={':running': 'running'}
+    )
+
+
+def replay(record, request_fingerprint):
+    metrics.set_route('POST replay')
+    if record.get('fingerprint') != request_fingerprint:
+        return _response(422, 'Idempotency-Key was already used with a different request')
+    if record.get('status') != 'done':
+        return _response(409, 'A request with this Idempotency-Key is still in progress', {'Retry-After': '1'})
+    metrics.count('idempotent_replay')
+    response = decode_response(record['response'])
+    response.setdefault('headers', {})['Idempotent-Replayed'] = 'true'
+    return response
+
+
+# Runs ``handle()`` once per Idempotency-Key. Requests without the header go
+# straight through. 5xx responses and exceptions release the key so a retry
+# runs again; everything else is stored and replayed.
+def run(table, event, context, handle):
+    key = precompressed.get_header(event.get('headers'), HEADER)
+    if not ENABLED or key is None:
+        return handle()
+    key = key.strip()
+    if not key or len(key) > MAX_KEY_LENGTH:
+        return _response(400, f'Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters')
+
+    try:
+        request_fingerprint = fingerprint(event)
+    except (admission.Rejected, multipart.MultipartError):
+        # The handler refuses the same body the same way every time: nothing to remember
+        return handle()
+    item_id = record_id(event, key)
+    try:
+        with metrics.phase('idempotency'):
+            record = claim(table, item_id, request_fingerprint, _running_until(context, int(time.time())))
+    except Exception as e:
+        # Without the record a retry could upload twice: the client retries later with the same key
+        metrics.failed(e)
+        return _response(503, 'Idempotency store unavailable, retry with the same Idempotency-Key', {'Retry-After': '1'})
+    if record is not None:
+        return replay(record, request_fingerprint)
+
+    try:
+        response = handle()
+    except BaseException:
+        _forget(table, item_id)
+        raise
+
+    data = encode_response(response)
+    if response.get('statusCode', 500) >= 500 or len(data) > MAX_RESPONSE_BYTES:
+        _forget(table, item_id)
+        return response
+    try:
+        with metrics.phase('idempotency'):
+            complete(table, item_id, data)
+    except Exception:
+        # The upload itself succeeded; a retry after the running record expires runs again
+        metrics.count('idempotency_failed')
+    return response
+
+
+def _forget(table, item_id):
+    try:
+        release(table, item_id)
+    except Exception:
+        metrics.count('idempotency_failed')
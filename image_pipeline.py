@@ -0,0 +1,167 @@
+import gzip
+import io
+import os
+import shutil
+import tempfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote_plus
+
+import aws_clients
+import content_types
+import dedup
+
+# Separate Lambda, triggered by s3:ObjectCreated:* on the uploads/ prefix.
+# Needs Pillow (e.g. as a layer). Handler: image_pipeline.lambda_handler
+BUCKET_NAME = os.environ.get('BUCKET_NAME', 'majisimpleb')
+TABLE_NAME = os.environ.get('TABLE_NAME', 'posts')
+
+VARIANT_PREFIX = 'variants/'
+# (name, longest side in px, format)
+VARIANTS = [
+    ('thumb.jpg', 256, 'JPEG'),
+    ('w800.webp', 800, 'WEBP'),
+    ('w800.jpg', 800, 'JPEG'),
+    ('w1600.webp', 1600, 'WEBP'),
+    ('w1600.jpg', 1600, 'JPEG'),
+]
+CONTENT_TYPES = {'JPEG': 'image/jpeg', 'WEBP': 'image/webp'}
+QUALITY = int(os.environ.get('IMAGE_QUALITY', 82))
+CONCURRENCY = max(1, int(os.environ.get('IMAGE_CONCURRENCY', 4)))
+
+# Originals are spooled to /tmp past this size instead of being held in memory
+SPOOL_MEMORY = int(os.environ.get('IMAGE_SPOOL_MEMORY', 8 * 1024 * 1024))
+MAX_PIXELS = int(os.environ.get('IMAGE_MAX_PIXELS', 80_000_000))
+EXIF_ORIENTATION = 0x0112
+# Stored types that say nothing about the bytes; only these objects are sniffed
+GENERIC_TYPES = {'', 'application/octet-stream', 'binary/octet-stream'}
+
+table = aws_clients.Table(TABLE_NAME)
+
+
+def lambda_handler(event, context):
+    processed = []
+    for record in event.get('Records', []):
+        bucket = record['s3']['bucket']['name']
+        key = unquote_plus(record['s3']['object']['key'])
+        if key.startswith(VARIANT_PREFIX):
+            continue
+        variants = process_object(aws_clients.s3(), table, bucket, key)
+        if variants:
+            processed.append({'key': key, 'variants': variants})
+    return {'processed': processed}
+
+
+# Entry point for the job worker (jobs.py), an alternative to the S3 trigger
+def run_job(upload_id, payload):
+    return process_object(aws_clients.s3(), table, payload['bucket'], payload['key'])
+
+
+def variant_key(key, name):
+    base = key[len('uploads/'):] if key.startswith('uploads/') else key
+    return f'{VARIANT_PREFIX}{base}/{name}'
+
+
+# The item that owns an object: the shared hash record for content-addressed
+# keys, otherwise the post whose id prefixes the key (uploads/<id>_<name>)
+def owner_id(key):
+    name = key[len('uploads/'):]
+    if name.startswith('sha256/'):
+        return dedup.HASH_PREFIX + name.rsplit('/', 1)[-1]
+    return name[:36]
+
+
+# Decided before anything is downloaded: the stored ContentType from a HEAD,
+# or a ranged GET of the first bytes when that type is generic
+def is_image(s3_client, bucket, key):
+    head = s3_client.head_object(Bucket=bucket, Key=key)
+    declared = (head.get('ContentType') or '').split(';', 1)[0].strip().lower()
+    if declared not in GENERIC_TYPES:
+        return declared.startswith('image/')
+    if not head.get('ContentLength'):
+        return False
+
+    response = s3_client.get_object(Bucket=bucket, Key=key, Range=f'bytes=0-{content_types.SNIFF_BYTES - 1}')
+    data = response['Body'].read()
+    if head.get('ContentEncoding') == 'gzip':
+        try:
+            # A gzip prefix still inflates to the start of the file
+            data = zlib.decompressobj(zlib.MAX_WBITS | 16).decompress(data)
+        except zlib.error:
+            return False
+    return content_types.sniff(data).startswith('image/')
+
+
+def process_object(s3_client, table, bucket, key):
+    if not is_image(s3_client, bucket, key):
+        return None
+
+    from PIL import Image, ImageOps
+
+    Image.MAX_IMAGE_PIXELS = MAX_PIXELS
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY) as original:
+        response = s3_client.get_object(Bucket=bucket, Key=key)
+        body = response['Body']
+        # BMP/TIFF may be stored gzip-encoded (COMPRESS_AT_REST)
+        if response.get('ContentEncoding') == 'gzip':
+            body = gzip.GzipFile(fileobj=body)
+        shutil.copyfileobj(body, original, 1024 * 1024)
+        original.seek(0)
+
+        try:
+            image = Image.open(original)
+        except Exception:
+            # An image type Pillow can't decode (e.g. HEIC without a plugin): nothing to do
+            return None
+
+        # JPEGs decode straight at reduced scale, so a 50 MP photo never
+        # materialises at full size
+        largest = max(size for _, size, _ in VARIANTS)
+        image.draft('RGB', (largest, largest))
+        # exif_transpose copies even an upright image: only call it to turn one
+        if image.getexif().get(EXIF_ORIENTATION, 1) != 1:
+            image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+        # Other formats decode at full size: shrink in place to the largest
+        # variant, which drops the full-size pixels before any variant is made
+        image.thumbnail((largest, largest), Image.LANCZOS)
+        image.load()
+
+    # Each smaller size is cut from the next larger one, never from the original
+    scaled = {largest: image}
+    for size in sorted({size for _, size, _ in VARIANTS}, reverse=True)[1:]:
+        image = image.copy()
+        image.thumbnail((size, size), Image.LANCZOS)
+        scaled[size] = image
+
+    def render(variant):
+        name, size, fmt = variant
+        # Its own copy: save() keeps encoder settings on the image, which threads would share
+        copy = scaled[size].copy()
+        if fmt == 'JPEG' and copy.mode != 'RGB':
+            copy = copy.convert('RGB')
+        out = io.BytesIO()
+        copy.save(out, fmt, quality=QUALITY, optimize=fmt == 'JPEG')
+        s3_client.put_object(
+            Bucket=bucket,
+            Key=variant_key(key, name),
+            Body=out.getvalue(),
+            ContentType=CONTENT_TYPES[fmt]
+        )
+        return name, variant_key(key, name)
+
+    with ThreadPoolExecutor(max_workers=min(CONCURRENCY, len(VARIANTS))) as pool:
+        variants = dict(pool.map(render, VARIANTS))
+
+    try:
+        table.update_item(
+            Key={'id': owner_id(key)},
+            UpdateExpression='SET variants = :variants',
+            ConditionExpression='attribute_exists(id)',
+            ExpressionAttributeValues={':variants': variants}
+        )
+    except Exception as e:
+        if aws_clients.error_code(e) != 'ConditionalCheckFailedException':
+            raise
+    return variants
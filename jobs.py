@@ -0,0 +1,358 @@
+import collections
+import importlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import aws_clients
+
+# Follow-up work (image variants, indexing, ...) is queued by the upload handler
+# and run later by a worker, so it never adds to the response time.
+#   JOBS_BACKEND=off | sqs | sqlite | memory
+BACKEND = os.environ.get('JOBS_BACKEND', 'sqs' if os.environ.get('JOBS_QUEUE_URL') else 'off').lower()
+QUEUE_URL = os.environ.get('JOBS_QUEUE_URL', '')
+SQLITE_PATH = os.environ.get('JOBS_SQLITE_PATH', '/tmp/jobs.sqlite3')
+TABLE_NAME = os.environ.get('JOBS_TABLE', os.environ.get('TABLE_NAME', 'posts'))
+CONCURRENCY = max(1, int(os.environ.get('JOBS_CONCURRENCY', 4)))
+# How long a finished job is remembered, and how long a crashed worker's claim blocks a retry
+DONE_TTL = int(os.environ.get('JOBS_DONE_TTL', 7 * 24 * 3600))
+CLAIM_TIMEOUT = int(os.environ.get('JOBS_CLAIM_TIMEOUT', 900))
+
+# Job type -> 'module:function', imported only by the worker. The function
+# is called as fn(upload_id, payload).
+JOB_TYPES = {
+    'image.variants': 'image_pipeline:run_job',
+    'search.index': 'search:run_job',
+}
+
+KEY_PREFIX = 'job#'
+
+
+def make_job(job_type, upload_id, payload=None):
+    return {
+        'id': str(uuid.uuid4()),
+        'type': job_type,
+        'upload_id': upload_id,
+        'payload': payload or {},
+        'enqueued_at': time.time()
+    }
+
+
+def idempotency_key(job):
+    # One run per upload and job type, however many times the message is delivered
+    return f"{KEY_PREFIX}{job['type']}#{job['upload_id']}"
+
+
+class MemoryQueue:
+    def __init__(self):
+        self._ready = collections.deque()
+        self._in_flight = {}
+        self._receipts = 0
+        self._lock = threading.Lock()
+
+    def send(self, jobs):
+        with self._lock:
+            self._ready.extend(jobs)
+
+    def receive(self, max_jobs=10):
+        with self._lock:
+            received = []
+            while self._ready and len(received) < max_jobs:
+                self._receipts += 1
+                job = self._ready.popleft()
+                self._in_flight[self._receipts] = job
+                received.append((self._receipts, job))
+            return received
+
+    def ack(self, receipts):
+        with self._lock:
+            for receipt in receipts:
+                self._in_flight.pop(receipt, None)
+
+    def retry(self, receipts):
+        with self._lock:
+            for receipt in receipts:
+                job = self._in_flight.pop(receipt, None)
+                if job is not None:
+                    self._ready.append(job)
+
+    def __len__(self):
+        return len(self._ready)
+
+
+# A queue table in a local SQLite file; in-flight jobs become visible again after the timeout
+class SqliteQueue:
+    def __init__(self, path, visibility_timeout=CLAIM_TIMEOUT):
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS job_queue '
+            '(seq INTEGER PRIMARY KEY AUTOINCREMENT, body TEXT NOT NULL, visible_at REAL NOT NULL)'
+        )
+
+    def send(self, jobs):
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                'INSERT INTO job_queue (body, visible_at) VALUES (?, ?)',
+                [(json.dumps(job, separators=(',', ':')), now) for job in jobs]
+            )
+
+    def receive(self, max_jobs=10):
+        now = time.time()
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                rows = self._db.execute(
+                    'SELECT seq, body FROM job_queue WHERE visible_at <= ? ORDER BY seq LIMIT ?', (now, max_jobs)
+                ).fetchall()
+                self._db.executemany(
+                    'UPDATE job_queue SET visible_at = ? WHERE seq = ?',
+                    [(now + self.visibility_timeout, seq) for seq, _ in rows]
+                )
+                self._db.execute('COMMIT')
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+        return [(seq, json.loads(body)) for seq, body in rows]
+
+    def ack(self, receipts):
+        with self._lock:
+            self._db.executemany('DELETE FROM job_queue WHERE seq = ?', [(seq,) for seq in receipts])
+
+    def retry(self, receipts):
+        with self._lock:
+            self._db.executemany('UPDATE job_queue SET visible_at = 0 WHERE seq = ?', [(seq,) for seq in receipts])
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM job_queue').fetchone()[0]
+
+
+class SqsQueue:
+    def __init__(self, url):
+        self.url = url
+
+    def send(self, jobs):
+        for start in range(0, len(jobs), 10):
+            entries = [
+                {'Id': str(number), 'MessageBody': json.dumps(job, separators=(',', ':'))}
+                for number, job in enumerate(jobs[start:start + 10])
+            ]
+            response = aws_clients.sqs().send_message_batch(QueueUrl=self.url, Entries=entries)
+            if response.get('Failed'):
+                raise RuntimeError(f"{len(response['Failed'])} jobs could not be queued")
+
+    def receive(self, max_jobs=10):
+        response = aws_clients.sqs().receive_message(
+            QueueUrl=self.url, MaxNumberOfMessages=min(max_jobs, 10), WaitTimeSeconds=1
+        )
+        return [(message['ReceiptHandle'], json.loads(message['Body'])) for message in response.get('Messages', [])]
+
+    def ack(self, receipts):
+        receipts = list(receipts)
+        for start in range(0, len(receipts), 10):
+            aws_clients.sqs().delete_message_batch(QueueUrl=self.url, Entries=[
+                {'Id': str(number), 'ReceiptHandle': receipt}
+                for number, receipt in enumerate(receipts[start:start + 10])
+            ])
+
+    def retry(self, receipts):
+        # Left alone, the messages come back once their visibility timeout runs out
+        pass
+
+
+# Idempotency records: claim() is True for one worker per key. A finished job
+# blocks reruns for DONE_TTL, a running one until it is released (it failed)
+# or its claim times out (the worker died).
+class MemoryStore:
+    def __init__(self):
+        self._records = {}
+        self._lock = threading.Lock()
+
+    def claim(self, key):
+        now = time.time()
+        with self._lock:
+            record = self._records.get(key)
+            if record and record[1] > now:
+                return False
+            self._records[key] = ('running', now + CLAIM_TIMEOUT)
+            return True
+
+    def complete(self, key):
+        with self._lock:
+            self._records[key] = ('done', time.time() + DONE_TTL)
+
+    def release(self, key):
+        with self._lock:
+            self._records.pop(key, None)
+
+
+class SqliteStore:
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS job_runs (key TEXT PRIMARY KEY, status TEXT NOT NULL, expires_at REAL NOT NULL)'
+        )
+
+    def claim(self, key):
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                'INSERT INTO job_runs (key, status, expires_at) VALUES (?, ?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET status = excluded.status, expires_at = excluded.expires_at '
+                'WHERE job_runs.expires_at <= ?',
+                (key, 'running', now + CLAIM_TIMEOUT, now)
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, key):
+        with self._lock:
+            self._db.execute(
+                "UPDATE job_runs SET status = 'done', expires_at = ? WHERE key = ?", (time.time() + DONE_TTL, key)
+            )
+
+    def release(self, key):
+        with self._lock:
+            self._db.execute("DELETE FROM job_runs WHERE key = ? AND status = 'running'", (key,))
+
+
+# Records live in the uploads table next to the posts; expires_at can be the table's TTL attribute
+class DynamoStore:
+    def __init__(self, table):
+        self.table = table
+
+    def claim(self, key):
+        now = int(time.time())
+        try:
+            self.table.put_item(
+                Item={'id': key, 'status': 'running', 'expires_at': now + CLAIM_TIMEOUT},
+                ConditionExpression='attribute_not_exists(id) OR expires_at < :now',
+                ExpressionAttributeValues={':now': now}
+            )
+            return True
+        except Exception as e:
+            if aws_clients.error_code(e) != 'ConditionalCheckFailedException':
+                raise
+            return False
+
+    def complete(self, key):
+        self.table.update_item(
+            Key={'id': key},
+            UpdateExpression='SET #status = :done, expires_at = :expires',
+            ExpressionAttributeNames={'#status': 'status'},
+            ExpressionAttributeValues={':done': 'done', ':expires': int(time.time()) + DONE_TTL}
+        )
+
+    def release(self, key):
+        self.table.delete_item(
+            Key={'id': key},
+            ConditionExpression='#status = :running',
+            ExpressionAttributeNames={'#status': 'status'},
+            ExpressionAttributeValues={':running': 'running'}
+        )
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+# The configured (queue, idempotency store) pair, created once per container
+def backends():
+    with _backends_lock:
+        if 'queue' not in _backends:
+            if BACKEND == 'sqs':
+                _backends['queue'] = SqsQueue(QUEUE_URL)
+                _backends['store'] = DynamoStore(aws_clients.Table(TABLE_NAME))
+            elif BACKEND == 'sqlite':
+                _backends['queue'] = SqliteQueue(SQLITE_PATH)
+                _backends['store'] = SqliteStore(SQLITE_PATH)
+            elif BACKEND == 'memory':
+                _backends['queue'] = MemoryQueue()
+                _backends['store'] = MemoryStore()
+            else:
+                _backends['queue'] = _backends['store'] = None
+        return _backends['queue'], _backends['store']
+
+
+def enabled():
+    return BACKEND != 'off'
+
+
+# Queue (job_type, upload_id, payload) tuples; a no-op while JOBS_BACKEND is off
+def enqueue(jobs, queue=None):
+    if queue is None:
+        queue = backends()[0]
+    if queue is None or not jobs:
+        return []
+    jobs = [make_job(*job) for job in jobs]
+    queue.send(jobs)
+    return jobs
+
+
+def resolve(job_type):
+    module_name, _, function = JOB_TYPES[job_type].partition(':')
+    return getattr(importlib.import_module(module_name), function)
+
+
+def run_job(job, store):
+    key = idempotency_key(job)
+    if not store.claim(key):
+        return 'skipped'
+    try:
+        resolve(job['type'])(job['upload_id'], job['payload'])
+    except BaseException:
+        store.release(key)
+        raise
+    store.complete(key)
+    return 'done'
+
+
+# Run jobs side by side. Returns one result per job: 'done', 'skipped' or the exception.
+def run_batch(jobs, store, concurrency=None):
+    if not jobs:
+        return []
+    concurrency = min(concurrency or CONCURRENCY, len(jobs))
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(run_job, job, store) for job in jobs]
+    return [future.exception() or future.result() for future in futures]
+
+
+# Local worker loop: receive, run, ack until the queue is empty
+def drain(queue=None, store=None, concurrency=None, batch_size=10):
+    default_queue, default_store = backends()
+    queue = default_queue if queue is None else queue
+    store = default_store if store is None else store
+    counts = collections.Counter()
+    while True:
+        received = queue.receive(batch_size)
+        if not received:
+            return counts
+        results = run_batch([job for _, job in received], store, concurrency)
+        finished = [receipt for (receipt, _), result in zip(received, results) if isinstance(result, str)]
+        failed = [receipt for (receipt, _), result in zip(received, results) if not isinstance(result, str)]
+        queue.ack(finished)
+        queue.retry(failed)
+        counts.update(result if isinstance(result, str) else 'failed' for result in results)
+
+
+# Worker Lambda, triggered by the SQS queue with ReportBatchItemFailures enabled:
+# failed messages go back to the queue, the rest are deleted by Lambda.
+# Handler: jobs.lambda_handler
+def lambda_handler(event, context):
+    records = event.get('Records', [])
+    store = backends()[1] or DynamoStore(aws_clients.Table(TABLE_NAME))
+    results = run_batch([json.loads(record['body']) for record in records], store)
+    return {'batchItemFailures': [
+        {'itemIdentifier': record['messageId']}
+        for record, result in zip(records, results) if not isinstance(result, str)
+    ]}
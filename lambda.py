@@ -1,144 +1,792 @@
 import json
-import boto3
 import os
 import uuid
 import base64
+import contextvars
+from datetime import datetime, timezone
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
 
-# Initialize AWS clients
-s3_client = boto3.client('s3')
-dynamodb = boto3.resource('dynamodb')
+import admission
+import archive
+import aws_clients
+import batch_upload
+import chunked_upload
+import content_types
+import dedup
+import idempotency
+import jobs
+import metrics
+import multipart
+import precompressed
+import rate_limit
+import s3_upload
+import search
+import templates
+import url_cache
+import warmup
 
 # Set your specific bucket and table names
 BUCKET_NAME = 'majisimpleb'
 TABLE_NAME = 'posts'
-table = dynamodb.Table(TABLE_NAME)
+
+# AWS clients are created on first use (see aws_clients), so GETs never load botocore
+table = aws_clients.Table(TABLE_NAME)
+
+# Shared across invocations for work that runs alongside the S3 upload
+executor = ThreadPoolExecutor(max_workers=4)
+
+# Global secondary index for the listing: every finished upload sits in one
+# partition, sorted by its upload_date timestamp
+GALLERY_INDEX = 'gallery-by-date'
+GALLERY_KEY = 'gallery'
+GALLERY_PARTITION = 'uploads'
+LIST_PAGE_SIZE = 20
+LIST_MAX_PAGE_SIZE = 100
+
+# Lifetime of the download link and of the browser's direct upload URL
+URL_EXPIRATION = 3600
+UPLOAD_URL_EXPIRATION = 900
+
+# Download links are signed on demand from s3_key and reused while they have life left
+download_urls = url_cache.PresignedUrlCache()
+
+# Uploads per client; its counters live in the uploads table next to the job records
+rate_limiter = rate_limit.RateLimiter(table)
 
 def lambda_handler(event, context):
+    # Keep-warm pings: open connections and fill caches, nothing else
+    if warmup.is_warmup(event):
+        with metrics.request(event, context, route='warmup'):
+            return metrics.status(warmup.respond(warmup_steps()))
+    
+    # One CloudWatch EMF line per request with the time spent in each phase
+    with metrics.request(event, context):
+        return metrics.status(route(event, context))
+
+def route(event, context):
+    method = event['requestContext']['http']['method']
+    path = event.get('rawPath', '/')
+    
+    # Clients sending too many uploads are turned away before any body is decoded
+    if method == 'POST':
+        wait = rate_limiter.check(rate_limit.client_key(event))
+        if wait:
+            metrics.set_route('POST rate_limited')
+            return rate_limited_response(wait)
+        
+        # A retry carrying the same Idempotency-Key gets the first response back, without a second upload
+        return idempotency.run(table, event, context, lambda: dispatch(event, context, method, path))
+    
+    return dispatch(event, context, method, path)
+
+def dispatch(event, context, method, path):
+    # Resumable uploads: /uploads/chunked[/{id}[/{chunk number} | /complete]]
+    # (each step sets its own metrics route)
+    if path.startswith('/uploads/chunked'):
+        return handle_chunked_upload(event, context, method, path.strip('/').split('/')[2:])
+    
+    # Newest uploads first, one page at a time
+    elif method == 'GET' and path == '/uploads':
+        metrics.set_route('GET /uploads')
+        return list_uploads(event)
+    
+    # Many uploads as one ZIP: ?ids=a,b,c or ?description=text (or the same as a JSON body)
+    elif method in ('GET', 'POST') and path == '/uploads/archive':
+        metrics.set_route(f'{method} /uploads/archive')
+        return download_archive(event)
+    
+    # Ranked prefix search over descriptions and filenames: ?q=text
+    elif method == 'GET' and path == '/uploads/search':
+        metrics.set_route('GET /uploads/search')
+        return search_uploads(event)
+    
+    # A fresh download link for one upload: /uploads/{id}/url
+    elif method == 'GET' and path.startswith('/uploads/') and path.endswith('/url'):
+        metrics.set_route('GET /uploads/{id}/url')
+        return get_download_url(path[len('/uploads/'):-len('/url')])
+    
     # Handle GET request - show upload form
-    if event['requestContext']['http']['method'] == 'GET':
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'text/html',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': show_upload_form()
-        }
+    elif method == 'GET':
+        metrics.set_route('GET /')
+        return UPLOAD_FORM.respond(event.get('headers'))
+    
+    # Direct-to-S3 uploads: hand out a presigned PUT, then record the item once the object exists
+    elif method == 'POST' and path == '/uploads/presign':
+        metrics.set_route('POST /uploads/presign')
+        return create_direct_upload(event)
+    
+    elif method == 'POST' and path == '/uploads/complete':
+        metrics.set_route('POST /uploads/complete')
+        return complete_direct_upload(event, context)
+    
+    # Many files in one multipart post
+    elif method == 'POST' and path == '/uploads/batch':
+        metrics.set_route('POST /uploads/batch')
+        return handle_batch_upload(event, context)
     
     # Handle POST request - process file upload
-    elif event['requestContext']['http']['method'] == 'POST':
-        try:
-            # Parse the multipart form data
-            content_type = event['headers'].get('content-type', event['headers'].get('Content-Type', ''))
-            if 'multipart/form-data' not in content_type:
-                return {
-                    'statusCode': 400,
-                    'headers': {
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({'error': 'Invalid content type. Expected multipart/form-data'})
-                }
-            
-            # Parse the body (base64 encoded if isBase64Encoded is true)
-            body = event['body']
-            if event.get('isBase64Encoded', False):
-                body = base64.b64decode(body)
-            else:
-                body = body.encode('utf-8')
-            
-            # Parse multipart form data
-            boundary = content_type.split("boundary=")[1].encode('utf-8')
-            parts = body.split(b'--' + boundary)
-            
-            file_data = None
-            filename = None
-            description = None
-            
-            for part in parts:
-                if b'Content-Disposition: form-data;' in part:
-                    header_end = part.find(b'\r\n\r\n')
-                    if header_end == -1:
-                        continue
-                    
-                    headers = part[:header_end].decode('utf-8')
-                    content = part[header_end+4:].rstrip(b'\r\n')
-                    
-                    if 'name="file"' in headers and 'filename="' in headers:
-                        # Extract filename
-                        filename_start = headers.find('filename="') + 10
-                        filename_end = headers.find('"', filename_start)
-                        filename = headers[filename_start:filename_end]
-                        file_data = content
-                    
-                    elif 'name="description"' in headers:
-                        description = content.decode('utf-8').strip()
-            
-            if not filename or not file_data:
-                return {
-                    'statusCode': 400,
-                    'headers': {
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({'error': 'File not found in request'})
-                }
-            
-            # Upload file to S3
-            file_id = str(uuid.uuid4())
-            file_key = f"uploads/{file_id}_{filename}"
-            
-            s3_client.put_object(
-                Bucket=BUCKET_NAME,
-                Key=file_key,
-                Body=file_data,
-                ContentType='application/octet-stream'
+    elif method == 'POST':
+        metrics.set_route('POST /')
+        return handle_form_upload(event, context)
+    
+    # Handle other methods
+    else:
+        return json_response(405, {'error': 'Method not allowed'})
+
+def json_response(status_code, payload):
+    return {
+        'statusCode': status_code,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*'
+        },
+        'body': json.dumps(payload, separators=(',', ':'))
+    }
+
+def error_response(error):
+    metrics.failed(error)
+    return json_response(500, {'error': str(error)})
+
+def html_response(body):
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'text/html',
+            'Access-Control-Allow-Origin': '*'
+        },
+        'body': body
+    }
+
+def read_body(event):
+    # Parse the body (base64 encoded if isBase64Encoded is true)
+    with metrics.phase('decode'):
+        body = event.get('body') or ''
+        if event.get('isBase64Encoded', False):
+            body = base64.b64decode(body)
+        else:
+            body = body.encode('utf-8')
+    metrics.add_bytes('body', len(body))
+    return body
+
+def read_form(event):
+    # Size, part count and file types are checked before and during the decode
+    content_type = event['headers'].get('content-type', event['headers'].get('Content-Type', ''))
+    with metrics.phase('decode'):
+        body = admission.read_form(event, content_type)
+    metrics.add_bytes('body', len(body))
+    return body, content_type
+
+def rejected_response(event, error):
+    metrics.count('rejected')
+    metrics.add_bytes('rejected', len(event.get('body') or ''))
+    return json_response(error.status, {'error': str(error)})
+
+def rate_limited_response(wait):
+    metrics.count('rate_limited')
+    response = json_response(429, {'error': 'Too many uploads, retry later'})
+    response['headers']['Retry-After'] = rate_limit.retry_after(wait)
+    return response
+
+def make_file_key(file_id, filename):
+    # Keep the object under uploads/ whatever the client sends as a name
+    safe_name = filename.replace('/', '_').replace('\\', '_')
+    return f"uploads/{file_id}_{safe_name}"
+
+def presign_download(file_key, filename=None):
+    return download_url(file_key, filename)[0]
+
+# Returns (url, seconds it stays valid)
+def download_url(file_key, filename=None):
+    params = {'Bucket': BUCKET_NAME, 'Key': file_key}
+    if filename:
+        # Content-addressed keys carry no name, so the link supplies it. Inline: the
+        # browser still renders what it can (stored types are never active content)
+        params['ResponseContentDisposition'] = f"inline; filename*=UTF-8''{quote(filename)}"
+    with metrics.phase('presign'):
+        return download_urls.get(
+            (file_key, filename),
+            URL_EXPIRATION,
+            lambda: aws_clients.s3().generate_presigned_url('get_object', Params=params, ExpiresIn=URL_EXPIRATION)
+        )
+
+def metadata_item(file_id, filename, description, file_key, context, status='complete', content_hash=None):
+    item = {
+        'id': file_id,
+        'filename': filename,
+        'description': description or '',
+        's3_key': file_key,
+        'upload_date': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
+        'request_id': str(context.aws_request_id),
+        'status': status
+    }
+    if content_hash:
+        item['content_hash'] = content_hash
+    # Only finished uploads carry the index key, so pending ones stay out of the listing
+    if status == 'complete':
+        item[GALLERY_KEY] = GALLERY_PARTITION
+    return item
+
+def save_metadata(file_id, filename, description, file_key, context):
+    item = metadata_item(file_id, filename, description, file_key, context)
+    table.put_item(Item=item)
+    index_uploads([item])
+
+# Runs fn on the executor in a copy of the caller's context, so phases and
+# counts it records land in this request's metrics line
+def submit(fn, *args, **kwargs):
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+def store_upload(file_id, filename, description, file_data, context):
+    # Identical bytes share one object, stored under their SHA-256
+    metrics.add_bytes('file', len(file_data))
+    with metrics.phase('hash'):
+        digest = dedup.content_hash(file_data)
+    file_key = dedup.content_key(digest)
+    
+    # Seen these bytes before: no S3 PUT, just a new item pointing at the object
+    with metrics.phase('dynamodb_claim'):
+        claimed = dedup.claim(table, digest, len(file_data))
+    if not claimed:
+        item = metadata_item(file_id, filename, description, file_key, context, content_hash=digest)
+        with metrics.phase('dynamodb_write'):
+            table.put_item(Item=item)
+        index_uploads([item])
+        return presign_download(file_key, filename)
+    
+    # Real type from the magic bytes; text-like files may be stored gzip-encoded
+    with metrics.phase('prepare'):
+        body, extra = content_types.prepare_body(file_data, content_types.sniff(file_data, filename))
+    metrics.add_bytes('stored', len(body))
+    
+    # The item is written as "pending" while the object uploads, then committed
+    item = metadata_item(
+        file_id, filename, description, file_key, context, status='pending', content_hash=digest
+    )
+    pending_write = submit(table.put_item, Item=item)
+    
+    try:
+        # One PUT: form uploads are far below s3_upload.MULTIPART_THRESHOLD
+        with metrics.phase('s3_put'):
+            s3_upload.upload_buffer(aws_clients.s3(), BUCKET_NAME, file_key, body, **extra)
+        
+        # Only the part of the metadata writes that the S3 upload didn't hide
+        with metrics.phase('dynamodb_write'):
+            pending_write.result()
+            table.update_item(
+                Key={'id': file_id},
+                UpdateExpression='SET #status = :complete, #gallery = :gallery',
+                ConditionExpression='#status = :pending',
+                ExpressionAttributeNames={'#status': 'status', '#gallery': GALLERY_KEY},
+                ExpressionAttributeValues={':complete': 'complete', ':pending': 'pending', ':gallery': GALLERY_PARTITION}
             )
-            
-            # Generate a presigned URL for the uploaded file
-            presigned_url = s3_client.generate_presigned_url(
-                'get_object',
-                Params={'Bucket': BUCKET_NAME, 'Key': file_key},
-                ExpiresIn=3600
+    except Exception:
+        # Nothing committed, so nothing follows: roll back the pending item and the hash claim
+        discard_pending(pending_write, file_id, digest)
+        raise
+    item.update({'status': 'complete', GALLERY_KEY: GALLERY_PARTITION})
+    
+    # Follow-ups start only once the item is committed
+    stored = submit(dedup.mark_stored, table, digest)
+    queued = submit(queue_followups, [(file_id, file_key, extra['ContentType'])])
+    indexed = submit(index_uploads, [item])
+    with metrics.phase('dynamodb_write'):
+        try:
+            stored.result()
+        except Exception:
+            # The upload itself succeeded; later copies of these bytes just upload again
+            metrics.count('dedup_failed')
+    queued.result()
+    indexed.result()
+    return presign_download(file_key, filename)
+
+# Undoes a store_upload that failed before its commit. The object stays: a
+# concurrent upload of the same bytes may already point at it.
+def discard_pending(pending_write, file_id, digest):
+    try:
+        # Once its write has settled, and only while it is still pending
+        if pending_write.exception() is None:
+            table.delete_item(
+                Key={'id': file_id},
+                ConditionExpression='#status = :pending',
+                ExpressionAttributeNames={'#status': 'status'},
+                ExpressionAttributeValues={':pending': 'pending'}
             )
+    except Exception:
+        pass
+    try:
+        dedup.release(table, digest)
+    except Exception:
+        pass
+
+# Work that doesn't have to finish before the response goes to the job queue
+# (jobs.py); nothing is queued while JOBS_BACKEND is off
+def queue_followups(uploads):
+    followups = [
+        ('image.variants', file_id, {'bucket': BUCKET_NAME, 'key': file_key})
+        for file_id, file_key, content_type in uploads if content_type.startswith('image/')
+    ]
+    if not followups or not jobs.enabled():
+        return
+    try:
+        jobs.enqueue(followups)
+        metrics.count('jobs_queued', len(followups))
+    except Exception:
+        # The upload itself succeeded; a lost follow-up only shows up as missing variants
+        metrics.count('jobs_failed', len(followups))
+
+# New uploads become searchable through search.py: queued for the job worker,
+# or indexed here while JOBS_BACKEND is off
+def index_uploads(items):
+    if not items:
+        return
+    try:
+        with metrics.phase('index'):
+            if search.submit(aws_clients.s3(), BUCKET_NAME, items) is False:
+                # Searchable after the next merger run rather than right away
+                metrics.count('index_parked', len(items))
+    except Exception:
+        # The upload itself succeeded; it is only missing from search results
+        metrics.count('index_failed', len(items))
+
+# The files and description of a multipart upload form, for the single and batch routes.
+# Admission and parse errors propagate to the caller.
+def read_upload_form(event):
+    body, content_type = read_form(event)
+    
+    # Parts are memoryview slices over the decoded body, nothing is copied
+    files = []
+    description = None
+    
+    with metrics.phase('multipart'):
+        for part in multipart.iter_parts(body, content_type):
+            if part.name == 'file' and part.filename and part.size:
+                files.append((part.filename, part.data))
             
-            # Save metadata to DynamoDB
-            table.put_item(
-                Item={
-                    'id': file_id,
-                    'filename': filename,
-                    'description': description or '',
-                    's3_key': file_key,
-                    'upload_date': str(context.aws_request_id),
-                    'presigned_url': presigned_url
-                }
+            elif part.name == 'description':
+                description = part.text.strip()
+    
+    return files, description
+
+def handle_form_upload(event, context):
+    try:
+        # Parse the multipart form data
+        files, description = read_upload_form(event)
+        if not files:
+            return json_response(400, {'error': 'File not found in request'})
+        
+        # A multi-file post is a batch; keep every file instead of only the last
+        if len(files) > 1:
+            return upload_many(files, description, context)
+        filename, file_data = files[0]
+        
+        # Upload to S3 and record the metadata at the same time
+        file_id = str(uuid.uuid4())
+        presigned_url = store_upload(file_id, filename, description, file_data, context)
+        
+        return html_response(show_success_message(filename, file_id, presigned_url))
+        
+    except admission.Rejected as e:
+        return rejected_response(event, e)
+    
+    except multipart.MultipartError as e:
+        return json_response(400, {'error': str(e)})
+    
+    except Exception as e:
+        return error_response(e)
+
+def handle_batch_upload(event, context):
+    try:
+        files, description = read_upload_form(event)
+        if not files:
+            return json_response(400, {'error': 'File not found in request'})
+        return upload_many(files, description, context)
+    
+    except admission.Rejected as e:
+        return rejected_response(event, e)
+    
+    except multipart.MultipartError as e:
+        return json_response(400, {'error': str(e)})
+    
+    except Exception as e:
+        return error_response(e)
+
+def upload_many(files, description, context):
+    if len(files) > batch_upload.MAX_FILES:
+        return json_response(400, {'error': f'At most {batch_upload.MAX_FILES} files per request'})
+    
+    uploads = []
+    for filename, data in files:
+        file_id = str(uuid.uuid4())
+        file_key = make_file_key(file_id, filename)
+        item = metadata_item(file_id, filename, description, file_key, context)
+        uploads.append((file_key, data, item))
+    
+    # S3 PUTs and the BatchWriteItem overlap across files, so they are timed together
+    with metrics.phase('batch_upload'):
+        results = batch_upload.upload_batch(aws_clients.s3(), table, BUCKET_NAME, uploads)
+    
+    report = []
+    for (_, _, item), result in zip(uploads, results):
+        entry = {'id': item['id'], 'filename': item['filename'], 'status': result['status']}
+        if result['status'] == 'uploaded':
+            entry['download_url'] = presign_download(item['s3_key'])
+        else:
+            entry['error'] = result['error']
+        report.append(entry)
+    
+    queue_followups([
+        (item['id'], item['s3_key'], result['content_type'])
+        for (_, _, item), result in zip(uploads, results) if result['status'] == 'uploaded'
+    ])
+    index_uploads([item for (_, _, item), result in zip(uploads, results) if result['status'] == 'uploaded'])
+    
+    all_uploaded = all(entry['status'] == 'uploaded' for entry in report)
+    return json_response(200 if all_uploaded else 207, {'files': report})
+
+def encode_cursor(last_key):
+    return base64.urlsafe_b64encode(json.dumps(last_key, separators=(',', ':')).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    padded = cursor + '=' * (-len(cursor) % 4)
+    last_key = json.loads(base64.urlsafe_b64decode(padded))
+    if not isinstance(last_key, dict) or set(last_key) != {'id', GALLERY_KEY, 'upload_date'}:
+        raise ValueError('Invalid cursor')
+    return last_key
+
+def list_uploads(event):
+    params = event.get('queryStringParameters') or {}
+    try:
+        limit = min(max(int(params.get('limit', LIST_PAGE_SIZE)), 1), LIST_MAX_PAGE_SIZE)
+        query = {
+            'IndexName': GALLERY_INDEX,
+            'KeyConditionExpression': '#gallery = :gallery',
+            'ExpressionAttributeNames': {'#gallery': GALLERY_KEY},
+            'ExpressionAttributeValues': {':gallery': GALLERY_PARTITION},
+            # Only what the listing shows comes back from the index
+            'ProjectionExpression': 'id, filename, description, upload_date, s3_key',
+            'ScanIndexForward': False,
+            'Limit': limit
+        }
+        if params.get('cursor'):
+            query['ExclusiveStartKey'] = decode_cursor(params['cursor'])
+    except (ValueError, TypeError):
+        return json_response(400, {'error': 'Invalid limit or cursor'})
+    
+    try:
+        with metrics.phase('dynamodb_query'):
+            response = table.query(**query)
+    except Exception as e:
+        return error_response(e)
+    
+    items = response.get('Items', [])
+    for item in items:
+        add_download_url(item)
+    
+    page = {'items': items}
+    if response.get('LastEvaluatedKey'):
+        page['cursor'] = encode_cursor(response['LastEvaluatedKey'])
+    return json_response(200, page)
+
+# Swaps an item's s3_key for a signed link; repeat views reuse links signed earlier
+def add_download_url(item):
+    s3_key = item.pop('s3_key', None)
+    if s3_key:
+        item['download_url'] = presign_download(s3_key, item.get('filename') if dedup.is_content_key(s3_key) else None)
+    return item
+
+def search_uploads(event):
+    params = event.get('queryStringParameters') or {}
+    text = (params.get('q') or '').strip()
+    if not text:
+        return json_response(400, {'error': 'q is required'})
+    try:
+        limit = min(max(int(params.get('limit', LIST_PAGE_SIZE)), 1), LIST_MAX_PAGE_SIZE)
+    except (ValueError, TypeError):
+        return json_response(400, {'error': 'Invalid limit'})
+    
+    try:
+        with metrics.phase('search'):
+            hits = search.query(aws_clients.s3(), BUCKET_NAME, text, limit)
+        # The index only holds ids; what the results show comes from the table
+        with metrics.phase('dynamodb_query'):
+            found = table.batch_get(
+                [{'id': file_id} for file_id, _ in hits],
+                ProjectionExpression='id, filename, description, upload_date, s3_key, #status',
+                ExpressionAttributeNames={'#status': 'status'}
+            ) if hits else []
+    except Exception as e:
+        return error_response(e)
+    
+    by_id = {item['id']: item for item in found if item.pop('status', None) == 'complete'}
+    items = []
+    for file_id, score in hits:
+        if file_id in by_id:
+            item = add_download_url(by_id[file_id])
+            item['score'] = round(score, 4)
+            items.append(item)
+    return json_response(200, {'query': text, 'items': items})
+
+def get_download_url(file_id):
+    try:
+        item = table.get_item(
+            Key={'id': file_id},
+            ProjectionExpression='s3_key, filename, #status',
+            ExpressionAttributeNames={'#status': 'status'}
+        ).get('Item')
+    except Exception as e:
+        return error_response(e)
+    
+    if not item or item.get('status') != 'complete':
+        return json_response(404, {'error': 'Upload not found'})
+    
+    s3_key = item['s3_key']
+    # Content-addressed keys carry no name, so the download gets it from the item
+    url, expires_in = download_url(s3_key, item.get('filename') if dedup.is_content_key(s3_key) else None)
+    return json_response(200, {'id': file_id, 'download_url': url, 'expires_in': expires_in})
+
+def archive_items(request):
+    ids = request.get('ids') or []
+    if isinstance(ids, str):
+        ids = [i for i in ids.split(',') if i]
+    if ids:
+        ids = list(dict.fromkeys(ids))[:archive.MAX_FILES]
+        found = table.batch_get(
+            [{'id': file_id} for file_id in ids],
+            ProjectionExpression='id, s3_key, filename, #status',
+            ExpressionAttributeNames={'#status': 'status'}
+        )
+        by_id = {item['id']: item for item in found if item.get('status') == 'complete'}
+        return [by_id[file_id] for file_id in ids if file_id in by_id]
+    
+    text = (request.get('description') or '').strip()
+    if not text:
+        raise ValueError('ids or description is required')
+    items, query = [], {
+        'IndexName': GALLERY_INDEX,
+        'KeyConditionExpression': '#gallery = :gallery',
+        'FilterExpression': 'contains(description, :text)',
+        'ExpressionAttributeNames': {'#gallery': GALLERY_KEY},
+        'ExpressionAttributeValues': {':gallery': GALLERY_PARTITION, ':text': text},
+        'ProjectionExpression': 'id, s3_key, filename',
+        'ScanIndexForward': False
+    }
+    while len(items) < archive.MAX_FILES:
+        response = table.query(**query)
+        items.extend(response.get('Items', []))
+        if not response.get('LastEvaluatedKey'):
+            break
+        query['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    return items[:archive.MAX_FILES]
+
+def download_archive(event):
+    try:
+        request = dict(event.get('queryStringParameters') or {})
+        if event['requestContext']['http']['method'] == 'POST':
+            request.update(json.loads(read_body(event) or b'{}'))
+        items = archive_items(request)
+    except ValueError as e:
+        return json_response(400, {'error': str(e)})
+    except Exception as e:
+        return error_response(e)
+    
+    if not items:
+        return json_response(404, {'error': 'No uploads matched'})
+    
+    try:
+        # Objects are read with ranged GETs and zipped as they arrive; big archives go to S3 instead of the response
+        archive_key = f'archives/{uuid.uuid4()}.zip'
+        with metrics.phase('archive'):
+            data, stored_key = archive.build(
+                aws_clients.s3(),
+                BUCKET_NAME,
+                [(item['s3_key'], item.get('filename')) for item in items],
+                archive_key
             )
-            
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Content-Type': 'text/html',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': show_success_message(filename, file_id, presigned_url)
-            }
-            
-        except Exception as e:
-            return {
-                'statusCode': 500,
-                'headers': {
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({'error': str(e)})
-            }
+    except Exception as e:
+        return error_response(e)
     
-    # Handle other methods
-    else:
+    if data is not None:
+        metrics.add_bytes('archive', len(data))
         return {
-            'statusCode': 405,
+            'statusCode': 200,
             'headers': {
+                'Content-Type': 'application/zip',
+                'Content-Disposition': 'attachment; filename="uploads.zip"',
                 'Access-Control-Allow-Origin': '*'
             },
-            'body': json.dumps({'error': 'Method not allowed'})
+            'body': base64.b64encode(data).decode('ascii'),
+            'isBase64Encoded': True
         }
+    
+    url, expires_in = download_url(stored_key, 'uploads.zip')
+    response = json_response(303, {'files': len(items), 'download_url': url, 'expires_in': expires_in})
+    response['headers']['Location'] = url
+    return response
+
+def create_direct_upload(event):
+    try:
+        request = json.loads(read_body(event) or b'{}')
+        filename = (request.get('filename') or '').strip()
+        if not filename:
+            return json_response(400, {'error': 'filename is required'})
+        admission.check_file(filename, request.get('content_type'))
+        # The URL is signed for this type, so it must be one the bucket can safely serve
+        content_type = content_types.declared_type(request.get('content_type'), filename)
+        
+        file_id = str(uuid.uuid4())
+        file_key = make_file_key(file_id, filename)
+        
+        # The browser PUTs the bytes straight to S3, Lambda never sees them
+        upload_url = aws_clients.s3().generate_presigned_url(
+            'put_object',
+            Params={'Bucket': BUCKET_NAME, 'Key': file_key, 'ContentType': content_type},
+            ExpiresIn=UPLOAD_URL_EXPIRATION
+        )
+        
+        return json_response(200, {
+            'file_id': file_id,
+            'key': file_key,
+            'method': 'PUT',
+            'url': upload_url,
+            'headers': {'Content-Type': content_type}
+        })
+    
+    except admission.Rejected as e:
+        return rejected_response(event, e)
+    
+    except ValueError:
+        return json_response(400, {'error': 'Request body must be JSON'})
+    
+    except Exception as e:
+        return error_response(e)
+
+def complete_direct_upload(event, context):
+    try:
+        request = json.loads(read_body(event) or b'{}')
+        file_id = request.get('file_id') or ''
+        filename = (request.get('filename') or '').strip()
+        if not file_id or not filename:
+            return json_response(400, {'error': 'file_id and filename are required'})
+        
+        try:
+            uuid.UUID(file_id)
+        except ValueError:
+            return json_response(400, {'error': 'Invalid file_id'})
+        
+        file_key = make_file_key(file_id, filename)
+        
+        # Only record the upload once the object is really in the bucket
+        try:
+            aws_clients.s3().head_object(Bucket=BUCKET_NAME, Key=file_key)
+        except Exception as e:
+            if aws_clients.is_missing(e):
+                return json_response(409, {'error': 'Upload not found in bucket'})
+            raise
+        
+        save_metadata(file_id, filename, request.get('description'), file_key, context)
+        
+        return html_response(show_success_message(filename, file_id, presign_download(file_key)))
+    
+    except ValueError:
+        return json_response(400, {'error': 'Request body must be JSON'})
+    
+    except Exception as e:
+        return error_response(e)
+
+def handle_chunked_upload(event, context, method, segments):
+    try:
+        # Start a session and tell the client how to cut the file
+        if method == 'POST' and not segments:
+            metrics.set_route('POST /uploads/chunked')
+            request = json.loads(read_body(event) or b'{}')
+            filename = (request.get('filename') or '').strip()
+            if not filename:
+                return json_response(400, {'error': 'filename is required'})
+            admission.check_file(filename, request.get('content_type'))
+            
+            file_id = str(uuid.uuid4())
+            session = chunked_upload.init_upload(
+                table,
+                file_id,
+                filename,
+                make_file_key(file_id, filename),
+                int(request.get('size') or 0),
+                request.get('description'),
+                content_types.declared_type(request.get('content_type'), filename)
+            )
+            return json_response(200, session)
+        
+        file_id = segments[0] if segments else ''
+        
+        # Which chunks still need to be sent
+        if method == 'GET' and len(segments) == 1:
+            metrics.set_route('GET /uploads/chunked/{id}')
+            item = chunked_upload.get_session(table, file_id)
+            return json_response(200, {
+                'file_id': file_id,
+                'chunk_size': int(item['chunk_size']),
+                'total_chunks': int(item['total_chunks']),
+                'missing': chunked_upload.missing_chunks(item)
+            })
+        
+        if method == 'PUT' and len(segments) == 2 and segments[1].isdigit():
+            metrics.set_route('PUT /uploads/chunked/{id}/{chunk}')
+            admission.check_size(event)
+            chunked_upload.put_chunk(aws_clients.s3(), table, BUCKET_NAME, file_id, int(segments[1]), read_body(event))
+            return json_response(200, {'file_id': file_id, 'chunk': int(segments[1])})
+        
+        if method == 'POST' and len(segments) == 2 and segments[1] == 'complete':
+            metrics.set_route('POST /uploads/chunked/{id}/complete')
+            item = chunked_upload.complete_upload(aws_clients.s3(), table, BUCKET_NAME, file_id)
+            # A repeated complete finds the file already recorded and only answers again
+            if GALLERY_KEY not in item:
+                save_metadata(file_id, item['filename'], item.get('description'), item['s3_key'], context)
+            return html_response(show_success_message(item['filename'], file_id, presign_download(item['s3_key'])))
+        
+        return json_response(404, {'error': 'Not found'})
+    
+    except chunked_upload.ChunkedUploadError as e:
+        return json_response(409, {'error': str(e)})
+    
+    except admission.Rejected as e:
+        return rejected_response(event, e)
+    
+    except ValueError:
+        return json_response(400, {'error': 'Invalid request'})
+    
+    except Exception as e:
+        return error_response(e)
+
+# What a warm-up event primes, in order. Every step only reads.
+def warmup_steps():
+    steps = [
+        ('s3', lambda: warmup.connect_s3(BUCKET_NAME)),
+        ('dynamodb', lambda: warmup.connect_dynamodb(TABLE_NAME))
+    ]
+    if jobs.BACKEND == 'sqs':
+        steps.append(('sqs', warmup.connect_queue))
+    steps += [
+        ('templates', warm_templates),
+        ('presign', lambda: aws_clients.s3().generate_presigned_url(
+            'get_object', Params={'Bucket': BUCKET_NAME, 'Key': 'uploads/warmup'}, ExpiresIn=60
+        )),
+        # The first page of the listing, with its download links signed into download_urls
+        ('gallery', warm_gallery)
+    ]
+    if search.ENABLED:
+        steps.append(('search', lambda: search.segments(aws_clients.s3(), BUCKET_NAME)))
+    return steps
+
+def warm_templates():
+    show_success_message('warm-up \u0936\u0941\u092d.jpg', str(uuid.uuid4()), 'https://example.com/')
+    for accept_encoding in ('br, gzip', 'gzip', ''):
+        UPLOAD_FORM.respond({'accept-encoding': accept_encoding})
+
+def warm_gallery():
+    response = list_uploads({})
+    if response['statusCode'] != 200:
+        raise RuntimeError(response['body'])
 
 def show_upload_form():
     return """
@@ -446,14 +1094,14 @@ def show_upload_form():
             <h1>Sacred Temple Upload</h1>
             <p class="subtitle">Offer your files to the digital temple of Majisimpleb</p>
             
-            <form method="POST" enctype="multipart/form-data">
+            <form id="upload-form" method="POST" enctype="multipart/form-data">
                 <div class="form-group">
                     <label for="description">Blessing Message (Description):</label>
                     <input type="text" id="description" name="description" placeholder="Enter a blessing for your file">
                 </div>
                 <div class="form-group">
                     <label for="file">Select your sacred offering (File):</label>
-                    <input type="file" id="file" name="file" required>
+                    <input type="file" id="file" name="file" multiple required>
                 </div>
                 <button type="submit" class="upload-btn">Offer to the Temple</button>
             </form>
@@ -495,6 +1143,163 @@ def show_upload_form():
                     requestAnimationFrame(updateFloat);
                 }
                 updateFloat();
+                
+                // Upload straight from the browser to S3, falling back to a normal form post
+                const form = document.getElementById('upload-form');
+                const button = form.querySelector('.upload-btn');
+                const CHUNKED_THRESHOLD = 4 * 1024 * 1024;
+                let directUpload = true;
+                
+                async function postJson(url, payload) {
+                    const response = await fetch(url, {
+                        method: 'POST',
+                        headers: {'Content-Type': 'application/json'},
+                        body: JSON.stringify(payload)
+                    });
+                    if (!response.ok) {
+                        throw new Error(url + ' failed');
+                    }
+                    return response;
+                }
+                
+                async function uploadDirect(file, description) {
+                    const target = await (await postJson('uploads/presign', {filename: file.name, content_type: file.type})).json();
+                    
+                    const put = await fetch(target.url, {method: target.method, headers: target.headers, body: file});
+                    if (!put.ok) {
+                        throw new Error('upload failed');
+                    }
+                    
+                    return postJson('uploads/complete', {file_id: target.file_id, filename: file.name, description: description});
+                }
+                
+                // Large files go in numbered chunks; only the missing ones are resent,
+                // even after a page reload (the session id is kept in localStorage)
+                async function uploadChunked(file, description) {
+                    const resumeKey = 'temple-upload:' + file.name + ':' + file.size + ':' + file.lastModified;
+                    let session = null;
+                    
+                    const savedId = localStorage.getItem(resumeKey);
+                    if (savedId) {
+                        const status = await fetch('uploads/chunked/' + savedId);
+                        if (status.ok) {
+                            session = await status.json();
+                        }
+                    }
+                    if (!session) {
+                        session = await (await postJson('uploads/chunked', {
+                            filename: file.name,
+                            size: file.size,
+                            content_type: file.type,
+                            description: description
+                        })).json();
+                        session.missing = Array.from({length: session.total_chunks}, (_, i) => i + 1);
+                        localStorage.setItem(resumeKey, session.file_id);
+                    }
+                    
+                    const base = 'uploads/chunked/' + session.file_id;
+                    for (let attempt = 0; session.missing.length && attempt < 5; attempt++) {
+                        for (const number of session.missing) {
+                            const start = (number - 1) * session.chunk_size;
+                            try {
+                                await fetch(base + '/' + number, {
+                                    method: 'PUT',
+                                    headers: {'Content-Type': 'application/octet-stream'},
+                                    body: file.slice(start, start + session.chunk_size)
+                                });
+                            } catch (err) {
+                                // Picked up again by the status check below
+                            }
+                            const sent = session.total_chunks - session.missing.length + session.missing.indexOf(number) + 1;
+                            button.textContent = 'Offering... ' + Math.round(100 * sent / session.total_chunks) + '%';
+                        }
+                        const status = await fetch(base);
+                        if (status.ok) {
+                            session.missing = (await status.json()).missing;
+                        }
+                    }
+                    if (session.missing.length) {
+                        throw new Error('chunks still missing');
+                    }
+                    
+                    const done = await postJson(base + '/complete', {});
+                    localStorage.removeItem(resumeKey);
+                    return done;
+                }
+                
+                // Several files: one multipart post to the batch endpoint, results listed in place
+                async function uploadBatch(files, description) {
+                    const data = new FormData();
+                    data.append('description', description);
+                    for (const file of files) {
+                        data.append('file', file, file.name);
+                    }
+                    const response = await fetch('uploads/batch', {method: 'POST', body: data});
+                    if (response.status !== 200 && response.status !== 207) {
+                        throw new Error('batch upload failed');
+                    }
+                    
+                    const list = document.createElement('ul');
+                    for (const entry of (await response.json()).files) {
+                        const row = document.createElement('li');
+                        if (entry.download_url) {
+                            const link = document.createElement('a');
+                            link.href = entry.download_url;
+                            link.textContent = entry.filename;
+                            row.appendChild(link);
+                        } else {
+                            row.textContent = entry.filename + ' (failed: ' + entry.error + ')';
+                        }
+                        list.appendChild(row);
+                    }
+                    const results = document.querySelector('.instructions');
+                    results.innerHTML = '<h3>Your offerings were received:</h3>';
+                    results.appendChild(list);
+                }
+                
+                form.addEventListener('submit', async function(event) {
+                    const files = document.getElementById('file').files;
+                    const file = files[0];
+                    if (!directUpload || !file || !window.fetch) {
+                        return;
+                    }
+                    event.preventDefault();
+                    
+                    button.disabled = true;
+                    button.textContent = 'Offering...';
+                    const description = document.getElementById('description').value;
+                    
+                    if (files.length > 1) {
+                        try {
+                            await uploadBatch(files, description);
+                            button.textContent = 'Offer to the Temple';
+                        } catch (err) {
+                            button.textContent = 'Try Again';
+                        }
+                        button.disabled = false;
+                        return;
+                    }
+                    
+                    try {
+                        const done = file.size > CHUNKED_THRESHOLD
+                            ? await uploadChunked(file, description)
+                            : await uploadDirect(file, description);
+                        
+                        document.open();
+                        document.write(await done.text());
+                        document.close();
+                    } catch (err) {
+                        if (file.size > CHUNKED_THRESHOLD) {
+                            // Too big to go through Lambda in one request; submitting again resumes
+                            button.disabled = false;
+                            button.textContent = 'Resume Offering';
+                            return;
+                        }
+                        // e.g. bucket CORS not configured: send the file through Lambda instead
+                        directUpload = false;
+                        form.submit();
+                    }
+                });
             });
         </script>
     </body>
@@ -502,7 +1307,11 @@ def show_upload_form():
     """
 
 def show_success_message(filename, file_id, presigned_url):
-    return f"""
+    with metrics.phase('render'):
+        return SUCCESS_PAGE.render(filename=filename, file_id=file_id, presigned_url=presigned_url)
+
+# Static parts are split once at import; every value is HTML-escaped when rendered
+SUCCESS_PAGE = templates.Template("""
     <!DOCTYPE html>
     <html lang="en">
     <head>
@@ -512,13 +1321,13 @@ def show_success_message(filename, file_id, presigned_url):
         <style>
             @import url('https://fonts.googleapis.com/css2?family=Playfair+Display:wght@400;700&family=Poppins:wght@300;400;500&display=swap');
             
-            * {{
+            * {
                 margin: 0;
                 padding: 0;
                 box-sizing: border-box;
-            }}
+            }
             
-            body {{
+            body {
                 font-family: 'Poppins', sans-serif;
                 background: linear-gradient(135deg, #1a2a6c, #b21f1f, #fdbb2d);
                 background-size: 400% 400%;
@@ -529,15 +1338,15 @@ def show_success_message(filename, file_id, presigned_url):
                 align-items: center;
                 overflow-x: hidden;
                 color: #fff;
-            }}
+            }
             
-            @keyframes gradientShift {{
-                0% {{ background-position: 0% 50% }}
-                50% {{ background-position: 100% 50% }}
-                100% {{ background-position: 0% 50% }}
-            }}
+            @keyframes gradientShift {
+                0% { background-position: 0% 50% }
+                50% { background-position: 100% 50% }
+                100% { background-position: 0% 50% }
+            }
             
-            .container {{
+            .container {
                 width: 90%;
                 max-width: 700px;
                 background: rgba(255, 255, 255, 0.1);
@@ -549,23 +1358,23 @@ def show_success_message(filename, file_id, presigned_url):
                 text-align: center;
                 position: relative;
                 z-index: 2;
-            }}
+            }
             
-            .success-icon {{
+            .success-icon {
                 font-size: 80px;
                 color: #4CAF50;
                 margin-bottom: 20px;
                 text-shadow: 0 0 20px rgba(76, 175, 80, 0.7);
                 animation: pulse 2s infinite;
-            }}
+            }
             
-            @keyframes pulse {{
-                0% {{ transform: scale(1); }}
-                50% {{ transform: scale(1.1); }}
-                100% {{ transform: scale(1); }}
-            }}
+            @keyframes pulse {
+                0% { transform: scale(1); }
+                50% { transform: scale(1.1); }
+                100% { transform: scale(1); }
+            }
             
-            h1 {{
+            h1 {
                 font-family: 'Playfair Display', serif;
                 margin-bottom: 10px;
                 font-size: 2.5rem;
@@ -573,40 +1382,40 @@ def show_success_message(filename, file_id, presigned_url):
                 background: linear-gradient(to right, #4CAF50, #8BC34A, #CDDC39);
                 -webkit-background-clip: text;
                 -webkit-text-fill-color: transparent;
-            }}
+            }
             
-            .subtitle {{
+            .subtitle {
                 margin-bottom: 30px;
                 font-size: 1.2rem;
                 opacity: 0.9;
-            }}
+            }
             
-            .offering-details {{
+            .offering-details {
                 background: rgba(255, 255, 255, 0.1);
                 border-radius: 15px;
                 padding: 25px;
                 margin: 25px 0;
                 text-align: left;
                 border-left: 4px solid #4CAF50;
-            }}
+            }
             
-            .offering-details p {{
+            .offering-details p {
                 margin-bottom: 15px;
                 font-size: 1.1rem;
-            }}
+            }
             
-            .offering-details strong {{
+            .offering-details strong {
                 color: #ffd700;
-            }}
+            }
             
-            .action-buttons {{
+            .action-buttons {
                 display: flex;
                 flex-direction: column;
                 gap: 15px;
                 margin: 30px 0;
-            }}
+            }
             
-            .btn {{
+            .btn {
                 padding: 15px 30px;
                 border: none;
                 border-radius: 10px;
@@ -617,38 +1426,38 @@ def show_success_message(filename, file_id, presigned_url):
                 text-decoration: none;
                 display: inline-block;
                 box-shadow: 0 5px 15px rgba(0, 0, 0, 0.2);
-            }}
+            }
             
-            .btn-primary {{
+            .btn-primary {
                 background: linear-gradient(45deg, #4CAF50, #8BC34A);
                 color: white;
-            }}
+            }
             
-            .btn-secondary {{
+            .btn-secondary {
                 background: rgba(255, 255, 255, 0.2);
                 color: white;
-            }}
+            }
             
-            .btn:hover {{
+            .btn:hover {
                 transform: translateY(-3px);
                 box-shadow: 0 10px 25px rgba(0, 0, 0, 0.3);
-            }}
+            }
             
-            .note {{
+            .note {
                 background: rgba(255, 193, 7, 0.2);
                 border-radius: 10px;
                 padding: 15px;
                 margin-top: 20px;
                 border-left: 4px solid #ffc107;
-            }}
+            }
             
-            .floating-element {{
+            .floating-element {
                 position: absolute;
                 opacity: 0.7;
                 z-index: 1;
-            }}
+            }
             
-            .floating-1 {{
+            .floating-1 {
                 top: 10%;
                 left: 5%;
                 width: 30px;
@@ -656,9 +1465,9 @@ def show_success_message(filename, file_id, presigned_url):
                 background: radial-gradient(circle, #4CAF50, transparent);
                 border-radius: 50%;
                 animation: float 6s ease-in-out infinite;
-            }}
+            }
             
-            .floating-2 {{
+            .floating-2 {
                 top: 20%;
                 right: 10%;
                 width: 40px;
@@ -666,9 +1475,9 @@ def show_success_message(filename, file_id, presigned_url):
                 background: radial-gradient(circle, #8BC34A, transparent);
                 border-radius: 50%;
                 animation: float 8s ease-in-out infinite 1s;
-            }}
+            }
             
-            .floating-3 {{
+            .floating-3 {
                 bottom: 30%;
                 left: 15%;
                 width: 25px;
@@ -676,14 +1485,14 @@ def show_success_message(filename, file_id, presigned_url):
                 background: radial-gradient(circle, #CDDC39, transparent);
                 border-radius: 50%;
                 animation: float 7s ease-in-out infinite 2s;
-            }}
+            }
             
-            @keyframes float {{
-                0%, 100% {{ transform: translateY(0) rotate(0deg); }}
-                50% {{ transform: translateY(-20px) rotate(180deg); }}
-            }}
+            @keyframes float {
+                0%, 100% { transform: translateY(0) rotate(0deg); }
+                50% { transform: translateY(-20px) rotate(180deg); }
+            }
             
-            .temple-gate {{
+            .temple-gate {
                 position: absolute;
                 bottom: -50px;
                 left: 50%;
@@ -693,22 +1502,22 @@ def show_success_message(filename, file_id, presigned_url):
                 background: linear-gradient(45deg, #5D4037, #6D4C41);
                 clip-path: polygon(0% 100%, 30% 0%, 70% 0%, 100% 100%);
                 z-index: 1;
-            }}
+            }
             
-            @media (max-width: 768px) {{
-                .container {{
+            @media (max-width: 768px) {
+                .container {
                     width: 95%;
                     padding: 20px;
-                }}
+                }
                 
-                h1 {{
+                h1 {
                     font-size: 2rem;
-                }}
+                }
                 
-                .action-buttons {{
+                .action-buttons {
                     flex-direction: column;
-                }}
-            }}
+                }
+            }
         </style>
     </head>
     <body>
@@ -722,13 +1531,13 @@ def show_success_message(filename, file_id, presigned_url):
             <p class="subtitle">The temple has blessed your file</p>
             
             <div class="offering-details">
-                <p><strong>Sacred Name:</strong> {filename}</p>
-                <p><strong>Offering ID:</strong> {file_id}</p>
-                <p><strong>Temple Blessing Link:</strong> <a href="{presigned_url}" style="color: #4CAF50; word-break: break-all;">Click to receive blessing</a></p>
+                <p><strong>Sacred Name:</strong> {{ filename }}</p>
+                <p><strong>Offering ID:</strong> {{ file_id }}</p>
+                <p><strong>Temple Blessing Link:</strong> <a href="{{ presigned_url }}" style="color: #4CAF50; word-break: break-all;">Click to receive blessing</a></p>
             </div>
             
             <div class="action-buttons">
-                <a href="{presigned_url}" class="btn btn-primary" target="_blank">Receive Blessing (Download)</a>
+                <a href="{{ presigned_url }}" class="btn btn-primary" target="_blank">Receive Blessing (Download)</a>
                 <a href="/" class="btn btn-secondary">Make Another Offering</a>
             </div>
             
@@ -742,24 +1551,24 @@ def show_success_message(filename, file_id, presigned_url):
         
         <script>
             // Add celebration animation
-            document.addEventListener('DOMContentLoaded', function() {{
+            document.addEventListener('DOMContentLoaded', function() {
                 const container = document.querySelector('.container');
                 
                 // Floating animation using Date instead of Math
-                function updateFloat() {{
+                function updateFloat() {
                     const time = new Date().getTime() / 1000;
                     const floatValue = time % 2 > 1 ? 5 - (time % 2) * 5 : (time % 2) * 5;
                     container.style.transform = 'translateY(' + floatValue + 'px)';
                     requestAnimationFrame(updateFloat);
-                }}
+                }
                 updateFloat();
                 
                 // Add floating particles on load
-                for (let i = 0; i < 20; i++) {{
+                for (let i = 0; i < 20; i++) {
                     createParticle();
-                }}
+                }
                 
-                function createParticle() {{
+                function createParticle() {
                     const particle = document.createElement('div');
                     particle.style.position = 'fixed';
                     particle.style.width = '5px';
@@ -778,28 +1587,40 @@ def show_success_message(filename, file_id, presigned_url):
                     
                     const startTime = Date.now();
                     
-                    function animateParticle() {{
+                    function animateParticle() {
                         const currentTime = Date.now();
                         const elapsed = currentTime - startTime;
                         const progress = elapsed / duration;
                         
-                        if (progress < 1) {{
+                        if (progress < 1) {
                             particle.style.transform = 'translateY(' + (targetY * progress) + 'vh) scale(' + (1 - progress) + ')';
                             particle.style.opacity = 0.7 * (1 - progress);
                             requestAnimationFrame(animateParticle);
-                        }} else {{
+                        } else {
                             particle.remove();
                             createParticle();
-                        }}
-                    }}
+                        }
+                    }
                     
                     animateParticle();
-                }}
-            }});
+                }
+            });
         </script>
     </body>
     </html>
     """
+)
+
+# Rendered and compressed once per container; every GET reuses it
+UPLOAD_FORM = precompressed.PrecompressedResponse(
+    show_upload_form(),
+    'text/html; charset=utf-8',
+    extra_headers={'Access-Control-Allow-Origin': '*'}
+)
+
+# Provisioned concurrency starts the environment ahead of traffic: prime it then
+if warmup.ON_INIT:
+    warmup.prime(warmup_steps())
 
 # For local testing
 if __name__ == "__main__":
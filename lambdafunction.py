@@ -1,102 +1,276 @@
-import boto3
-import base64
+import json
 import os
 import uuid
-from requests_toolbelt.multipart import decoder
 
-s3 = boto3.client("s3")
-dynamodb = boto3.resource("dynamodb")
+import admission
+import aws_clients
+import batch_upload
+import content_types
+import idempotency
+import metrics
+import multipart
+import precompressed
+import rate_limit
+import s3_upload
+import search
+import templates
+import warmup
 
 BUCKET_NAME = os.environ.get("BUCKET_NAME", "majhidisablewali")
 TABLE_NAME = os.environ.get("TABLE_NAME", "reels")
-table = dynamodb.Table(TABLE_NAME)
+
+# Clients are created lazily on the first POST
+table = aws_clients.Table(TABLE_NAME)
+
+# Uploads per client (rate_limit.py), counted in the same table
+rate_limiter = rate_limit.RateLimiter(table)
+
+# Built once per container and served pre-compressed
+UPLOAD_FORM = precompressed.PrecompressedResponse(
+    """
+    <html>
+    <head><title>Upload Form</title></head>
+    <body>
+        <h2>Upload File with Name & Caption</h2>
+        <form action="" method="post" enctype="multipart/form-data">
+            Name: <input type="text" name="name"><br><br>
+            Caption: <input type="text" name="caption"><br><br>
+            File: <input type="file" name="file"><br><br>
+            <input type="submit" value="Upload">
+        </form>
+    </body>
+    </html>
+    """,
+    "text/html; charset=utf-8"
+)
+
+# name and caption come straight from the form, so they are escaped when rendered
+SUCCESS_PAGE = templates.Template("""
+<html>
+<body>
+    <h2>Upload Successful!</h2>
+    <p><b>Name:</b> {{ name }}</p>
+    <p><b>Caption:</b> {{ caption }}</p>
+    <p><b>File URL:</b> <a href="{{ file_url }}" target="_blank">{{ file_url }}</a></p>
+</body>
+</html>
+""")
 
 
 def lambda_handler(event, context):
+    # Keep-warm pings: open connections and fill caches, nothing else
+    if warmup.is_warmup(event):
+        with metrics.request(event, context, route="warmup"):
+            return metrics.status(warmup.respond(warmup_steps()))
+
+    # Phase timings go to the log as one CloudWatch EMF line per request
+    with metrics.request(event, context):
+        return metrics.status(handle_request(event, context))
+
+
+def handle_request(event, context):
     method = event.get("requestContext", {}).get("http", {}).get("method", "GET")
 
-    # Serve HTML form
+    # Serve HTML form, or search results for ?q=text
     if method == "GET":
-        html_form = """
-        <html>
-        <head><title>Upload Form</title></head>
-        <body>
-            <h2>Upload File with Name & Caption</h2>
-            <form action="" method="post" enctype="multipart/form-data">
-                Name: <input type="text" name="name"><br><br>
-                Caption: <input type="text" name="caption"><br><br>
-                File: <input type="file" name="file"><br><br>
-                <input type="submit" value="Upload">
-            </form>
-        </body>
-        </html>
-        """
-        return {
-            "statusCode": 200,
-            "headers": {"Content-Type": "text/html"},
-            "body": html_form
-        }
+        params = event.get("queryStringParameters") or {}
+        if params.get("q"):
+            metrics.set_route("GET /?q")
+            return search_records(params["q"])
+        metrics.set_route("GET /")
+        return UPLOAD_FORM.respond(event.get("headers"))
 
     # Handle POST request
     elif method == "POST":
-        try:
-            body = base64.b64decode(event["body"])
-            content_type = event["headers"].get("content-type") or event["headers"].get("Content-Type")
+        # Clients sending too many uploads are turned away before the body is decoded
+        wait = rate_limiter.check(rate_limit.client_key(event))
+        if wait:
+            metrics.set_route("POST rate_limited")
+            metrics.count("rate_limited")
+            return {
+                "statusCode": 429,
+                "headers": {"Content-Type": "text/plain", "Retry-After": rate_limit.retry_after(wait)},
+                "body": "Too many uploads, retry later"
+            }
+
+        # A retry carrying the same Idempotency-Key gets the first response back, without a second upload
+        metrics.set_route("POST /")
+        return idempotency.run(table, event, context, lambda: handle_upload(event))
 
-            multipart_data = decoder.MultipartDecoder(body, content_type)
+    # Handle other methods
+    return {
+        "statusCode": 405,
+        "headers": {"Content-Type": "text/plain", "Allow": "GET, POST"},
+        "body": "Method not allowed"
+    }
 
-            name, caption, file_content, filename = None, None, None, None
 
-            for part in multipart_data.parts:
-                cd = part.headers[b'Content-Disposition'].decode()
-                if 'name="name"' in cd:
+def handle_upload(event):
+    try:
+        content_type = event["headers"].get("content-type") or event["headers"].get("Content-Type")
+        # Oversized bodies, extra parts and unwanted file types are refused before the decode finishes
+        with metrics.phase("decode"):
+            body = admission.read_form(event, content_type)
+        metrics.add_bytes("body", len(body))
+
+        name, caption, files = None, None, []
+
+        with metrics.phase("multipart"):
+            for part in multipart.iter_parts(body, content_type):
+                if part.name == "name":
                     name = part.text
-                elif 'name="caption"' in cd:
+                elif part.name == "caption":
                     caption = part.text
-                elif 'name="file"' in cd:
-                    file_content = part.content
-                    if "filename=" in cd:
-                        filename = cd.split("filename=")[1].strip('"')
-
-            if not (name and caption and file_content):
-                return {"statusCode": 400, "body": "Missing fields"}
-
-            # Save file to S3
-            unique_name = str(uuid.uuid4()) + "_" + (filename or "upload.bin")
-            s3_key = f"uploads/{unique_name}"
-            s3.put_object(Bucket=BUCKET_NAME, Key=s3_key, Body=file_content)
-
-            file_url = f"https://{BUCKET_NAME}.s3.amazonaws.com/{s3_key}"
-
-            # Save record in DynamoDB
-            table.put_item(
-                Item={
-                    "id": str(uuid.uuid4()),
-                    "name": name,
-                    "caption": caption,
-                    "file_url": file_url
-                }
-            )
-
-            success_html = f"""
-            <html>
-            <body>
-                <h2>Upload Successful!</h2>
-                <p><b>Name:</b> {name}</p>
-                <p><b>Caption:</b> {caption}</p>
-                <p><b>File URL:</b> <a href="{file_url}" target="_blank">{file_url}</a></p>
-            </body>
-            </html>
-            """
-            return {
-                "statusCode": 200,
-                "headers": {"Content-Type": "text/html"},
-                "body": success_html
-            }
+                elif part.name == "file" and part.size:
+                    files.append((part.filename, part.data))
 
-        except Exception as e:
-            return {
-                "statusCode": 500,
-                "headers": {"Content-Type": "text/plain"},
-                "body": f"Error: {str(e)}"
-            }
+        if not (name and caption and files):
+            return {"statusCode": 400, "body": "Missing fields"}
+
+        # Several files in one post: upload them together, one record each
+        if len(files) > 1:
+            return upload_many(name, caption, files)
+
+        filename, file_content = files[0]
+
+        # Save file to S3
+        unique_name = str(uuid.uuid4()) + "_" + (filename or "upload.bin")
+        s3_key = f"uploads/{unique_name}"
+        metrics.add_bytes("file", len(file_content))
+        with metrics.phase("prepare"):
+            body, extra = content_types.prepare_body(file_content, content_types.sniff(file_content, filename))
+        with metrics.phase("s3_put"):
+            s3_upload.upload_buffer(aws_clients.s3(), BUCKET_NAME, s3_key, body, **extra)
+
+        file_url = f"https://{BUCKET_NAME}.s3.amazonaws.com/{s3_key}"
+
+        # Save record in DynamoDB
+        item = {
+            "id": str(uuid.uuid4()),
+            "name": name,
+            "caption": caption,
+            "file_url": file_url
+        }
+        with metrics.phase("dynamodb_write"):
+            table.put_item(Item=item)
+        index_records([item])
+
+        with metrics.phase("render"):
+            success_html = SUCCESS_PAGE.render(name=name, caption=caption, file_url=file_url)
+        return {
+            "statusCode": 200,
+            "headers": {"Content-Type": "text/html"},
+            "body": success_html
+        }
+
+    except admission.Rejected as e:
+        metrics.count("rejected")
+        metrics.add_bytes("rejected", len(event.get("body") or ""))
+        return {"statusCode": e.status, "body": str(e)}
+
+    except multipart.MultipartError as e:
+        return {"statusCode": 400, "body": f"Bad request: {str(e)}"}
+
+    except Exception as e:
+        metrics.failed(e)
+        return {
+            "statusCode": 500,
+            "headers": {"Content-Type": "text/plain"},
+            "body": f"Error: {str(e)}"
+        }
+
+
+def upload_many(name, caption, files):
+    if len(files) > batch_upload.MAX_FILES:
+        return {"statusCode": 400, "body": f"At most {batch_upload.MAX_FILES} files per request"}
+
+    uploads = []
+    for filename, file_content in files:
+        s3_key = f"uploads/{uuid.uuid4()}_{filename or 'upload.bin'}"
+        item = {
+            "id": str(uuid.uuid4()),
+            "name": name,
+            "caption": caption,
+            "file_url": f"https://{BUCKET_NAME}.s3.amazonaws.com/{s3_key}"
+        }
+        uploads.append((s3_key, file_content, item))
+
+    with metrics.phase("batch_upload"):
+        results = batch_upload.upload_batch(aws_clients.s3(), table, BUCKET_NAME, uploads)
+
+    report = []
+    for (_, _, item), result in zip(uploads, results):
+        entry = {"id": item["id"], "status": result["status"]}
+        if result["status"] == "uploaded":
+            entry["file_url"] = item["file_url"]
+        else:
+            entry["error"] = result["error"]
+        report.append(entry)
+
+    index_records([item for (_, _, item), result in zip(uploads, results) if result["status"] == "uploaded"])
+
+    all_uploaded = all(entry["status"] == "uploaded" for entry in report)
+    return {
+        "statusCode": 200 if all_uploaded else 207,
+        "headers": {"Content-Type": "application/json"},
+        "body": json.dumps({"files": report})
+    }
+
+
+# Name and caption are indexed for search (search.py); a failure here doesn't fail the upload
+def index_records(items):
+    if not items:
+        return
+    try:
+        with metrics.phase("index"):
+            if search.submit(aws_clients.s3(), BUCKET_NAME, items) is False:
+                # Searchable after the next merger run rather than right away
+                metrics.count("index_parked", len(items))
+    except Exception:
+        metrics.count("index_failed", len(items))
+
+
+def search_records(text):
+    try:
+        with metrics.phase("search"):
+            hits = search.query(aws_clients.s3(), BUCKET_NAME, text)
+        with metrics.phase("dynamodb_query"):
+            found = table.batch_get(
+                [{"id": record_id} for record_id, _ in hits],
+                ProjectionExpression="id, #name, caption, file_url",
+                ExpressionAttributeNames={"#name": "name"}
+            ) if hits else []
+    except Exception as e:
+        metrics.failed(e)
+        return {"statusCode": 500, "headers": {"Content-Type": "text/plain"}, "body": f"Error: {str(e)}"}
+
+    by_id = {item["id"]: item for item in found}
+    results = [dict(by_id[record_id], score=round(score, 4)) for record_id, score in hits if record_id in by_id]
+    return {
+        "statusCode": 200,
+        "headers": {"Content-Type": "application/json"},
+        "body": json.dumps({"query": text, "results": results})
+    }
+
+
+# What a warm-up event primes, in order. Every step only reads.
+def warmup_steps():
+    steps = [
+        ("s3", lambda: warmup.connect_s3(BUCKET_NAME)),
+        ("dynamodb", lambda: warmup.connect_dynamodb(TABLE_NAME)),
+        ("templates", warm_templates)
+    ]
+    if search.ENABLED:
+        steps.append(("search", lambda: search.segments(aws_clients.s3(), BUCKET_NAME)))
+    return steps
+
+
+def warm_templates():
+    SUCCESS_PAGE.render(name="warm-up", caption="\u0936\u0941\u092d", file_url=f"https://{BUCKET_NAME}.s3.amazonaws.com/")
+    for accept_encoding in ("br, gzip", "gzip", ""):
+        UPLOAD_FORM.respond({"accept-encoding": accept_encoding})
+
+
+# Provisioned concurrency starts the environment ahead of traffic: prime it then
+if warmup.ON_INIT:
+    warmup.prime(warmup_steps())
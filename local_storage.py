@@ -0,0 +1,870 @@
+import base64
+import hashlib
+import json
+import mmap
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import uuid
+from functools import lru_cache
+
+import aws_clients
+
+# STORAGE_BACKEND=local (see aws_clients) swaps S3 and DynamoDB for this
+# module: object bytes are files under STORAGE_LOCAL_ROOT, read back through
+# mmap, and object metadata and table items live in one SQLite file next to
+# them. Only the calls and expression syntax the handlers use are covered.
+ROOT = os.environ.get('STORAGE_LOCAL_ROOT', '/tmp/storage')
+# Secondary indexes the local tables answer queries on: name=hash_key[:range_key],...
+INDEXES = os.environ.get('STORAGE_LOCAL_INDEXES', 'gallery-by-date=gallery:upload_date')
+# Every table is keyed on this attribute alone, like the uploads table
+HASH_KEY = 'id'
+
+
+class ClientError(Exception):
+    def __init__(self, code, message=''):
+        super().__init__(f'An error occurred ({code}): {message or code}')
+        self.response = {'Error': {'Code': code, 'Message': message or code}}
+
+
+def _parse_indexes(spec):
+    indexes = {}
+    for entry in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, keys = entry.partition('=')
+        hash_key, _, range_key = keys.partition(':')
+        indexes[name.strip()] = (hash_key.strip(), range_key.strip() or None)
+    return indexes
+
+
+class _Database:
+    def __init__(self, root):
+        os.makedirs(root, exist_ok=True)
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(os.path.join(root, 'storage.sqlite3'), check_same_thread=False, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS items '
+            '(tbl TEXT NOT NULL, id TEXT NOT NULL, body TEXT NOT NULL, PRIMARY KEY (tbl, id)) WITHOUT ROWID'
+        )
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS objects (bucket TEXT NOT NULL, key TEXT NOT NULL, path TEXT NOT NULL, '
+            'etag TEXT NOT NULL, size INTEGER NOT NULL, info TEXT NOT NULL, PRIMARY KEY (bucket, key)) WITHOUT ROWID'
+        )
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS multipart_uploads (upload_id TEXT PRIMARY KEY, bucket TEXT NOT NULL, '
+            'key TEXT NOT NULL, info TEXT NOT NULL)'
+        )
+
+    # One write transaction; BEGIN IMMEDIATE also serialises writers in other processes
+    def transaction(self):
+        return _Transaction(self)
+
+
+class _Transaction:
+    def __init__(self, database):
+        self.database = database
+
+    def __enter__(self):
+        self.database.lock.acquire()
+        self.database.db.execute('BEGIN IMMEDIATE')
+        return self.database.db
+
+    def __exit__(self, kind, error, traceback):
+        try:
+            self.database.db.execute('COMMIT' if kind is None else 'ROLLBACK')
+        finally:
+            self.database.lock.release()
+
+
+_databases = {}
+_databases_lock = threading.Lock()
+
+
+def _database(root):
+    root = os.path.abspath(root)
+    with _databases_lock:
+        if root not in _databases:
+            _databases[root] = _Database(root)
+        return _databases[root]
+
+
+def client(service, root=None):
+    if service == 's3':
+        return LocalS3(root or ROOT)
+    if service == 'dynamodb':
+        return LocalDynamoDB(root or ROOT)
+    raise ValueError(f'No local backend for {service}')
+
+
+# Object bodies: a read-only view over a memory-mapped file, with the read()
+# interface of botocore's StreamingBody
+class MappedBody:
+    def __init__(self, path, start=0, end=None):
+        self._map = None
+        self._view = memoryview(b'')
+        if os.path.getsize(path):
+            with open(path, 'rb') as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._view = memoryview(self._map)[start:end]
+        self._position = 0
+
+    def read(self, amt=None):
+        end = len(self._view) if amt is None or amt < 0 else min(len(self._view), self._position + amt)
+        data = bytes(self._view[self._position:end])
+        self._position = end
+        return data
+
+    def iter_chunks(self, chunk_size=1024 * 1024):
+        while True:
+            chunk = self.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def close(self):
+        self._view.release()
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+_directories = set()
+
+
+def _make_directory(directory):
+    if directory not in _directories:
+        os.makedirs(directory, exist_ok=True)
+        _directories.add(directory)
+
+
+def _write_file(directory, body):
+    _make_directory(directory)
+    digest = hashlib.md5()
+    size = 0
+    fd, path = tempfile.mkstemp(dir=directory)
+    with os.fdopen(fd, 'wb') as f:
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        chunks = iter(lambda: body.read(1024 * 1024), b'') if hasattr(body, 'read') else [body]
+        for chunk in chunks:
+            digest.update(chunk)
+            size += len(chunk)
+            f.write(chunk)
+    return path, digest, size
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+_INFO_FIELDS = ('ContentType', 'ContentEncoding', 'ContentDisposition', 'CacheControl', 'Metadata')
+
+
+class LocalS3:
+    def __init__(self, root):
+        self.root = root
+        self.database = _database(root)
+
+    # Every version of an object gets its own file; the row says which one is current
+    def _object_path(self, bucket, key):
+        name = hashlib.sha1(f'{bucket}/{key}'.encode()).hexdigest()
+        return os.path.join(self.root, 'objects', name[:2], f'{name}.{uuid.uuid4().hex}')
+
+    def _row(self, bucket, key):
+        with self.database.lock:
+            return self.database.db.execute(
+                'SELECT path, etag, size, info FROM objects WHERE bucket = ? AND key = ?', (bucket, key)
+            ).fetchone()
+
+    def _store(self, bucket, key, temp_path, etag, size, info, condition=None):
+        path = self._object_path(bucket, key)
+        _make_directory(os.path.dirname(path))
+        # The new version is complete under its own name before the row points at
+        # it, so a row never names a file that holds other bytes
+        os.replace(temp_path, path)
+        try:
+            with self.database.transaction() as db:
+                row = db.execute('SELECT etag, path FROM objects WHERE bucket = ? AND key = ?', (bucket, key)).fetchone()
+                if condition:
+                    if_match, if_none_match = condition
+                    if (if_match and (row is None or row[0] != if_match)) or (if_none_match == '*' and row is not None):
+                        raise ClientError('PreconditionFailed', 'At least one of the pre-conditions you specified did not hold')
+                db.execute(
+                    'INSERT OR REPLACE INTO objects (bucket, key, path, etag, size, info) VALUES (?, ?, ?, ?, ?, ?)',
+                    (bucket, key, path, etag, size, json.dumps(info))
+                )
+        except BaseException:
+            os.remove(path)
+            raise
+        # Readers holding a mapping of the old version keep seeing its bytes
+        if row is not None:
+            _remove(row[1])
+        return etag
+
+    def put_object(self, Bucket, Key, Body=b'', IfMatch=None, IfNoneMatch=None, **kwargs):
+        temp_path, digest, size = _write_file(os.path.join(self.root, 'objects', 'tmp'), Body)
+        info = {field: kwargs[field] for field in _INFO_FIELDS if field in kwargs}
+        etag = self._store(Bucket, Key, temp_path, f'"{digest.hexdigest()}"', size, info, (IfMatch, IfNoneMatch))
+        return {'ETag': etag}
+
+    def _head(self, bucket, key):
+        row = self._row(bucket, key)
+        if row is None:
+            return None, None
+        path, etag, size, info = row
+        response = {'ContentLength': size, 'ETag': etag, 'ContentType': 'binary/octet-stream'}
+        response.update(json.loads(info))
+        return path, response
+
+    def head_object(self, Bucket, Key, **kwargs):
+        _, response = self._head(Bucket, Key)
+        if response is None:
+            raise ClientError('404', 'Not Found')
+        return response
+
+    def get_object(self, Bucket, Key, Range=None, IfNoneMatch=None, IfMatch=None, **kwargs):
+        while True:
+            # The file is mapped under the lock that read its row, so the bytes
+            # always belong to the ETag and size returned with them
+            with self.database.lock:
+                path, response = self._head(Bucket, Key)
+                if response is None:
+                    raise ClientError('NoSuchKey', 'The specified key does not exist.')
+                if IfNoneMatch and IfNoneMatch == response['ETag']:
+                    raise ClientError('304', 'Not Modified')
+                if IfMatch and IfMatch != response['ETag']:
+                    raise ClientError('PreconditionFailed', 'At least one of the pre-conditions you specified did not hold')
+                start, end = 0, response['ContentLength']
+                if Range:
+                    first, _, last = Range[len('bytes='):].partition('-')
+                    start, end = int(first), min(end, int(last) + 1 if last else end)
+                    response['ContentRange'] = f"bytes {start}-{end - 1}/{response['ContentLength']}"
+                    response['ContentLength'] = end - start
+                try:
+                    response['Body'] = MappedBody(path, start, end)
+                except FileNotFoundError:
+                    # Replaced by another process between the row and the open: read the new row
+                    continue
+            return response
+
+    def delete_objects(self, Bucket, Delete, **kwargs):
+        deleted = []
+        with self.database.transaction() as db:
+            for entry in Delete['Objects']:
+                row = db.execute('SELECT path FROM objects WHERE bucket = ? AND key = ?', (Bucket, entry['Key'])).fetchone()
+                if row:
+                    db.execute('DELETE FROM objects WHERE bucket = ? AND key = ?', (Bucket, entry['Key']))
+                    _remove(row[0])
+                deleted.append({'Key': entry['Key']})
+        return {} if Delete.get('Quiet') else {'Deleted': deleted}
+
+    def list_objects_v2(self, Bucket, Prefix='', MaxKeys=1000, ContinuationToken=None, StartAfter='', **kwargs):
+        after = ContinuationToken or StartAfter or ''
+        with self.database.lock:
+            rows = self.database.db.execute(
+                'SELECT key, size, etag FROM objects WHERE bucket = ? AND substr(key, 1, ?) = ? AND key > ? '
+                'ORDER BY key LIMIT ?',
+                (Bucket, len(Prefix), Prefix, after, MaxKeys + 1)
+            ).fetchall()
+        response = {
+            'Contents': [{'Key': key, 'Size': size, 'ETag': etag} for key, size, etag in rows[:MaxKeys]],
+            'KeyCount': min(len(rows), MaxKeys),
+            'IsTruncated': len(rows) > MaxKeys
+        }
+        if response['IsTruncated']:
+            response['NextContinuationToken'] = rows[MaxKeys - 1][0]
+        return response
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        upload_id = uuid.uuid4().hex
+        info = {field: kwargs[field] for field in _INFO_FIELDS if field in kwargs}
+        with self.database.transaction() as db:
+            db.execute(
+                'INSERT INTO multipart_uploads (upload_id, bucket, key, info) VALUES (?, ?, ?, ?)',
+                (upload_id, Bucket, Key, json.dumps(info))
+            )
+        return {'Bucket': Bucket, 'Key': Key, 'UploadId': upload_id}
+
+    def _upload(self, upload_id):
+        with self.database.lock:
+            row = self.database.db.execute(
+                'SELECT bucket, key, info FROM multipart_uploads WHERE upload_id = ?', (upload_id,)
+            ).fetchone()
+        if row is None:
+            raise ClientError('NoSuchUpload', 'The specified upload does not exist.')
+        return row
+
+    def _part_directory(self, upload_id):
+        return os.path.join(self.root, 'multipart', upload_id)
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body=b'', **kwargs):
+        self._upload(UploadId)
+        directory = self._part_directory(UploadId)
+        temp_path, digest, _ = _write_file(directory, Body)
+        os.replace(temp_path, os.path.join(directory, str(PartNumber)))
+        return {'ETag': f'"{digest.hexdigest()}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload, **kwargs):
+        _, _, info = self._upload(UploadId)
+        directory = self._part_directory(UploadId)
+        parts = MultipartUpload['Parts']
+        combined = hashlib.md5()
+        fd, temp_path = tempfile.mkstemp(dir=directory)
+        size = 0
+        with os.fdopen(fd, 'wb') as out:
+            for part in parts:
+                with open(os.path.join(directory, str(part['PartNumber'])), 'rb') as f:
+                    data = f.read()
+                combined.update(hashlib.md5(data).digest())
+                size += out.write(data)
+        etag = f'"{combined.hexdigest()}-{len(parts)}"'
+        self._store(Bucket, Key, temp_path, etag, size, json.loads(info))
+        self._discard(UploadId)
+        return {'Bucket': Bucket, 'Key': Key, 'ETag': etag}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        self._discard(UploadId)
+        return {}
+
+    def _discard(self, upload_id):
+        with self.database.transaction() as db:
+            db.execute('DELETE FROM multipart_uploads WHERE upload_id = ?', (upload_id,))
+        directory = self._part_directory(upload_id)
+        if os.path.isdir(directory):
+            for name in os.listdir(directory):
+                os.remove(os.path.join(directory, name))
+            os.rmdir(directory)
+        _directories.discard(directory)
+
+    def head_bucket(self, Bucket, **kwargs):
+        return {}
+
+    # There is no server to sign for: links point straight at the current file
+    # (or, for an object that doesn't exist yet, where a version of it would go)
+    def generate_presigned_url(self, ClientMethod, Params=None, ExpiresIn=3600, **kwargs):
+        params = Params or {}
+        row = self._row(params.get('Bucket', ''), params.get('Key', ''))
+        path = row[0] if row else self._object_path(params.get('Bucket', ''), params.get('Key', ''))
+        return f'file://{path}?X-Amz-Expires={ExpiresIn}'
+
+
+# --- DynamoDB expressions -------------------------------------------------
+# Parsed once into tuples and evaluated against plain Python items
+
+_TOKEN = re.compile(
+    r'\s*(?:(?P<number>\d+)|(?P<name>[A-Za-z_][A-Za-z0-9_]*)|(?P<alias>#[A-Za-z0-9_]+)'
+    r'|(?P<value>:[A-Za-z0-9_]+)|(?P<op><>|<=|>=|[=<>(),.\[\]+-]))'
+)
+_COMPARATORS = ('=', '<>', '<', '<=', '>', '>=')
+_FUNCTIONS = ('attribute_exists', 'attribute_not_exists', 'begins_with', 'contains')
+_MISSING = object()
+
+
+class _Parser:
+    def __init__(self, text, names):
+        self.names = names or {}
+        self.tokens = []
+        position = 0
+        text = text.rstrip()
+        while position < len(text):
+            match = _TOKEN.match(text, position)
+            if not match or match.end() == position:
+                raise ClientError('ValidationException', f'Invalid expression near: {text[position:]!r}')
+            self.tokens.append((match.lastgroup, match.group(match.lastgroup)))
+            position = match.end()
+        self.position = 0
+
+    def peek(self, offset=0):
+        index = self.position + offset
+        return self.tokens[index] if index < len(self.tokens) else (None, None)
+
+    def take(self):
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def accept(self, text):
+        if self.peek()[1] == text:
+            self.position += 1
+            return True
+        return False
+
+    def keyword(self, word):
+        kind, text = self.peek()
+        if kind == 'name' and text.upper() == word:
+            self.position += 1
+            return True
+        return False
+
+    def expect(self, text):
+        if not self.accept(text):
+            raise ClientError('ValidationException', f'Expected {text!r} in expression')
+
+    def done(self):
+        if self.position != len(self.tokens):
+            raise ClientError('ValidationException', f'Unexpected {self.peek()[1]!r} in expression')
+
+    def path(self):
+        segments = [self.segment()]
+        while True:
+            if self.accept('.'):
+                segments.append(self.segment())
+            elif self.accept('['):
+                kind, text = self.take()
+                if kind != 'number':
+                    raise ClientError('ValidationException', 'List index must be a number')
+                segments.append(int(text))
+                self.expect(']')
+            else:
+                return ('path', tuple(segments))
+
+    def segment(self):
+        kind, text = self.take()
+        if kind == 'alias':
+            if text not in self.names:
+                raise ClientError('ValidationException', f'Expression attribute name {text} is not defined')
+            return self.names[text]
+        if kind == 'name':
+            return text
+        raise ClientError('ValidationException', f'Expected an attribute name, got {text!r}')
+
+    def operand(self):
+        kind, text = self.peek()
+        if kind == 'value':
+            self.position += 1
+            return ('value', text)
+        if kind == 'name' and text == 'size' and self.peek(1)[1] == '(':
+            self.position += 2
+            path = self.path()
+            self.expect(')')
+            return ('size', path)
+        return self.path()
+
+    def condition(self):
+        node = self.conjunction()
+        while self.keyword('OR'):
+            node = ('or', node, self.conjunction())
+        return node
+
+    def conjunction(self):
+        node = self.negation()
+        while self.keyword('AND'):
+            node = ('and', node, self.negation())
+        return node
+
+    def negation(self):
+        if self.keyword('NOT'):
+            return ('not', self.negation())
+        return self.primary()
+
+    def primary(self):
+        if self.accept('('):
+            node = self.condition()
+            self.expect(')')
+            return node
+        kind, text = self.peek()
+        if kind == 'name' and text in _FUNCTIONS and self.peek(1)[1] == '(':
+            self.position += 2
+            args = [self.operand()]
+            while self.accept(','):
+                args.append(self.operand())
+            self.expect(')')
+            return ('function', text, tuple(args))
+        left = self.operand()
+        if self.keyword('BETWEEN'):
+            low = self.operand()
+            if not self.keyword('AND'):
+                raise ClientError('ValidationException', 'BETWEEN needs AND')
+            return ('between', left, low, self.operand())
+        if self.keyword('IN'):
+            self.expect('(')
+            options = [self.operand()]
+            while self.accept(','):
+                options.append(self.operand())
+            self.expect(')')
+            return ('in', left, tuple(options))
+        operator = self.take()[1]
+        if operator not in _COMPARATORS:
+            raise ClientError('ValidationException', f'Expected a comparison, got {operator!r}')
+        return ('compare', operator, left, self.operand())
+
+    def update_value(self):
+        node = self.update_term()
+        if self.peek()[1] in ('+', '-'):
+            operator = self.take()[1]
+            node = ('arithmetic', operator, node, self.update_term())
+        return node
+
+    def update_term(self):
+        kind, text = self.peek()
+        if kind == 'name' and text in ('if_not_exists', 'list_append') and self.peek(1)[1] == '(':
+            self.position += 2
+            first = self.path() if text == 'if_not_exists' else self.update_value()
+            self.expect(',')
+            second = self.update_value()
+            self.expect(')')
+            return (text, first, second)
+        return self.operand()
+
+    def update(self):
+        actions = []
+        while self.peek()[0] is not None:
+            kind, clause = self.take()
+            clause = (clause or '').upper()
+            if kind != 'name' or clause not in ('SET', 'REMOVE', 'ADD', 'DELETE'):
+                raise ClientError('ValidationException', f'Unknown update clause {clause!r}')
+            while True:
+                path = self.path()
+                if clause == 'SET':
+                    self.expect('=')
+                    actions.append(('set', path, self.update_value()))
+                elif clause == 'REMOVE':
+                    actions.append(('remove', path, None))
+                else:
+                    actions.append((clause.lower(), path, self.operand()))
+                if not self.accept(','):
+                    break
+        return tuple(actions)
+
+
+@lru_cache(maxsize=512)
+def _parse(kind, text, names):
+    parser = _Parser(text, dict(names))
+    if kind == 'update':
+        node = parser.update()
+    elif kind == 'projection':
+        node = [parser.path()]
+        while parser.accept(','):
+            node.append(parser.path())
+        node = tuple(node)
+    else:
+        node = parser.condition()
+    parser.done()
+    return node
+
+
+def parse(kind, text, names=None):
+    return _parse(kind, text, tuple(sorted((names or {}).items())))
+
+
+def _get(item, segments):
+    value = item
+    for segment in segments:
+        try:
+            value = value[segment]
+        except (KeyError, IndexError, TypeError):
+            return _MISSING
+    return value
+
+
+def _resolve(node, item, values):
+    kind = node[0]
+    if kind == 'path':
+        return _get(item, node[1])
+    if kind == 'value':
+        if node[1] not in values:
+            raise ClientError('ValidationException', f'Expression attribute value {node[1]} is not defined')
+        return values[node[1]]
+    if kind == 'size':
+        value = _get(item, node[1][1])
+        return _MISSING if value is _MISSING else len(value)
+    if kind == 'if_not_exists':
+        value = _get(item, node[1][1])
+        return _resolve(node[2], item, values) if value is _MISSING else value
+    if kind == 'list_append':
+        return list(_resolve(node[1], item, values)) + list(_resolve(node[2], item, values))
+    if kind == 'arithmetic':
+        left, right = _resolve(node[2], item, values), _resolve(node[3], item, values)
+        if _MISSING in (left, right):
+            raise ClientError('ValidationException', 'An operand in the update expression does not exist')
+        return left + right if node[1] == '+' else left - right
+    raise ClientError('ValidationException', f'Unsupported operand {kind}')
+
+
+def _compare(operator, left, right):
+    if left is _MISSING or right is _MISSING:
+        return operator == '<>'
+    try:
+        if operator == '=':
+            return left == right
+        if operator == '<>':
+            return left != right
+        if operator == '<':
+            return left < right
+        if operator == '<=':
+            return left <= right
+        if operator == '>':
+            return left > right
+        return left >= right
+    except TypeError:
+        return False
+
+
+def evaluate(node, item, values):
+    kind = node[0]
+    if kind == 'or':
+        return evaluate(node[1], item, values) or evaluate(node[2], item, values)
+    if kind == 'and':
+        return evaluate(node[1], item, values) and evaluate(node[2], item, values)
+    if kind == 'not':
+        return not evaluate(node[1], item, values)
+    if kind == 'compare':
+        return _compare(node[1], _resolve(node[2], item, values), _resolve(node[3], item, values))
+    if kind == 'between':
+        value = _resolve(node[1], item, values)
+        return _compare('>=', value, _resolve(node[2], item, values)) and _compare('<=', value, _resolve(node[3], item, values))
+    if kind == 'in':
+        value = _resolve(node[1], item, values)
+        return any(_compare('=', value, _resolve(option, item, values)) for option in node[2])
+    name, args = node[1], node[2]
+    value = _resolve(args[0], item, values)
+    if name == 'attribute_exists':
+        return value is not _MISSING
+    if name == 'attribute_not_exists':
+        return value is _MISSING
+    operand = _resolve(args[1], item, values)
+    if value is _MISSING:
+        return False
+    if name == 'begins_with':
+        return isinstance(value, str) and value.startswith(operand)
+    if isinstance(value, str):
+        return isinstance(operand, str) and operand in value
+    return isinstance(value, (set, list)) and operand in value
+
+
+def apply_update(actions, item, values):
+    for action, (_, segments), operand in actions:
+        parent = _get(item, segments[:-1])
+        if parent is _MISSING or not isinstance(parent, (dict, list)):
+            raise ClientError('ValidationException', 'The document path provided in the update expression is invalid for update')
+        last = segments[-1]
+        current = _get(parent, (last,))
+        if action == 'set':
+            value = _resolve(operand, item, values)
+            if isinstance(parent, list) and last >= len(parent):
+                parent.append(value)
+            else:
+                parent[last] = value
+        elif action == 'remove':
+            if current is not _MISSING:
+                del parent[last]
+        elif action == 'add':
+            value = _resolve(operand, item, values)
+            parent[last] = value if current is _MISSING else (current | value if isinstance(current, set) else current + value)
+        elif action == 'delete' and current is not _MISSING:
+            current -= _resolve(operand, item, values)
+            if not current:
+                del parent[last]
+
+
+def _project(item, paths):
+    if not paths:
+        return item
+    projected = {}
+    for _, segments in paths:
+        value = _get(item, segments[:1])
+        if value is not _MISSING:
+            projected[segments[0]] = value
+    return projected
+
+
+# --- Tables ----------------------------------------------------------------
+
+def _dump(item):
+    return json.dumps(aws_clients.to_item(item), default=lambda data: base64.b64encode(data).decode('ascii'))
+
+
+def _load(text):
+    item = json.loads(text)
+    for value in item.values():
+        if 'B' in value:
+            value['B'] = base64.b64decode(value['B'])
+    return aws_clients.from_item(item)
+
+
+class LocalDynamoDB:
+    def __init__(self, root, indexes=None):
+        self.database = _database(root)
+        self.indexes = _parse_indexes(INDEXES) if indexes is None else indexes
+        with self.database.lock:
+            for name, keys in self.indexes.items():
+                columns = ', '.join(self._column(key) for key in keys if key)
+                self.database.db.execute(
+                    f'CREATE INDEX IF NOT EXISTS "index_{name}" ON items (tbl, {columns}, id)'
+                )
+
+    @staticmethod
+    def _column(attribute):
+        # Index keys are strings or numbers; either sorts correctly in its own column type
+        path = json.dumps(attribute)
+        return f"coalesce(json_extract(body, '$.{path}.S'), json_extract(body, '$.{path}.N') + 0)"
+
+    @staticmethod
+    def _key_id(key):
+        value = aws_clients.deserialize(key[HASH_KEY])
+        return str(value)
+
+    def _read(self, db, table, key_id):
+        with self.database.lock:
+            row = db.execute('SELECT body FROM items WHERE tbl = ? AND id = ?', (table, key_id)).fetchone()
+        return _load(row[0]) if row else None
+
+    @staticmethod
+    def _check(kwargs, item):
+        if 'ConditionExpression' in kwargs:
+            condition = parse('condition', kwargs['ConditionExpression'], kwargs.get('ExpressionAttributeNames'))
+            if not evaluate(condition, item or {}, _values(kwargs)):
+                error = ClientError('ConditionalCheckFailedException', 'The conditional request failed')
+                # As DynamoDB does, the item that failed the check comes back with the error
+                if item and kwargs.get('ReturnValuesOnConditionCheckFailure') == 'ALL_OLD':
+                    error.response['Item'] = aws_clients.to_item(item)
+                raise error
+
+    @staticmethod
+    def _returned(kwargs, old, new):
+        wanted = kwargs.get('ReturnValues', 'NONE')
+        source = old if wanted in ('ALL_OLD', 'UPDATED_OLD') else new if wanted in ('ALL_NEW', 'UPDATED_NEW') else None
+        return {'Attributes': aws_clients.to_item(source)} if source else {}
+
+    def put_item(self, TableName, Item, **kwargs):
+        item = aws_clients.from_item(Item)
+        key_id = str(item[HASH_KEY])
+        with self.database.transaction() as db:
+            old = self._read(db, TableName, key_id)
+            self._check(kwargs, old)
+            db.execute('INSERT OR REPLACE INTO items (tbl, id, body) VALUES (?, ?, ?)', (TableName, key_id, _dump(item)))
+        return self._returned(kwargs, old, None)
+
+    def get_item(self, TableName, Key, **kwargs):
+        item = self._read(self.database.db, TableName, self._key_id(Key))
+        if item is None:
+            return {}
+        return {'Item': aws_clients.to_item(_project(item, self._projection(kwargs)))}
+
+    def update_item(self, TableName, Key, **kwargs):
+        key = aws_clients.from_item(Key)
+        key_id = str(key[HASH_KEY])
+        with self.database.transaction() as db:
+            old = self._read(db, TableName, key_id)
+            self._check(kwargs, old)
+            item = _load(_dump(old)) if old else dict(key)
+            if 'UpdateExpression' in kwargs:
+                actions = parse('update', kwargs['UpdateExpression'], kwargs.get('ExpressionAttributeNames'))
+                apply_update(actions, item, _values(kwargs))
+            db.execute('INSERT OR REPLACE INTO items (tbl, id, body) VALUES (?, ?, ?)', (TableName, key_id, _dump(item)))
+        return self._returned(kwargs, old, item)
+
+    def delete_item(self, TableName, Key, **kwargs):
+        key_id = self._key_id(Key)
+        with self.database.transaction() as db:
+            old = self._read(db, TableName, key_id)
+            self._check(kwargs, old)
+            db.execute('DELETE FROM items WHERE tbl = ? AND id = ?', (TableName, key_id))
+        return self._returned(kwargs, old, None)
+
+    def _projection(self, kwargs):
+        if 'ProjectionExpression' not in kwargs:
+            return None
+        return parse('projection', kwargs['ProjectionExpression'], kwargs.get('ExpressionAttributeNames'))
+
+    def query(self, TableName, KeyConditionExpression, IndexName=None, **kwargs):
+        names = kwargs.get('ExpressionAttributeNames')
+        values = _values(kwargs)
+        key_condition = parse('condition', KeyConditionExpression, names)
+        hash_key, range_key = self.indexes[IndexName] if IndexName else (HASH_KEY, None)
+        hash_value = _equality(key_condition, hash_key, values)
+        if hash_value is _MISSING:
+            raise ClientError('ValidationException', f'Query condition missed key schema element: {hash_key}')
+        filter_condition = parse('condition', kwargs['FilterExpression'], names) if 'FilterExpression' in kwargs else None
+        projection = self._projection(kwargs)
+        forward = kwargs.get('ScanIndexForward', True)
+        limit = kwargs.get('Limit')
+
+        # Rows in index order after the start key; the key condition is rechecked in Python
+        order = 'ASC' if forward else 'DESC'
+        range_column = self._column(range_key) if range_key else "''"
+        sql = f'SELECT body FROM items WHERE tbl = ? AND {self._column(hash_key)} = ?'
+        params = [TableName, hash_value]
+        if 'ExclusiveStartKey' in kwargs:
+            start = aws_clients.from_item(kwargs['ExclusiveStartKey'])
+            sql += f" AND ({range_column}, id) {'>' if forward else '<'} (?, ?)"
+            params += [start.get(range_key, '') if range_key else '', str(start[HASH_KEY])]
+        sql += f' ORDER BY {range_column} {order}, id {order}'
+
+        with self.database.lock:
+            rows = self.database.db.execute(sql, params)
+        items, evaluated, last = [], 0, None
+        for (body,) in rows:
+            item = _load(body)
+            if not evaluate(key_condition, item, values):
+                continue
+            evaluated += 1
+            last = item
+            if filter_condition is None or evaluate(filter_condition, item, values):
+                items.append(_project(item, projection))
+            if limit and evaluated >= limit:
+                break
+        else:
+            last = None
+
+        response = {'Items': [aws_clients.to_item(item) for item in items], 'Count': len(items), 'ScannedCount': evaluated}
+        if last is not None:
+            keys = {HASH_KEY, hash_key} | ({range_key} if range_key else set())
+            response['LastEvaluatedKey'] = aws_clients.to_item({key: last[key] for key in keys if key in last})
+        return response
+
+    def batch_get_item(self, RequestItems, **kwargs):
+        responses = {}
+        for table, request in RequestItems.items():
+            projection = self._projection(request)
+            found = (self._read(self.database.db, table, self._key_id(key)) for key in request['Keys'])
+            responses[table] = [aws_clients.to_item(_project(item, projection)) for item in found if item]
+        return {'Responses': responses, 'UnprocessedKeys': {}}
+
+    def batch_write_item(self, RequestItems, **kwargs):
+        with self.database.transaction() as db:
+            for table, requests in RequestItems.items():
+                for request in requests:
+                    if 'PutRequest' in request:
+                        item = aws_clients.from_item(request['PutRequest']['Item'])
+                        db.execute(
+                            'INSERT OR REPLACE INTO items (tbl, id, body) VALUES (?, ?, ?)',
+                            (table, str(item[HASH_KEY]), _dump(item))
+                        )
+                    else:
+                        db.execute(
+                            'DELETE FROM items WHERE tbl = ? AND id = ?',
+                            (table, self._key_id(request['DeleteRequest']['Key']))
+                        )
+        return {'UnprocessedItems': {}}
+
+    def describe_table(self, TableName, **kwargs):
+        with self.database.lock:
+            count = self.database.db.execute('SELECT COUNT(*) FROM items WHERE tbl = ?', (TableName,)).fetchone()[0]
+        return {'Table': {'TableName': TableName, 'TableStatus': 'ACTIVE', 'ItemCount': count}}
+
+
+def _values(kwargs):
+    return aws_clients.from_item(kwargs.get('ExpressionAttributeValues') or {})
+
+
+# The value a key condition pins ``attribute`` to with "=", or _MISSING
+def _equality(node, attribute, values):
+    if node[0] == 'and':
+        found = _equality(node[1], attribute, values)
+        return found if found is not _MISSING else _equality(node[2], attribute, values)
+    if node[0] == 'compare' and node[1] == '=' and node[2] == ('path', (attribute,)):
+        return _resolve(node[3], {}, values)
+    return _MISSING
@@ -0,0 +1,185 @@
+import contextvars
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+# Per-request phase timings and byte counts, written to the function log as one
+# CloudWatch Embedded Metric Format line per request. CloudWatch turns the line
+# into metrics on its own: no PutMetricData call, no extra latency.
+ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'TempleUploader')
+
+_cold_start = True
+_current = contextvars.ContextVar('metrics_recorder', default=None)
+
+
+class Recorder:
+    def __init__(self, function, route, request_id=None):
+        global _cold_start
+        self.function = function
+        self.route = route
+        self.request_id = request_id
+        self.cold_start = _cold_start
+        _cold_start = False
+        self.started = time.perf_counter()
+        self.timings = {}
+        self.sizes = {}
+        self.counts = {}
+        self.status = None
+        self.error = None
+
+    def phase(self, name):
+        return _Phase(self.timings, name)
+
+    def add_bytes(self, name, count):
+        self.sizes[name] = self.sizes.get(name, 0) + count
+
+    def count(self, name, value=1):
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def record(self):
+        total = (time.perf_counter() - self.started) * 1000
+        metrics = [{'Name': 'total_ms', 'Unit': 'Milliseconds'}, {'Name': 'cold_start', 'Unit': 'Count'}]
+        line = {
+            'Function': self.function,
+            'Route': self.route,
+            'total_ms': round(total, 3),
+            'cold_start': int(self.cold_start),
+            'status': self.status,
+            'request_id': self.request_id
+        }
+        for name, value in self.timings.items():
+            metrics.append({'Name': name + '_ms', 'Unit': 'Milliseconds'})
+            line[name + '_ms'] = round(value, 3)
+        for name, value in self.sizes.items():
+            metrics.append({'Name': name + '_bytes', 'Unit': 'Bytes'})
+            line[name + '_bytes'] = value
+        for name, value in self.counts.items():
+            metrics.append({'Name': name, 'Unit': 'Count'})
+            line[name] = value
+        if self.error:
+            line['error'] = self.error
+        line['_aws'] = {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': NAMESPACE,
+                'Dimensions': [['Function', 'Route']],
+                'Metrics': metrics
+            }]
+        }
+        return line
+
+    def emit(self):
+        sys.stdout.write(json.dumps(self.record(), separators=(',', ':')) + '\n')
+
+
+# A plain context manager rather than @contextmanager: it is entered several times per request
+class _Phase:
+    __slots__ = ('timings', 'name', 'start')
+
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        elapsed = (time.perf_counter() - self.start) * 1000
+        self.timings[self.name] = self.timings.get(self.name, 0.0) + elapsed
+
+
+class _NullPhase:
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NULL_PHASE = _NullPhase()
+
+
+# Stands in for the recorder when metrics are off (or outside a request)
+class _NullRecorder:
+    def phase(self, name):
+        return _NULL_PHASE
+
+    def add_bytes(self, name, count):
+        pass
+
+    def count(self, name, value=1):
+        pass
+
+
+_NULL = _NullRecorder()
+
+
+# Everything the handler doesn't label through set_route(): unmatched paths,
+# other methods, requests turned away before routing
+OTHER_ROUTE = 'other'
+
+
+# ``route`` labels events that aren't HTTP requests (e.g. 'warmup'); HTTP
+# requests start as OTHER_ROUTE until the handler names the branch that matched
+@contextmanager
+def request(event, context, route=None):
+    if not ENABLED:
+        yield _NULL
+        return
+
+    recorder = Recorder(
+        getattr(context, 'function_name', None) or os.environ.get('AWS_LAMBDA_FUNCTION_NAME', 'local'),
+        route or OTHER_ROUTE,
+        getattr(context, 'aws_request_id', None)
+    )
+    token = _current.set(recorder)
+    try:
+        yield recorder
+    except BaseException as e:
+        recorder.error = type(e).__name__
+        raise
+    finally:
+        _current.reset(token)
+        recorder.emit()
+
+
+def current():
+    return _current.get() or _NULL
+
+
+def phase(name):
+    return current().phase(name)
+
+
+def add_bytes(name, count):
+    current().add_bytes(name, count)
+
+
+def count(name, value=1):
+    current().count(name, value)
+
+
+# The Route dimension: always one of the handler's fixed labels, never the raw
+# path, so ids and chunk numbers can't create new metrics
+def set_route(label):
+    recorder = _current.get()
+    if recorder is not None:
+        recorder.route = label
+
+
+# Tolerates a handler that returned nothing: the line records a null status
+def status(response):
+    recorder = _current.get()
+    if recorder is not None and response is not None:
+        recorder.status = response.get('statusCode')
+    return response
+
+
+# Handlers turn exceptions into 500 responses; this keeps the exception type in the log line
+def failed(error):
+    recorder = _current.get()
+    if recorder is not None:
+        recorder.error = type(error).__name__
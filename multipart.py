@@ -0,0 +1,166 @@
+import io
+from urllib.parse import unquote
+
+
+class MultipartError(ValueError):
+    pass
+
+
+# Parse a header value like: form-data; name="file"; filename="a b.jpg"
+def parse_header_params(value):
+    main, _, rest = value.partition(';')
+    params = {}
+    i, n = 0, len(rest)
+    while i < n:
+        while i < n and rest[i] in ' \t;':
+            i += 1
+        eq = rest.find('=', i)
+        if eq == -1:
+            break
+        key = rest[i:eq].strip().lower()
+        i = eq + 1
+        if i < n and rest[i] == '"':
+            # Quoted string, honour backslash escapes
+            i += 1
+            chars = []
+            while i < n and rest[i] != '"':
+                if rest[i] == '\\' and i + 1 < n:
+                    i += 1
+                chars.append(rest[i])
+                i += 1
+            i += 1
+            params[key] = ''.join(chars)
+        else:
+            end = rest.find(';', i)
+            if end == -1:
+                end = n
+            params[key] = rest[i:end].strip()
+            i = end
+    # RFC 5987 extended values (filename*=UTF-8''na%C3%AFve.txt) win over plain ones
+    for key in [k for k in params if k.endswith('*')]:
+        charset, _, encoded = params.pop(key).partition("''")
+        if not encoded:
+            encoded, charset = charset, 'utf-8'
+        try:
+            params[key[:-1]] = unquote(encoded, encoding=charset or 'utf-8', errors='strict')
+        except (LookupError, UnicodeDecodeError):
+            params[key[:-1]] = unquote(encoded, encoding='latin-1')
+    return main.strip().lower(), params
+
+
+def get_boundary(content_type):
+    mime, params = parse_header_params(content_type or '')
+    if mime != 'multipart/form-data' or not params.get('boundary'):
+        raise MultipartError('Invalid content type. Expected multipart/form-data')
+    return params['boundary'].encode('latin-1')
+
+
+class Part:
+    __slots__ = ('headers', 'name', 'filename', 'content_type', 'data')
+
+    def __init__(self, headers, data):
+        self.headers = headers
+        self.data = data
+        _, params = parse_header_params(headers.get('content-disposition', ''))
+        self.name = params.get('name')
+        self.filename = params.get('filename')
+        self.content_type = headers.get('content-type', 'text/plain')
+
+    @property
+    def size(self):
+        return self.data.nbytes
+
+    @property
+    def text(self):
+        return str(self.data, 'utf-8')
+
+
+def parse_headers(raw):
+    headers = {}
+    for line in raw.decode('utf-8', 'replace').split('\r\n'):
+        key, sep, value = line.partition(':')
+        if sep:
+            headers[key.strip().lower()] = value.strip()
+    return headers
+
+
+# Yield each form part as a memoryview over ``body`` without copying the payload.
+def iter_parts(body, content_type):
+    boundary = get_boundary(content_type)
+    if not isinstance(body, (bytes, bytearray)):
+        body = bytes(body)
+    view = memoryview(body)
+    delimiter = b'\r\n--' + boundary
+
+    # The first delimiter may appear without its leading CRLF
+    if body.startswith(delimiter[2:]):
+        pos = len(delimiter) - 2
+    else:
+        pos = body.find(delimiter)
+        if pos == -1:
+            raise MultipartError('Multipart boundary not found in body')
+        pos += len(delimiter)
+
+    while True:
+        if body.startswith(b'--', pos):
+            return
+        line_end = body.find(b'\r\n', pos)
+        if line_end == -1:
+            raise MultipartError('Truncated multipart body')
+        pos = line_end + 2
+
+        if body.startswith(b'\r\n', pos):
+            headers, start = {}, pos + 2
+        else:
+            header_end = body.find(b'\r\n\r\n', pos)
+            if header_end == -1:
+                raise MultipartError('Truncated multipart headers')
+            headers = parse_headers(body[pos:header_end])
+            start = header_end + 4
+
+        end = body.find(delimiter, start)
+        if end == -1:
+            raise MultipartError('Missing closing multipart boundary')
+        yield Part(headers, view[start:end])
+        pos = end + len(delimiter)
+
+
+# Seekable file-like wrapper so boto3 can stream a memoryview without copying it
+class BufferReader(io.RawIOBase):
+    def __init__(self, view):
+        self._view = memoryview(view).cast('B')
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        chunk = self._view[self._pos:self._pos + len(b)]
+        n = chunk.nbytes
+        b[:n] = chunk
+        self._pos += n
+        return n
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self._view.nbytes - self._pos
+        chunk = self._view[self._pos:self._pos + size]
+        self._pos += chunk.nbytes
+        return chunk.tobytes()
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self._view.nbytes
+        self._pos = max(0, min(offset, self._view.nbytes))
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+    def __len__(self):
+        return self._view.nbytes
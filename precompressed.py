@@ -0,0 +1,89 @@
+import base64
+import gzip
+import hashlib
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+
+def get_header(headers, name):
+    name = name.lower()
+    for key, value in (headers or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+# Content codings the client accepts, with their q-values (q=0 means "never")
+def parse_accept_encoding(value):
+    accepted = {}
+    for item in (value or '').split(','):
+        coding, _, params = item.strip().partition(';')
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+    return accepted
+
+
+# A static body rendered once, stored as identity/gzip/brotli variants with strong ETags
+class PrecompressedResponse:
+    PREFERENCE = ('br', 'gzip')
+
+    def __init__(self, body, content_type, cache_control='public, max-age=300', extra_headers=None):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        digest = hashlib.sha256(body).hexdigest()[:32]
+
+        # Each representation needs its own strong ETag
+        self.variants = {None: (body.decode('utf-8'), f'"{digest}"', False)}
+        compressed = {'gzip': gzip.compress(body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            compressed['br'] = brotli.compress(body, quality=11)
+        for coding, data in compressed.items():
+            self.variants[coding] = (base64.b64encode(data).decode('ascii'), f'"{digest}-{coding}"', True)
+
+        self.etags = {etag for _, etag, _ in self.variants.values()}
+        self.headers = {
+            'Content-Type': content_type,
+            'Cache-Control': cache_control,
+            'Vary': 'Accept-Encoding'
+        }
+        self.headers.update(extra_headers or {})
+
+    def choose_encoding(self, accept_encoding):
+        accepted = parse_accept_encoding(accept_encoding)
+        for coding in self.PREFERENCE:
+            q = accepted[coding] if coding in accepted else accepted.get('*', 0.0)
+            if coding in self.variants and q > 0:
+                return coding
+        return None
+
+    def respond(self, request_headers):
+        coding = self.choose_encoding(get_header(request_headers, 'accept-encoding'))
+        body, etag, is_base64 = self.variants[coding]
+        headers = dict(self.headers, ETag=etag)
+
+        # The client's cached copy is still current: no body
+        if_none_match = get_header(request_headers, 'if-none-match')
+        if if_none_match:
+            tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+            if '*' in tags or tags & self.etags:
+                return {'statusCode': 304, 'headers': headers}
+
+        if coding:
+            headers['Content-Encoding'] = coding
+        return {
+            'statusCode': 200,
+            'headers': headers,
+            'body': body,
+            'isBase64Encoded': is_base64
+        }
@@ -0,0 +1,170 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import aws_clients
+
+# Per-client limit on uploads, checked before the body is decoded. Each
+# container answers from a token bucket in memory; what it lets through is
+# added to a shared per-client counter in DynamoDB (UpdateItem ADD) in batches,
+# off the request path, and the total that comes back tells the container when
+# the client has used up its window across all containers.
+ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+# Sustained requests per second and burst size of each client's local bucket
+RATE = float(os.environ.get('RATE_LIMIT_RATE', 1))
+BURST = float(os.environ.get('RATE_LIMIT_BURST', 20))
+# Length of one shared counter, and what a client may spend in it over all containers
+WINDOW = int(os.environ.get('RATE_LIMIT_WINDOW', 60))
+WINDOW_LIMIT = int(os.environ.get('RATE_LIMIT_WINDOW_LIMIT', RATE * WINDOW + BURST))
+# A client's count goes to DynamoDB once this many requests are waiting, or
+# when its last sync is this many seconds old
+SYNC_EVERY = max(1, int(os.environ.get('RATE_LIMIT_SYNC_EVERY', 10)))
+SYNC_INTERVAL = float(os.environ.get('RATE_LIMIT_SYNC_INTERVAL', 5))
+MAX_CLIENTS = int(os.environ.get('RATE_LIMIT_MAX_CLIENTS', 10000))
+TABLE_NAME = os.environ.get('RATE_LIMIT_TABLE', os.environ.get('TABLE_NAME', 'posts'))
+
+KEY_PREFIX = 'rate#'
+
+
+# Authenticated callers are limited per user, everyone else per source IP
+def client_key(event):
+    context = event.get('requestContext') or {}
+    claims = ((context.get('authorizer') or {}).get('jwt') or {}).get('claims') or {}
+    if claims.get('sub'):
+        return f"user#{claims['sub']}"
+    return f"ip#{(context.get('http') or {}).get('sourceIp', '')}"
+
+
+class _Client:
+    __slots__ = ('tokens', 'updated', 'window', 'used', 'pending', 'sending', 'synced')
+
+    def __init__(self, tokens, now, window):
+        self.tokens = tokens
+        self.updated = now
+        self.window = window
+        # Shared total last read back, requests not yet sent, requests being sent
+        self.used = 0
+        self.pending = 0
+        self.sending = 0
+        self.synced = now
+
+
+class RateLimiter:
+    def __init__(self, table=None, rate=None, burst=None, window=None, window_limit=None,
+                 sync_every=None, sync_interval=None, max_clients=None, clock=time.time):
+        self.table = table or aws_clients.Table(TABLE_NAME)
+        self.rate = RATE if rate is None else rate
+        self.burst = BURST if burst is None else burst
+        self.window = window or WINDOW
+        self.window_limit = WINDOW_LIMIT if window_limit is None else window_limit
+        self.sync_every = sync_every or SYNC_EVERY
+        self.sync_interval = SYNC_INTERVAL if sync_interval is None else sync_interval
+        self.max_clients = max_clients or MAX_CLIENTS
+        # Windows are wall-clock aligned so every container adds to the same counter
+        self.clock = clock
+        self.sync_errors = 0
+        self._clients = OrderedDict()
+        # (key, window, count) left over from evicted clients and finished windows
+        self._outbox = []
+        self._lock = threading.Lock()
+        self._syncing = False
+        self._pool = ThreadPoolExecutor(max_workers=1)
+
+    # 0 when the request may go ahead, otherwise the seconds until it may be retried
+    def check(self, key, cost=1):
+        if not ENABLED:
+            return 0
+        now = self.clock()
+        window = int(now // self.window)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = self._clients[key] = _Client(self.burst, now, window)
+                self._evict()
+            else:
+                self._clients.move_to_end(key)
+                if client.window != window:
+                    self._roll(key, client, window)
+                client.tokens = min(self.burst, client.tokens + (now - client.updated) * self.rate)
+                client.updated = now
+
+            wait = 0
+            if client.tokens < cost:
+                wait = (cost - client.tokens) / self.rate if self.rate else self.window
+            if client.used + client.sending + client.pending + cost > self.window_limit:
+                wait = max(wait, (window + 1) * self.window - now)
+            if wait:
+                return wait
+
+            client.tokens -= cost
+            client.pending += cost
+            due = client.pending >= self.sync_every or now - client.synced >= self.sync_interval
+            if due and not self._syncing:
+                self._syncing = True
+                self._pool.submit(self.sync)
+            return 0
+
+    def _roll(self, key, client, window):
+        if client.pending:
+            self._outbox.append((key, client.window, client.pending))
+        client.window = window
+        client.used = client.pending = client.sending = 0
+
+    def _evict(self):
+        while len(self._clients) > self.max_clients:
+            key, client = self._clients.popitem(last=False)
+            if client.pending:
+                self._outbox.append((key, client.window, client.pending))
+
+    # Adds every waiting count to its DynamoDB counter, one UpdateItem per client.
+    # Runs on the limiter's own thread; the handlers never wait for it.
+    def sync(self):
+        try:
+            with self._lock:
+                batch, self._outbox = self._outbox, []
+                now = self.clock()
+                for key, client in self._clients.items():
+                    if client.pending:
+                        batch.append((key, client.window, client.pending))
+                        client.sending += client.pending
+                        client.pending = 0
+                        client.synced = now
+
+            for key, window, count in batch:
+                try:
+                    total = self._add(key, window, count)
+                except Exception:
+                    # Fail open: the local bucket still holds the client back
+                    total = None
+                    self.sync_errors += 1
+                with self._lock:
+                    client = self._clients.get(key)
+                    if client is not None and client.window == window:
+                        client.sending = max(0, client.sending - count)
+                        if total is not None:
+                            client.used = max(client.used, total)
+        finally:
+            with self._lock:
+                self._syncing = False
+
+    def _add(self, key, window, count):
+        response = self.table.update_item(
+            Key={'id': f'{KEY_PREFIX}{key}#{window}'},
+            UpdateExpression='ADD #count :count SET expires_at = if_not_exists(expires_at, :expires)',
+            ExpressionAttributeNames={'#count': 'count'},
+            ExpressionAttributeValues={':count': count, ':expires': (window + 2) * self.window},
+            ReturnValues='UPDATED_NEW'
+        )
+        total = response.get('Attributes', {}).get('count')
+        return int(total) if total is not None else None
+
+    # Blocks until the counts waiting right now are in DynamoDB
+    def flush(self):
+        self._pool.submit(self.sync).result()
+
+
+def retry_after(wait):
+    return str(max(1, math.ceil(wait)))
@@ -0,0 +1,85 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from multipart import BufferReader
+
+MB = 1024 * 1024
+
+# S3 rejects multipart parts smaller than 5 MB (except the last one)
+MIN_PART_SIZE = 5 * MB
+
+PART_SIZE = max(MIN_PART_SIZE, int(os.environ.get('UPLOAD_PART_SIZE', 8 * MB)))
+# Below two parts a multipart upload is just three round trips instead of one.
+# Files posted through API Gateway decode to about 4.5 MB (bodies stop at 6 MB),
+# so the handlers always PUT in one request; multipart is used by the
+# resumable-upload assembly (chunked_upload) and large archives, and by callers
+# handing upload_buffer() bigger buffers.
+MULTIPART_THRESHOLD = int(os.environ.get('UPLOAD_MULTIPART_THRESHOLD', 2 * PART_SIZE))
+CONCURRENCY = max(1, int(os.environ.get('UPLOAD_CONCURRENCY', 4)))
+PART_RETRIES = max(1, int(os.environ.get('UPLOAD_PART_RETRIES', 3)))
+
+
+# Upload a bytes-like buffer, switching to a parallel multipart upload for large files
+def upload_buffer(client, bucket, key, data, content_type=None, threshold=None,
+                  part_size=None, concurrency=None, **extra):
+    view = memoryview(data).cast('B')
+    threshold = MULTIPART_THRESHOLD if threshold is None else threshold
+    if content_type:
+        extra['ContentType'] = content_type
+
+    if view.nbytes < threshold:
+        return client.put_object(Bucket=bucket, Key=key, Body=BufferReader(view), **extra)
+    return multipart_upload(client, bucket, key, view, part_size, concurrency, **extra)
+
+
+def multipart_upload(client, bucket, key, view, part_size=None, concurrency=None, **extra):
+    part_size = max(MIN_PART_SIZE, part_size or PART_SIZE)
+    concurrency = concurrency or CONCURRENCY
+
+    # Parts are zero-copy slices over the decoded upload
+    parts = [
+        (number, view[offset:offset + part_size])
+        for number, offset in enumerate(range(0, view.nbytes, part_size), start=1)
+    ]
+
+    upload_id = client.create_multipart_upload(Bucket=bucket, Key=key, **extra)['UploadId']
+    try:
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(parts))) as pool:
+            etags = list(pool.map(
+                lambda part: upload_part(client, bucket, key, upload_id, *part),
+                parts
+            ))
+
+        return client.complete_multipart_upload(
+            Bucket=bucket,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={
+                'Parts': [
+                    {'PartNumber': number, 'ETag': etag}
+                    for (number, _), etag in zip(parts, etags)
+                ]
+            }
+        )
+    except Exception:
+        # Don't leave orphaned parts behind (they are billed until aborted)
+        client.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        raise
+
+
+def upload_part(client, bucket, key, upload_id, number, chunk):
+    for attempt in range(1, PART_RETRIES + 1):
+        try:
+            response = client.upload_part(
+                Bucket=bucket,
+                Key=key,
+                UploadId=upload_id,
+                PartNumber=number,
+                Body=BufferReader(chunk)
+            )
+            return response['ETag']
+        except Exception:
+            if attempt == PART_RETRIES:
+                raise
+            time.sleep(0.1 * 2 ** (attempt - 1))
@@ -0,0 +1,545 @@
+import array
+import bisect
+import collections
+import heapq
+import json
+import math
+import os
+import random
+import re
+import struct
+import sys
+import threading
+import time
+import uuid
+import zlib
+
+import aws_clients
+import jobs
+
+# Inverted index over the text fields of uploads, kept in S3 as two segments:
+# a large "base" that changes rarely and a small "tail" that every new upload
+# is added to. Both are cached per container and refreshed by ETag.
+ENABLED = os.environ.get('SEARCH_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+PREFIX = os.environ.get('SEARCH_PREFIX', 'search/')
+# How often a warm container checks S3 for newer segments
+REFRESH_SECONDS = float(os.environ.get('SEARCH_REFRESH_SECONDS', 30))
+# Once the tail holds more uploads than this it is merged into the base
+TAIL_MAX_DOCS = int(os.environ.get('SEARCH_TAIL_MAX_DOCS', 2000))
+# An upload is only added inside its own request while the tail is this small
+# (one GET, a rebuild of a few ms, one conditional PUT). Past it, or when the
+# PUT loses a race, the documents are parked under pending/ for the merger.
+INLINE_TAIL_MAX_DOCS = min(TAIL_MAX_DOCS, int(os.environ.get('SEARCH_INLINE_TAIL_MAX_DOCS', 500)))
+PENDING_PREFIX = PREFIX + 'pending/'
+# Bucket the scheduled merger (lambda_handler below) works on
+BUCKET_NAME = os.environ.get('SEARCH_BUCKET', os.environ.get('BUCKET_NAME', ''))
+# Parked documents folded in per merger run
+COMPACT_MAX_OBJECTS = int(os.environ.get('SEARCH_COMPACT_MAX_OBJECTS', 10000))
+# Index words one query prefix may expand to, and documents scored for a multi-word query
+MAX_EXPANSIONS = 64
+MAX_CANDIDATES = 20000
+WRITE_ATTEMPTS = 8
+
+# A word in these fields counts this many times (name/caption come from lambdafunction.py)
+FIELD_WEIGHTS = {'name': 3, 'caption': 2, 'description': 2, 'filename': 1}
+MAX_TOKEN_LENGTH = 40
+
+# BM25; impacts are at most K1 + 1 and are stored scaled as uint16
+K1 = 1.2
+B = 0.75
+IMPACT_SCALE = 10000
+
+# Letters and digits, keeping Devanagari vowel signs attached to their word
+TOKEN = re.compile(r'(?:[^\W_]|[\u0900-\u0963\u0966-\u097f])+')
+MAGIC = b'SIX1'
+
+
+def tokenize(text):
+    return [token[:MAX_TOKEN_LENGTH] for token in TOKEN.findall((text or '').casefold())]
+
+
+# (upload id, {field: text}) for the searchable fields of a DynamoDB item
+def document(item):
+    return item['id'], {field: item[field] for field in FIELD_WEIGHTS if item.get(field)}
+
+
+def _norm(length, avg_length):
+    return K1 * (1 - B + B * length / avg_length)
+
+
+# Collects documents and lays them out as a Segment. Adding an id that is
+# already present replaces the older version.
+class Builder:
+    def __init__(self):
+        self.ids = []
+        self.lengths = array.array('H')
+        self.offsets = array.array('I', [0])
+        self.tokens = array.array('I')
+        self.weights = array.array('B')
+        self.vocab = []
+        self._token_ids = {}
+        self._positions = {}
+
+    def __len__(self):
+        return len(self._positions)
+
+    def add(self, doc_id, fields):
+        weights = collections.Counter()
+        length = 0
+        for field, text in fields.items():
+            words = tokenize(text)
+            length += len(words)
+            for word in words:
+                weights[word] += FIELD_WEIGHTS.get(field, 1)
+        self._append(doc_id, [(self._token_id(word), min(weight, 255)) for word, weight in weights.items()], length)
+
+    def extend(self, segment):
+        if not self.ids:
+            # Nothing to merge with: take the segment's arrays as they are
+            self.ids = list(segment.ids)
+            self.lengths = array.array('H', segment.lengths)
+            self.offsets = array.array('I', segment.fwd_offsets)
+            self.tokens = array.array('I', segment.fwd_tokens)
+            self.weights = array.array('B', segment.fwd_weights)
+            self.vocab = list(segment.vocab)
+            self._token_ids = {word: number for number, word in enumerate(self.vocab)}
+            self._positions = {doc_id: number for number, doc_id in enumerate(self.ids)}
+            return
+        mapping = [self._token_id(word) for word in segment.vocab]
+        for doc in range(len(segment)):
+            entries = range(segment.fwd_offsets[doc], segment.fwd_offsets[doc + 1])
+            self._append(
+                segment.ids[doc],
+                [(mapping[segment.fwd_tokens[i]], segment.fwd_weights[i]) for i in entries],
+                segment.lengths[doc]
+            )
+
+    def _token_id(self, word):
+        number = self._token_ids.get(word)
+        if number is None:
+            number = self._token_ids[word] = len(self.vocab)
+            self.vocab.append(word)
+        return number
+
+    def _append(self, doc_id, entries, length):
+        self._positions[doc_id] = len(self.ids)
+        self.ids.append(doc_id)
+        self.lengths.append(min(length, 65535))
+        for number, weight in entries:
+            self.tokens.append(number)
+            self.weights.append(weight)
+        self.offsets.append(len(self.tokens))
+
+    def _drop_replaced(self):
+        if len(self._positions) == len(self.ids):
+            return
+        old = (self.ids, self.lengths, self.offsets, self.tokens, self.weights)
+        live = sorted(self._positions.values())
+        self.ids, self.lengths, self.offsets = [], array.array('H'), array.array('I', [0])
+        self.tokens, self.weights, self._positions = array.array('I'), array.array('B'), {}
+        ids, lengths, offsets, tokens, weights = old
+        for doc in live:
+            entries = range(offsets[doc], offsets[doc + 1])
+            self._append(ids[doc], [(tokens[i], weights[i]) for i in entries], lengths[doc])
+
+    def build(self, generation=0):
+        self._drop_replaced()
+        count = len(self.ids)
+        avg_length = max(1.0, sum(self.lengths) / count) if count else 1.0
+
+        # Index words in sorted order (for prefix ranges), dropping ones no document uses any more
+        df = collections.Counter(self.tokens)
+        vocab = sorted(self.vocab[number] for number in df)
+        renumber = array.array('I', bytes(4 * len(self.vocab)))
+        for number, word in enumerate(vocab):
+            renumber[self._token_ids[word]] = number
+        fwd_tokens = array.array('I', map(renumber.__getitem__, self.tokens))
+
+        post_offsets = array.array('I', [0])
+        for word in vocab:
+            post_offsets.append(post_offsets[-1] + df[self._token_ids[word]])
+        post_docs = array.array('I', bytes(4 * len(fwd_tokens)))
+        post_impacts = array.array('H', bytes(2 * len(fwd_tokens)))
+
+        # Lay postings out token by token, then order each list by impact (newest first on ties)
+        fill = array.array('I', post_offsets[:-1])
+        lengths, offsets, weights = self.lengths, self.offsets, self.weights
+        top = (K1 + 1) * IMPACT_SCALE
+        for doc in range(count):
+            norm = _norm(lengths[doc], avg_length)
+            for i in range(offsets[doc], offsets[doc + 1]):
+                number = fwd_tokens[i]
+                slot = fill[number]
+                fill[number] = slot + 1
+                post_docs[slot] = doc
+                weight = weights[i]
+                post_impacts[slot] = int(weight * top / (weight + norm))
+        for number in range(len(vocab)):
+            start, end = post_offsets[number], post_offsets[number + 1]
+            if end - start > 1:
+                ranked = sorted(zip(post_impacts[start:end], post_docs[start:end]), reverse=True)
+                post_impacts[start:end] = array.array('H', [impact for impact, _ in ranked])
+                post_docs[start:end] = array.array('I', [doc for _, doc in ranked])
+
+        return Segment(
+            generation, list(self.ids), array.array('H', self.lengths), avg_length, vocab,
+            post_offsets, post_docs, post_impacts,
+            array.array('I', self.offsets), fwd_tokens, array.array('B', self.weights)
+        )
+
+
+# An immutable, compact index: impact-ordered postings per word plus a forward
+# index (words per document) used to score multi-word queries and to rebuild
+class Segment:
+    def __init__(self, generation, ids, lengths, avg_length, vocab,
+                 post_offsets, post_docs, post_impacts, fwd_offsets, fwd_tokens, fwd_weights):
+        self.generation = generation
+        self.ids = ids
+        self.lengths = lengths
+        self.avg_length = avg_length
+        self.vocab = vocab
+        self.post_offsets = post_offsets
+        self.post_docs = post_docs
+        self.post_impacts = post_impacts
+        self.fwd_offsets = fwd_offsets
+        self.fwd_tokens = fwd_tokens
+        self.fwd_weights = fwd_weights
+
+    def __len__(self):
+        return len(self.ids)
+
+    # Token numbers starting with ``prefix``; they form one range of the sorted vocabulary
+    def prefix_range(self, prefix):
+        start = bisect.bisect_left(self.vocab, prefix)
+        return start, bisect.bisect_left(self.vocab, prefix + '\U0010ffff', start)
+
+    def df(self, word):
+        number = bisect.bisect_left(self.vocab, word)
+        if number < len(self.vocab) and self.vocab[number] == word:
+            return self.post_offsets[number + 1] - self.post_offsets[number]
+        return 0
+
+    def _postings(self, number, multiplier):
+        for i in range(self.post_offsets[number], self.post_offsets[number + 1]):
+            yield -self.post_impacts[i] * multiplier, self.post_docs[i]
+
+    # (score, doc) for every document matching one query term, best first. A document
+    # scores by its best-matching word, so the first time it comes out of the merge is final.
+    def _ranked(self, term, weigh):
+        start, end = self.prefix_range(term)
+        numbers = range(start, end)
+        if len(numbers) > MAX_EXPANSIONS:
+            numbers = heapq.nlargest(
+                MAX_EXPANSIONS, numbers, key=lambda n: (self.vocab[n] == term, self.post_offsets[n + 1] - self.post_offsets[n])
+            )
+        seen = set()
+        streams = [self._postings(number, weigh(term, self.vocab[number])) for number in numbers]
+        for score, doc in heapq.merge(*streams):
+            if doc not in seen:
+                seen.add(doc)
+                yield -score / IMPACT_SCALE, doc
+
+    # Best score any word of ``doc`` gets for ``term``, from the forward index
+    def _term_score(self, doc, term, term_range, weigh):
+        start, end = term_range
+        best = 0.0
+        norm = _norm(self.lengths[doc], self.avg_length)
+        for i in range(self.fwd_offsets[doc], self.fwd_offsets[doc + 1]):
+            number = self.fwd_tokens[i]
+            if start <= number < end:
+                weight = self.fwd_weights[i]
+                best = max(best, weight * (K1 + 1) / (weight + norm) * weigh(term, self.vocab[number]))
+        return best
+
+    # Top ``limit`` (doc id, score) for documents matching every term, skipping ids in ``skip``
+    def search(self, terms, limit, weigh, skip=()):
+        ranges = [self.prefix_range(term) for term in terms]
+        if any(start == end for start, end in ranges):
+            return []
+        # Walk the rarest term's postings and check the others through the forward index
+        sizes = [self.post_offsets[end] - self.post_offsets[start] for start, end in ranges]
+        driver = sizes.index(min(sizes))
+        others = [(term, term_range) for i, (term, term_range) in enumerate(zip(terms, ranges)) if i != driver]
+
+        # Driver scores only go down, so once even the best the other terms could add
+        # can't reach the current top ``limit``, nothing further down can either
+        bound = sum(self._best_possible(term, term_range, weigh) for term, term_range in others)
+        top = []
+        for examined, (score, doc) in enumerate(self._ranked(terms[driver], weigh)):
+            if examined == MAX_CANDIDATES or (len(top) == limit and score + bound <= top[0][0]):
+                break
+            if self.ids[doc] in skip:
+                continue
+            for term, term_range in others:
+                extra = self._term_score(doc, term, term_range, weigh)
+                if not extra:
+                    break
+                score += extra
+            else:
+                if len(top) < limit:
+                    heapq.heappush(top, (score, self.ids[doc]))
+                elif score > top[0][0]:
+                    heapq.heapreplace(top, (score, self.ids[doc]))
+        return [(doc_id, score) for score, doc_id in sorted(top, reverse=True)]
+
+    # Upper bound of _term_score() for any document; unbounded for very short prefixes
+    def _best_possible(self, term, term_range, weigh):
+        start, end = term_range
+        if end - start > MAX_EXPANSIONS:
+            return math.inf
+        return (K1 + 1) * max(weigh(term, self.vocab[number]) for number in range(start, end))
+
+    def to_bytes(self):
+        header = {
+            'generation': self.generation,
+            'avg_length': self.avg_length,
+            'byteorder': sys.byteorder
+        }
+        sections = [
+            json.dumps(header).encode(),
+            '\n'.join(self.ids).encode(),
+            '\n'.join(self.vocab).encode(),
+            self.lengths.tobytes(),
+            self.post_offsets.tobytes(),
+            self.post_docs.tobytes(),
+            self.post_impacts.tobytes(),
+            self.fwd_offsets.tobytes(),
+            self.fwd_tokens.tobytes(),
+            self.fwd_weights.tobytes()
+        ]
+        payload = b''.join(struct.pack('<Q', len(section)) + section for section in sections)
+        return MAGIC + zlib.compress(payload, 1)
+
+    @classmethod
+    def from_bytes(cls, data):
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError('Not a search index segment')
+        payload = memoryview(zlib.decompress(data[len(MAGIC):]))
+        sections, position = [], 0
+        while position < len(payload):
+            size, = struct.unpack_from('<Q', payload, position)
+            sections.append(payload[position + 8:position + 8 + size])
+            position += 8 + size
+        header = json.loads(bytes(sections[0]))
+
+        def load(typecode, section):
+            values = array.array(typecode)
+            values.frombytes(section)
+            if header['byteorder'] != sys.byteorder:
+                values.byteswap()
+            return values
+
+        def lines(section):
+            return str(section, 'utf-8').split('\n') if len(section) else []
+
+        return cls(
+            header['generation'], lines(sections[1]), load('H', sections[3]), header['avg_length'], lines(sections[2]),
+            load('I', sections[4]), load('I', sections[5]), load('H', sections[6]),
+            load('I', sections[7]), load('I', sections[8]), load('B', sections[9])
+        )
+
+
+# Ranked prefix search over segments, oldest first: every query word matches
+# index words starting with it, exact matches and rarer words score higher.
+# A document in a later segment hides its older version in an earlier one.
+def rank(segments, text, limit=20):
+    terms = list(dict.fromkeys(tokenize(text)))
+    segments = [segment for segment in segments if segment is not None and len(segment)]
+    if not terms or not segments:
+        return []
+
+    total = sum(len(segment) for segment in segments)
+    idf = {}
+
+    def weigh(term, word):
+        if word not in idf:
+            df = sum(segment.df(word) for segment in segments)
+            idf[word] = math.log(1 + (total - df + 0.5) / (df + 0.5))
+        return idf[word] * (1.0 if word == term else 0.5 + 0.5 * len(term) / len(word))
+
+    hits, newer = [], set()
+    for position, segment in enumerate(reversed(segments)):
+        hits.extend(segment.search(terms, limit, weigh, newer))
+        if position < len(segments) - 1:
+            newer.update(segment.ids)
+    return heapq.nlargest(limit, hits, key=lambda hit: hit[1])
+
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _key(name):
+    return f'{PREFIX}{name}.six'
+
+
+# (etag, segment) of one segment object; (None, None) if it doesn't exist
+# and (etag, None) if it still matches ``etag``
+def _read(client, bucket, name, etag=None):
+    params = {'Bucket': bucket, 'Key': _key(name)}
+    if etag:
+        params['IfNoneMatch'] = etag
+    try:
+        response = client.get_object(**params)
+    except Exception as e:
+        if aws_clients.error_code(e) == '304':
+            return etag, None
+        if aws_clients.is_missing(e):
+            return None, None
+        raise
+    return response['ETag'], Segment.from_bytes(response['Body'].read())
+
+
+# The write only lands if nobody else changed the object since it was read
+def _write(client, bucket, name, segment, etag):
+    condition = {'IfMatch': etag} if etag else {'IfNoneMatch': '*'}
+    client.put_object(
+        Bucket=bucket, Key=_key(name), Body=segment.to_bytes(), ContentType='application/octet-stream', **condition
+    )
+
+
+# [base, tail] for ``bucket``, from the container's cache when it was checked recently
+def segments(client, bucket, max_age=None):
+    max_age = REFRESH_SECONDS if max_age is None else max_age
+    with _cache_lock:
+        cached = _cache.setdefault(bucket, {'checked': None, 'base': (None, None), 'tail': (None, None)})
+        if cached['checked'] is None or time.monotonic() - cached['checked'] >= max_age:
+            for name in ('base', 'tail'):
+                etag, segment = _read(client, bucket, name, cached[name][0])
+                if segment is not None or etag is None:
+                    cached[name] = (etag, segment)
+            cached['checked'] = time.monotonic()
+        return [cached['base'][1], cached['tail'][1]]
+
+
+def query(client, bucket, text, limit=20):
+    return rank(segments(client, bucket), text, limit)
+
+
+def _changed(bucket):
+    with _cache_lock:
+        if bucket in _cache:
+            _cache[bucket]['checked'] = None
+
+
+_CONFLICTS = ('PreconditionFailed', 'ConditionalRequestConflict', '412', '409')
+
+
+# Add (upload id, fields) documents to the tail, merging it into the base when
+# it gets too big. Concurrent writers retry on the conditional write. This can
+# rebuild the whole base, so it only runs in the job worker and the merger.
+def add_documents(client, bucket, docs):
+    for attempt in range(WRITE_ATTEMPTS):
+        tail_etag, tail = _read(client, bucket, 'tail')
+        builder = Builder()
+        if tail is not None:
+            builder.extend(tail)
+        for doc_id, fields in docs:
+            builder.add(doc_id, fields)
+        generation = (tail.generation if tail is not None else 0) + 1
+        try:
+            if len(builder) > TAIL_MAX_DOCS:
+                _merge(client, bucket, builder.build(generation), tail_etag)
+            else:
+                _write(client, bucket, 'tail', builder.build(generation), tail_etag)
+            _changed(bucket)
+            return
+        except Exception as e:
+            if aws_clients.error_code(e) not in _CONFLICTS:
+                raise
+        time.sleep(random.uniform(0, 0.05 * 2 ** attempt))
+    raise RuntimeError('Search index is busy; the documents were not added')
+
+
+def _merge(client, bucket, tail, tail_etag):
+    base_etag, base = _read(client, bucket, 'base')
+    builder = Builder()
+    if base is not None:
+        builder.extend(base)
+    builder.extend(tail)
+    _write(client, bucket, 'base', builder.build((base.generation if base is not None else 0) + 1), base_etag)
+    # If this write loses a race the documents are in the base already; the retry adds them to the tail again
+    _write(client, bucket, 'tail', Builder().build(tail.generation + 1), tail_etag)
+
+
+# Request path: at most one read and one conditional write of a small tail,
+# never a merge. Returns False when the documents were parked instead.
+def add_inline(client, bucket, docs):
+    try:
+        tail_etag, tail = _read(client, bucket, 'tail')
+        if tail is None or len(tail) + len(docs) <= INLINE_TAIL_MAX_DOCS:
+            builder = Builder()
+            if tail is not None:
+                builder.extend(tail)
+            for doc_id, fields in docs:
+                builder.add(doc_id, fields)
+            _write(client, bucket, 'tail', builder.build((tail.generation if tail is not None else 0) + 1), tail_etag)
+            _changed(bucket)
+            return True
+    except Exception:
+        # A lost race or a failed read: the merger adds the documents instead
+        pass
+    park(client, bucket, docs)
+    return False
+
+
+# One small object per batch, picked up by compact(); searchable after the next merger run
+def park(client, bucket, docs):
+    client.put_object(
+        Bucket=bucket,
+        Key=f'{PENDING_PREFIX}{uuid.uuid4().hex}.json',
+        Body=json.dumps([[doc_id, fields] for doc_id, fields in docs], separators=(',', ':')).encode('utf-8'),
+        ContentType='application/json'
+    )
+
+
+# Index newly stored items: through the job queue when there is one, otherwise
+# into a small tail or the pending/ area (see add_inline). False when parked.
+def submit(client, bucket, items):
+    if not ENABLED or not items:
+        return
+    docs = [document(item) for item in items]
+    if jobs.enabled():
+        jobs.enqueue([('search.index', doc_id, {'bucket': bucket, 'fields': fields}) for doc_id, fields in docs])
+        return True
+    return add_inline(client, bucket, docs)
+
+
+def run_job(upload_id, payload):
+    add_documents(aws_clients.s3(), payload['bucket'], [(upload_id, payload['fields'])])
+
+
+def _pending_keys(client, bucket, limit):
+    keys = []
+    params = {'Bucket': bucket, 'Prefix': PENDING_PREFIX}
+    while len(keys) < limit:
+        response = client.list_objects_v2(**params)
+        keys.extend(entry['Key'] for entry in response.get('Contents', []))
+        if not response.get('IsTruncated'):
+            break
+        params['ContinuationToken'] = response['NextContinuationToken']
+    return keys[:limit]
+
+
+# Folds parked documents into the index (merging the tail into the base when it
+# is full) and deletes them. A failed run leaves them for the next one; adding a
+# document twice replaces it. Returns how many documents went in.
+def compact(client, bucket, limit=None):
+    keys = _pending_keys(client, bucket, limit or COMPACT_MAX_OBJECTS)
+    docs = []
+    for key in keys:
+        docs.extend((doc_id, fields) for doc_id, fields in json.loads(client.get_object(Bucket=bucket, Key=key)['Body'].read()))
+    if docs:
+        add_documents(client, bucket, docs)
+    for start in range(0, len(keys), 1000):
+        client.delete_objects(
+            Bucket=bucket, Delete={'Objects': [{'Key': key} for key in keys[start:start + 1000]], 'Quiet': True}
+        )
+    return len(docs)
+
+
+# Scheduled merger, run by an EventBridge rule (e.g. every minute) with
+# {"bucket": ...} or SEARCH_BUCKET. Handler: search.lambda_handler
+def lambda_handler(event, context):
+    bucket = (event or {}).get('bucket') or BUCKET_NAME
+    return {'indexed': compact(aws_clients.s3(), bucket)}
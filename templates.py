@@ -0,0 +1,51 @@
+import re
+
+_SLOT = re.compile(r'\{\{\s*(\w+)\s*\}\}')
+
+
+def _ascii(text):
+    # Non-ASCII characters become &#NNNN; references so the page stays a compact 1-byte-per-char str
+    if text.isascii():
+        return text
+    return text.encode('ascii', 'xmlcharrefreplace').decode('ascii')
+
+
+# html.escape(quote=True) and _ascii in one pass. Each replace only runs for a
+# character that is there, and most values (ids, plain names) have none.
+def _escape(value):
+    if type(value) is not str:
+        value = str(value)
+    if '&' in value:
+        value = value.replace('&', '&amp;')
+    if '<' in value:
+        value = value.replace('<', '&lt;')
+    if '>' in value:
+        value = value.replace('>', '&gt;')
+    if '"' in value:
+        value = value.replace('"', '&quot;')
+    if "'" in value:
+        value = value.replace("'", '&#x27;')
+    if value.isascii():
+        return value
+    return value.encode('ascii', 'xmlcharrefreplace').decode('ascii')
+
+
+# A page with {{ name }} slots. The static text is split into ASCII chunks once, at
+# import time; render() drops the escaped values into a copy of the chunk list and joins it.
+class Template:
+    def __init__(self, source):
+        self._pieces = [_ascii(piece) for piece in _SLOT.split(source)]
+        # Odd positions hold slot names, even positions the static text around them
+        positions = {}
+        for index in range(1, len(self._pieces), 2):
+            positions.setdefault(self._pieces[index], []).append(index)
+        self._slots = list(positions.items())
+        self.names = set(positions)
+
+    def render(self, **values):
+        out = self._pieces.copy()
+        for name, indexes in self._slots:
+            value = _escape(values[name])
+            for index in indexes:
+                out[index] = value
+        return ''.join(out)
@@ -0,0 +1,36 @@
+import io
+import unittest
+import zipfile
+
+import archive
+from tests.local_backend import LocalBackendTestCase
+
+
+class EntryNameTest(unittest.TestCase):
+    def test_paths_are_reduced_to_their_base_name(self):
+        self.assertEqual(
+            archive.unique_names(['../../etc/cron.d/x', '..\\..\\boot.ini', '/abs/path.txt', 'C:\\temple\\bell.wav']),
+            ['x', 'boot.ini', 'path.txt', 'bell.wav']
+        )
+
+    def test_names_with_nothing_left_get_a_default(self):
+        self.assertEqual(archive.unique_names(['..', 'dir/', None]), ['upload.bin', 'upload (2).bin', 'upload (3).bin'])
+
+    def test_numbered_copies_never_collide_with_given_names(self):
+        self.assertEqual(
+            archive.unique_names(['a (2).txt', 'a.txt', 'a.txt', 'A.TXT', 'a (3).txt']),
+            ['a (2).txt', 'a.txt', 'a (3).txt', 'A (4).TXT', 'a (3) (2).txt']
+        )
+
+
+class BuildTest(LocalBackendTestCase):
+    def test_archive_entries_stay_inside_the_folder(self):
+        for key in ('uploads/1', 'uploads/2'):
+            self.s3.put_object(Bucket='bucket', Key=key, Body=key.encode())
+
+        data, key = archive.build(self.s3, 'bucket', [('uploads/1', '../../evil.sh'), ('uploads/2', 'evil.sh')], 'archives/x.zip')
+
+        self.assertIsNone(key)
+        with zipfile.ZipFile(io.BytesIO(data)) as built:
+            self.assertEqual(built.namelist(), ['evil.sh', 'evil (2).sh'])
+            self.assertEqual(built.read('evil (2).sh'), b'uploads/2')
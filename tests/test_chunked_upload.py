@@ -0,0 +1,102 @@
+import base64
+import json
+import types
+import uuid
+from unittest import mock
+
+import chunked_upload
+import s3_upload
+from tests.local_backend import LocalBackendTestCase, load_handler
+
+handler = load_handler('lambda.py')
+
+DATA = bytes(range(256)) * 20  # 5120 bytes: five 1 KB chunks, three parts of two chunks
+
+
+def request(method, path, payload=None, body=None):
+    return {
+        'rawPath': path,
+        'requestContext': {'http': {'method': method, 'path': path, 'sourceIp': '198.51.100.7'}},
+        'headers': {'content-type': 'application/octet-stream' if body is not None else 'application/json'},
+        'body': base64.b64encode(body).decode() if body is not None else json.dumps(payload or {}),
+        'isBase64Encoded': body is not None
+    }
+
+
+class ChunkedUploadTest(LocalBackendTestCase):
+    def setUp(self):
+        super().setUp()
+        self.context = types.SimpleNamespace(aws_request_id=str(uuid.uuid4()), function_name='uploader')
+        for patcher in (
+            mock.patch.object(chunked_upload, 'CHUNK_SIZE', 1024),
+            mock.patch.object(s3_upload, 'PART_SIZE', 2048),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def call(self, *args, **kwargs):
+        return handler.lambda_handler(request(*args, **kwargs), self.context)
+
+    def send_all(self, filename='hymns.bin'):
+        response = self.call('POST', '/uploads/chunked', {'filename': filename, 'size': len(DATA)})
+        self.assertEqual(response['statusCode'], 200)
+        session = json.loads(response['body'])
+        for number in range(1, session['total_chunks'] + 1):
+            chunk = DATA[(number - 1) * 1024:number * 1024]
+            response = self.call('PUT', f"/uploads/chunked/{session['file_id']}/{number}", body=chunk)
+            self.assertEqual(response['statusCode'], 200)
+        return session['file_id']
+
+    def stored(self, file_id):
+        item = handler.table.get_item(Key={'id': file_id})['Item']
+        return self.s3.get_object(Bucket=handler.BUCKET_NAME, Key=item['s3_key'])['Body'].read()
+
+    def test_complete_joins_the_chunks_in_order(self):
+        file_id = self.send_all()
+
+        with mock.patch.object(s3_upload, 'upload_part', wraps=s3_upload.upload_part) as upload_part:
+            response = self.call('POST', f'/uploads/chunked/{file_id}/complete')
+
+        self.assertEqual(response['statusCode'], 200)
+        self.assertEqual(self.stored(file_id), DATA)
+        self.assertEqual(sorted(call.args[4] for call in upload_part.call_args_list), [1, 2, 3])
+        self.assertFalse(self.s3.list_objects_v2(Bucket=handler.BUCKET_NAME, Prefix=f'chunks/{file_id}/').get('Contents'))
+
+    def test_repeated_complete_succeeds_without_assembling_again(self):
+        file_id = self.send_all()
+        self.assertEqual(self.call('POST', f'/uploads/chunked/{file_id}/complete')['statusCode'], 200)
+        listed = handler.table.get_item(Key={'id': file_id})['Item']
+
+        with mock.patch.object(chunked_upload, '_assemble') as assemble:
+            response = self.call('POST', f'/uploads/chunked/{file_id}/complete')
+
+        self.assertEqual(response['statusCode'], 200)
+        self.assertIn('hymns.bin', response['body'])
+        assemble.assert_not_called()
+        # The item written by the first complete is left as it was
+        self.assertEqual(handler.table.get_item(Key={'id': file_id})['Item'], listed)
+
+    def test_a_complete_that_loses_the_race_answers_with_the_winner(self):
+        file_id = self.send_all()
+        assemble = chunked_upload._assemble
+
+        # The other complete finishes while this one is still sending parts
+        def finish_elsewhere(*args):
+            assemble(*args)
+            handler.table.update_item(
+                Key={'id': file_id},
+                UpdateExpression='SET #status = :complete REMOVE chunks',
+                ExpressionAttributeNames={'#status': 'status'},
+                ExpressionAttributeValues={':complete': 'complete'}
+            )
+
+        with mock.patch.object(chunked_upload, '_assemble', side_effect=finish_elsewhere):
+            item = chunked_upload.complete_upload(self.s3, handler.table, handler.BUCKET_NAME, file_id)
+
+        self.assertEqual(item['status'], 'complete')
+        self.assertEqual(self.stored(file_id), DATA)
+
+    def test_oversized_sessions_are_refused(self):
+        size = 1024 * chunked_upload.MAX_CHUNKS + 1
+        response = self.call('POST', '/uploads/chunked', {'filename': 'hymns.bin', 'size': size})
+        self.assertEqual(response['statusCode'], 409)
@@ -0,0 +1,47 @@
+import gzip
+import io
+import unittest
+
+from PIL import Image
+
+import content_types
+
+
+def encoded(fmt, **options):
+    out = io.BytesIO()
+    Image.new('RGB', (8, 8), (200, 90, 30)).save(out, fmt, **options)
+    return out.getvalue()
+
+
+class SniffTest(unittest.TestCase):
+    def test_detects_images_from_their_headers(self):
+        for fmt, mime in (('BMP', 'image/bmp'), ('PNG', 'image/png'), ('JPEG', 'image/jpeg'), ('WEBP', 'image/webp')):
+            self.assertEqual(content_types.sniff(encoded(fmt), 'upload'), mime)
+
+    def test_text_starting_with_short_magic_stays_text(self):
+        for text in (b'BMW service notes: oil change due\n', b'ID3 tags hold the song title\n'):
+            self.assertEqual(content_types.sniff(text, 'notes.txt'), 'text/plain; charset=utf-8')
+
+    def test_confirms_mp3_headers(self):
+        tagged = b'ID3\x04\x00\x00\x00\x00\x01\x00' + bytes(32)
+        frame = b'\xff\xfb\x90\x64' + bytes(32)
+        self.assertEqual(content_types.sniff(tagged), 'audio/mpeg')
+        self.assertEqual(content_types.sniff(frame), 'audio/mpeg')
+        self.assertEqual(content_types.sniff(b'\xff\xfb\xf0\x00' + bytes(32)), content_types.DEFAULT_TYPE)
+
+    def test_compressed_files_keep_their_container_type(self):
+        data = gzip.compress(b'2024-01-01 bells rang\n' * 100)
+        self.assertEqual(content_types.sniff(data, 'log.txt.gz'), 'application/gzip')
+        self.assertEqual(content_types.declared_type('text/plain', 'log.txt.gz'), content_types.DEFAULT_TYPE)
+        self.assertEqual(content_types.declared_type('application/gzip', 'log.txt.gz'), 'application/gzip')
+
+    def test_zip_containers_take_the_extension_type(self):
+        self.assertEqual(
+            content_types.sniff(b'PK\x03\x04' + bytes(64), 'hymns.docx'),
+            'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+        )
+
+    def test_never_labels_active_content(self):
+        for filename in ('page.html', 'icon.svg', 'feed.xml', 'app.js'):
+            self.assertEqual(content_types.sniff(b'<x>hello</x>', filename), 'text/plain; charset=utf-8')
+            self.assertEqual(content_types.declared_type('text/html', filename), content_types.DEFAULT_TYPE)
@@ -0,0 +1,99 @@
+import json
+import types
+import uuid
+from unittest import mock
+
+import local_storage
+from tests.local_backend import LocalBackendTestCase, load_handler
+
+handler = load_handler('lambda.py')
+
+
+def request(method, path, payload=None, query=None):
+    return {
+        'rawPath': path,
+        'requestContext': {'http': {'method': method, 'path': path, 'sourceIp': '198.51.100.7'}},
+        'headers': {'content-type': 'application/json'},
+        'queryStringParameters': query,
+        'body': json.dumps(payload) if payload is not None else None,
+        'isBase64Encoded': False
+    }
+
+
+class DirectUploadTest(LocalBackendTestCase):
+    def setUp(self):
+        super().setUp()
+        self.context = types.SimpleNamespace(aws_request_id=str(uuid.uuid4()), function_name='uploader')
+
+    def call(self, *args, **kwargs):
+        return handler.lambda_handler(request(*args, **kwargs), self.context)
+
+    def presign(self, filename, content_type=None):
+        response = self.call('POST', '/uploads/presign', {'filename': filename, 'content_type': content_type})
+        self.assertEqual(response['statusCode'], 200)
+        return json.loads(response['body'])
+
+    # What the browser does with the presigned URL
+    def put(self, grant, body):
+        self.assertEqual(grant['method'], 'PUT')
+        self.s3.put_object(Bucket=handler.BUCKET_NAME, Key=grant['key'], Body=body,
+                           ContentType=grant['headers']['Content-Type'])
+
+    def test_presign_put_complete_records_the_upload(self):
+        grant = self.presign('offering.pdf', 'application/pdf')
+        self.assertTrue(grant['key'].startswith(f"uploads/{grant['file_id']}_"))
+        self.put(grant, b'%PDF-1.7 sacred scroll')
+
+        response = self.call('POST', '/uploads/complete',
+                             {'file_id': grant['file_id'], 'filename': 'offering.pdf', 'description': 'Evening aarti'})
+
+        self.assertEqual(response['statusCode'], 200)
+        self.assertIn('offering.pdf', response['body'])
+        item = handler.table.get_item(Key={'id': grant['file_id']})['Item']
+        self.assertEqual((item['s3_key'], item['status'], item['description']),
+                         (grant['key'], 'complete', 'Evening aarti'))
+        listed = json.loads(self.call('GET', '/uploads')['body'])['items']
+        self.assertEqual([entry['id'] for entry in listed], [grant['file_id']])
+
+    def test_complete_without_the_object_is_a_conflict(self):
+        grant = self.presign('offering.pdf', 'application/pdf')
+
+        response = self.call('POST', '/uploads/complete', {'file_id': grant['file_id'], 'filename': 'offering.pdf'})
+
+        self.assertEqual(response['statusCode'], 409)
+        self.assertNotIn('Item', handler.table.get_item(Key={'id': grant['file_id']}))
+
+    # A role without s3:ListBucket gets 403, not 404, for a key that isn't there
+    def test_complete_without_list_permission_is_still_a_conflict(self):
+        grant = self.presign('offering.pdf', 'application/pdf')
+
+        with mock.patch.object(self.s3, 'head_object', side_effect=local_storage.ClientError('403', 'Forbidden')):
+            response = self.call('POST', '/uploads/complete', {'file_id': grant['file_id'], 'filename': 'offering.pdf'})
+
+        self.assertEqual(response['statusCode'], 409)
+
+    def test_complete_checks_the_key_the_grant_was_for(self):
+        grant = self.presign('offering.pdf', 'application/pdf')
+        self.put(grant, b'%PDF-1.7 sacred scroll')
+
+        response = self.call('POST', '/uploads/complete', {'file_id': grant['file_id'], 'filename': 'other.pdf'})
+
+        self.assertEqual(response['statusCode'], 409)
+
+    def test_rejects_bad_requests(self):
+        self.assertEqual(self.call('POST', '/uploads/presign', {})['statusCode'], 400)
+        self.assertEqual(self.call('POST', '/uploads/complete', {'file_id': 'x', 'filename': 'a.pdf'})['statusCode'], 400)
+        self.assertEqual(self.call('POST', '/uploads/complete', {'filename': 'a.pdf'})['statusCode'], 400)
+
+    def test_active_declared_types_are_signed_as_binary(self):
+        for filename, declared in (('page.html', 'text/html'), ('icon.svg', 'image/svg+xml'), ('feed.xml', 'text/xml'),
+                                   ('app.js', 'text/javascript'), ('photo.jpg', 'text/html; charset=utf-8')):
+            self.assertEqual(self.presign(filename, declared)['headers']['Content-Type'], 'application/octet-stream')
+        self.assertEqual(self.presign('photo.jpg', 'image/jpeg')['headers']['Content-Type'], 'image/jpeg')
+
+    def test_chunked_uploads_store_only_safe_declared_types(self):
+        for declared, stored in (('text/html', 'application/octet-stream'), ('application/pdf', 'application/pdf')):
+            response = self.call('POST', '/uploads/chunked', {'filename': 'scroll.pdf', 'size': 10, 'content_type': declared})
+            session = json.loads(response['body'])
+            item = handler.table.get_item(Key={'id': session['file_id']})['Item']
+            self.assertEqual(item['content_type'], stored)
@@ -0,0 +1,119 @@
+import base64
+import json
+import types
+import uuid
+
+import aws_clients
+import idempotency
+from tests.local_backend import LocalBackendTestCase, load_handler
+
+handler = load_handler('lambda.py')
+
+
+# What an HTTP client sends for the same form each time: a fresh random boundary
+def form_post(key, data, filename='prasad.txt', description='Morning offering'):
+    boundary = uuid.uuid4().hex
+    body = (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="description"\r\n\r\n{description}\r\n'
+        f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        f'Content-Type: text/plain\r\n\r\n'
+    ).encode('utf-8') + data + f'\r\n--{boundary}--\r\n'.encode('utf-8')
+    return {
+        'rawPath': '/',
+        'requestContext': {'http': {'method': 'POST', 'path': '/', 'sourceIp': '203.0.113.9'}},
+        'headers': {'content-type': f'multipart/form-data; boundary={boundary}', 'idempotency-key': key},
+        'body': base64.b64encode(body).decode('ascii'),
+        'isBase64Encoded': True
+    }
+
+
+def json_post(key, payload):
+    return {
+        'rawPath': '/uploads/presign',
+        'requestContext': {'http': {'method': 'POST', 'path': '/uploads/presign', 'sourceIp': '203.0.113.9'}},
+        'headers': {'content-type': 'application/json', 'idempotency-key': key},
+        'body': json.dumps(payload)
+    }
+
+
+def response(status):
+    return {'statusCode': status, 'headers': {}, 'body': json.dumps({'status': status})}
+
+
+class IdempotencyTest(LocalBackendTestCase):
+    def setUp(self):
+        super().setUp()
+        self.table = aws_clients.Table('posts')
+        self.context = types.SimpleNamespace(aws_request_id=str(uuid.uuid4()), function_name='uploader',
+                                             get_remaining_time_in_millis=lambda: 30000)
+        self.calls = 0
+
+    def run_once(self, event, status=200):
+        def handle():
+            self.calls += 1
+            return response(status)
+        return idempotency.run(self.table, event, self.context, handle)
+
+    def test_retry_of_the_same_form_replays_despite_a_new_boundary(self):
+        data = uuid.uuid4().bytes * 64
+        first = handler.lambda_handler(form_post('retry-1', data), self.context)
+        retry = handler.lambda_handler(form_post('retry-1', data), self.context)
+
+        self.assertEqual((first['statusCode'], retry['statusCode']), (200, 200))
+        self.assertEqual(retry['headers'].get('Idempotent-Replayed'), 'true')
+        self.assertEqual(retry['body'], first['body'])
+        listed = json.loads(handler.lambda_handler(
+            {'rawPath': '/uploads', 'requestContext': {'http': {'method': 'GET', 'path': '/uploads'}}, 'headers': {}},
+            self.context
+        )['body'])['items']
+        self.assertEqual(len(listed), 1)
+
+    def test_same_key_with_another_file_is_unprocessable(self):
+        self.assertEqual(self.run_once(form_post('key-2', b'first file'))['statusCode'], 200)
+
+        self.assertEqual(self.run_once(form_post('key-2', b'second file'))['statusCode'], 422)
+        self.assertEqual(self.run_once(form_post('key-2', b'first file', filename='renamed.txt'))['statusCode'], 422)
+        self.assertEqual(self.calls, 1)
+
+    def test_json_retry_replays(self):
+        first = self.run_once(json_post('key-3', {'filename': 'a.pdf'}))
+        retry = self.run_once(json_post('key-3', {'filename': 'a.pdf'}))
+
+        self.assertEqual(retry['body'], first['body'])
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self.run_once(json_post('key-3', {'filename': 'b.pdf'}))['statusCode'], 422)
+
+    def test_request_still_running_gets_conflict(self):
+        event = json_post('key-4', {'filename': 'a.pdf'})
+        inner = []
+
+        def handle():
+            # The retry arrives while the first request is still inside its handler
+            inner.append(self.run_once(json_post('key-4', {'filename': 'a.pdf'})))
+            return response(200)
+
+        self.assertEqual(idempotency.run(self.table, event, self.context, handle)['statusCode'], 200)
+        self.assertEqual(inner[0]['statusCode'], 409)
+        self.assertEqual(inner[0]['headers']['Retry-After'], '1')
+        self.assertEqual(self.calls, 0)
+
+    def test_server_errors_release_the_key(self):
+        event = json_post('key-5', {'filename': 'a.pdf'})
+        self.assertEqual(self.run_once(event, status=503)['statusCode'], 503)
+        self.assertEqual(self.run_once(event)['statusCode'], 200)
+        self.assertEqual(self.calls, 2)
+
+        def fail():
+            raise RuntimeError('S3 unavailable')
+
+        event = json_post('key-6', {'filename': 'a.pdf'})
+        with self.assertRaises(RuntimeError):
+            idempotency.run(self.table, event, self.context, fail)
+        self.assertEqual(self.run_once(event)['statusCode'], 200)
+
+    def test_requests_without_a_key_always_run(self):
+        event = json_post('key-7', {'filename': 'a.pdf'})
+        del event['headers']['idempotency-key']
+        self.run_once(event)
+        self.run_once(event)
+        self.assertEqual(self.calls, 2)
@@ -0,0 +1,113 @@
+import gzip
+import io
+import uuid
+from unittest import mock
+
+from PIL import Image
+
+import aws_clients
+import image_pipeline
+from tests.local_backend import LocalBackendTestCase
+
+BUCKET = 'test-bucket'
+
+
+def photo(width=2000, height=1500, fmt='JPEG'):
+    out = io.BytesIO()
+    Image.new('RGB', (width, height), (180, 120, 40)).save(out, fmt)
+    return out.getvalue()
+
+
+# Records what process_object asks of S3, so tests can tell whether it downloaded the object
+class CountingS3:
+    def __init__(self, s3):
+        self.s3 = s3
+        self.gets = []
+
+    def get_object(self, **kwargs):
+        self.gets.append(kwargs.get('Range'))
+        return self.s3.get_object(**kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.s3, name)
+
+
+class ProcessObjectTest(LocalBackendTestCase):
+    def setUp(self):
+        super().setUp()
+        self.table = aws_clients.Table('posts')
+        self.client = CountingS3(self.s3)
+
+    def upload(self, name, body, **extra):
+        file_id = str(uuid.uuid4())
+        key = f'uploads/{file_id}_{name}'
+        self.s3.put_object(Bucket=BUCKET, Key=key, Body=body, **extra)
+        self.table.put_item(Item={'id': file_id, 's3_key': key})
+        return file_id, key
+
+    def test_writes_every_variant_and_records_the_keys(self):
+        file_id, key = self.upload('temple.jpg', photo(), ContentType='image/jpeg')
+
+        variants = image_pipeline.process_object(self.client, self.table, BUCKET, key)
+
+        self.assertEqual(set(variants), {name for name, _, _ in image_pipeline.VARIANTS})
+        for name, size, fmt in image_pipeline.VARIANTS:
+            stored = self.s3.get_object(Bucket=BUCKET, Key=variants[name])
+            self.assertEqual(stored['ContentType'], image_pipeline.CONTENT_TYPES[fmt])
+            with Image.open(io.BytesIO(stored['Body'].read())) as image:
+                self.assertEqual(image.format, fmt)
+                self.assertEqual(max(image.size), size)
+        self.assertEqual(self.table.get_item(Key={'id': file_id})['Item']['variants'], variants)
+        # One full download, no sniffing: the stored type already said image
+        self.assertEqual(self.client.gets, [None])
+
+    def test_skips_other_types_without_downloading(self):
+        _, key = self.upload('notes.txt', b'om namah shivaya\n' * 1000, ContentType='text/plain; charset=utf-8')
+
+        self.assertIsNone(image_pipeline.process_object(self.client, self.table, BUCKET, key))
+        self.assertEqual(self.client.gets, [])
+
+    def test_sniffs_generic_types_from_a_ranged_get(self):
+        _, image_key = self.upload('scan', photo(400, 300), ContentType='application/octet-stream')
+        _, archive_key = self.upload('bundle', b'PK\x03\x04' + bytes(50000), ContentType='application/octet-stream')
+
+        self.assertIsNotNone(image_pipeline.process_object(self.client, self.table, BUCKET, image_key))
+        self.assertIsNone(image_pipeline.process_object(self.client, self.table, BUCKET, archive_key))
+        self.assertEqual(self.client.gets, ['bytes=0-511', None, 'bytes=0-511'])
+
+    def test_reads_gzip_encoded_originals(self):
+        _, key = self.upload('old.bmp', gzip.compress(photo(640, 480, 'BMP')),
+                             ContentType='image/bmp', ContentEncoding='gzip')
+
+        variants = image_pipeline.process_object(self.client, self.table, BUCKET, key)
+
+        with Image.open(io.BytesIO(self.s3.get_object(Bucket=BUCKET, Key=variants['w800.jpg'])['Body'].read())) as image:
+            self.assertEqual(image.size, (640, 480))
+
+    def test_never_copies_a_full_size_original(self):
+        _, key = self.upload('mandala.png', photo(3000, 2000, 'PNG'), ContentType='image/png')
+        copied = []
+        copy = Image.Image.copy
+
+        def recording_copy(image):
+            copied.append(image.size)
+            return copy(image)
+
+        with mock.patch.object(Image.Image, 'copy', recording_copy):
+            variants = image_pipeline.process_object(self.client, self.table, BUCKET, key)
+
+        self.assertEqual(len(variants), len(image_pipeline.VARIANTS))
+        largest = max(size for _, size, _ in image_pipeline.VARIANTS)
+        self.assertTrue(copied)
+        self.assertLessEqual(max(max(size) for size in copied), largest)
+
+    def test_lambda_handler_skips_variant_keys(self):
+        _, key = self.upload('shrine photo.jpg', photo(300, 200), ContentType='image/jpeg')
+        records = [
+            {'s3': {'bucket': {'name': BUCKET}, 'object': {'key': key.replace(' ', '+')}}},
+            {'s3': {'bucket': {'name': BUCKET}, 'object': {'key': image_pipeline.variant_key(key, 'thumb.jpg')}}},
+        ]
+
+        processed = image_pipeline.lambda_handler({'Records': records}, None)['processed']
+
+        self.assertEqual([entry['key'] for entry in processed], [key])
@@ -0,0 +1,50 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Presigned GET URLs, kept per container and handed out again while they have
+# enough life left. Signing is local but not free (a canonical request, a
+# HMAC-SHA256 chain and botocore's event hooks on every call).
+MAX_SIZE = int(os.environ.get('URL_CACHE_SIZE', 4096))
+# A cached URL is only reused while at least this many seconds remain
+MIN_REMAINING = int(os.environ.get('URL_CACHE_MIN_REMAINING', 600))
+
+
+class PresignedUrlCache:
+    def __init__(self, max_size=None, min_remaining=None, clock=time.monotonic):
+        self.max_size = MAX_SIZE if max_size is None else max_size
+        self.min_remaining = MIN_REMAINING if min_remaining is None else min_remaining
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    # ``sign`` is only called on a miss; it must return a URL valid for ``expires_in`` seconds
+    def get(self, key, expires_in, sign):
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] - now >= self.min_remaining:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0], int(entry[1] - now)
+            self.misses += 1
+
+        # Signed outside the lock: two threads missing on the same key both sign, which is harmless
+        url = sign()
+        with self._lock:
+            self._entries[key] = (url, now + expires_in)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return url, expires_in
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
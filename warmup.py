@@ -0,0 +1,84 @@
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import aws_clients
+import jobs
+import metrics
+import s3_upload
+
+# Keep-warm pings and provisioned-concurrency start-up. A warm-up event runs the
+# handler's priming steps (open the S3 and DynamoDB connections, render the
+# pages, fill the in-process caches) and reports how long each one took. No
+# step writes anything. Recognised events, none of which can come through the
+# HTTP API:
+#   {"warmup": true}, an EventBridge "Scheduled Event", serverless-plugin-warmup
+ENABLED = os.environ.get('WARMUP_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+# S3 calls made side by side each take their own pooled connection, so parallel
+# part uploads find this many already open
+S3_CONNECTIONS = max(1, int(os.environ.get('WARMUP_S3_CONNECTIONS', s3_upload.CONCURRENCY)))
+# Set by Lambda when the environment is started for provisioned concurrency,
+# ahead of any traffic: the handlers prime at import then
+ON_INIT = os.environ.get('AWS_LAMBDA_INITIALIZATION_TYPE') == 'provisioned-concurrency'
+
+
+def is_warmup(event):
+    if not ENABLED or not isinstance(event, dict) or 'requestContext' in event:
+        return False
+    return (
+        event.get('warmup') is True
+        or event.get('detail-type') == 'Scheduled Event'
+        or event.get('source') == 'serverless-plugin-warmup'
+    )
+
+
+def connect_s3(bucket, connections=None):
+    client = aws_clients.s3()
+    connections = connections or S3_CONNECTIONS
+    with ThreadPoolExecutor(max_workers=connections) as pool:
+        list(pool.map(lambda _: client.head_bucket(Bucket=bucket), range(connections)))
+
+
+def connect_dynamodb(table_name):
+    aws_clients.dynamodb().describe_table(TableName=table_name)
+
+
+def connect_queue():
+    aws_clients.sqs().get_queue_attributes(QueueUrl=jobs.QUEUE_URL, AttributeNames=['QueueArn'])
+
+
+# Runs (name, fn) steps in order; a failing step is reported and the rest still run.
+# Returns {name: {'ms': ...}}, with an 'error' on the steps that failed.
+def run(steps):
+    report = {}
+    for name, step in steps:
+        start = time.perf_counter()
+        error = None
+        try:
+            with metrics.phase('warmup_' + name):
+                step()
+        except Exception as e:
+            error = f'{type(e).__name__}: {e}'
+            metrics.count('warmup_failed')
+        report[name] = {'ms': round((time.perf_counter() - start) * 1000, 3)}
+        if error:
+            report[name]['error'] = error
+    return report
+
+
+def respond(steps):
+    report = run(steps)
+    failed = any('error' in step for step in report.values())
+    return {
+        'statusCode': 207 if failed else 200,
+        'headers': {'Content-Type': 'application/json'},
+        'body': json.dumps({'warmup': True, 'steps': report}, separators=(',', ':'))
+    }
+
+
+# Priming during init, outside any request: the timings go to the log instead
+def prime(steps):
+    line = {'warmup': 'init', 'steps': run(steps)}
+    sys.stdout.write(json.dumps(line, separators=(',', ':')) + '\n')